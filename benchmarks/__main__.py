@@ -0,0 +1,98 @@
+"""
+Run the benchmark suite, and compare the results with an earlier run.
+
+    python -m benchmarks --output results.json
+    python -m benchmarks --compare results.json
+
+When comparing, the exit status is 1 if any benchmark is slower than the
+earlier run by more than the threshold.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import timeit
+
+from .suite import BENCHMARKS
+
+
+def calibrate(timer, minimum=0.2):
+    """
+    How many calls take at least `minimum` seconds?
+
+    Like `Timer.autorange`, which is not available before Python 3.6.
+    """
+    number = 1
+    while timer.timeit(number) < minimum:
+        number *= 2
+    return number
+
+
+def measure(function, repeat):
+    """Time a benchmark, returning the best time per item in microseconds."""
+    run, items = function()
+    timer = timeit.Timer(run)
+    number = calibrate(timer)
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return best / number / items * 1e6
+
+
+def compare(results, baseline, threshold):
+    """Print a comparison with a baseline, and return the regressed names."""
+    regressions = []
+    print('{:<32} {:>12} {:>12} {:>8}'.format(
+        'benchmark', 'before (us)', 'after (us)', 'change'))
+    for name, result in sorted(results.items()):
+        before = baseline.get(name)
+        if before is None:
+            print('{:<32} {:>12} {:>12.3f}'.format(name, '-', result))
+            continue
+        change = (result - before) / before * 100
+        flag = ''
+        if change > threshold:
+            flag = ' SLOWER'
+            regressions.append(name)
+        print('{:<32} {:>12.3f} {:>12.3f} {:>+7.1f}%{}'.format(
+            name, before, result, change, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='compare with results in this JSON file')
+    parser.add_argument('--filter', default='', help='only run matching benchmarks')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument(
+        '--threshold', type=float, default=10,
+        help='percentage slowdown counted as a regression (default: 10)')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, function in sorted(BENCHMARKS.items()):
+        if args.filter in name:
+            results[name] = measure(function, args.repeat)
+            if not args.compare:
+                print('{:<32} {:>10.3f} us/item'.format(name, results[name]))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'unit': 'us/item',
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
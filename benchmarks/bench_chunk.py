@@ -0,0 +1,47 @@
+"""
+How long does it take to split long pastes into PRIVMSGs?
+
+Times `make_privmsgs` on multi-kilobyte and multi-megabyte inputs of mixed
+scripts, with and without line breaks. Run with:
+
+    python -m benchmarks.bench_chunk
+"""
+import itertools
+import timeit
+
+from framewirc.message import make_privmsgs
+
+from .corpus import TEXTS
+
+
+SIZES = (4 * 1024, 64 * 1024, 1024 * 1024, 4 * 1024 * 1024)
+
+
+def make_paste(size, separator):
+    """Make text that is at least `size` bytes when encoded as UTF-8."""
+    parts = []
+    length = 0
+    for text in itertools.cycle(TEXTS):
+        parts.append(text)
+        length += len(text.encode()) + 1
+        if length >= size:
+            return separator.join(parts)
+
+
+def main():
+    print('{:>10} {:>10} {:>10} {:>10}'.format('bytes', 'lines', 'ms', 'MB/s'))
+    for size, separator in itertools.product(SIZES, (' ', '\n')):
+        paste = make_paste(size, separator)
+        number = max(1, (256 * 1024) // size)
+        seconds = timeit.timeit(
+            lambda: make_privmsgs('#channel', paste), number=number) / number
+        print('{:>10} {:>10} {:>10.2f} {:>10.2f}'.format(
+            size,
+            'many' if separator == '\n' else 'one',
+            seconds * 1000,
+            size / seconds / 1e6,
+        ))
+
+
+if __name__ == '__main__':
+    main()
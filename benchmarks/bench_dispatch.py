@@ -0,0 +1,61 @@
+"""
+How does the cost of dispatching a message grow with the number of handlers?
+
+Compares calling every handler (as `Client.on_message` used to) with looking
+the handlers up in a `DispatchTable`. Run with:
+
+    python -m benchmarks.bench_dispatch
+"""
+import timeit
+
+from framewirc import filters
+from framewirc.client import Client
+from framewirc.dispatch import DispatchTable
+from framewirc.message import ReceivedMessage
+
+
+HANDLER_COUNTS = (1, 10, 50, 100, 250)
+COMMANDS = ('PRIVMSG', 'JOIN', 'PART', 'QUIT', 'NOTICE', 'PING', 'MODE', '353')
+
+
+def make_handlers(count):
+    """One filtered, do-nothing handler per command in turn."""
+    def handler(client, message):
+        pass
+    return [filters.allow('CMD{}'.format(i))(handler) for i in range(count)]
+
+
+def make_messages():
+    return [ReceivedMessage('{} #channel :text\r\n'.format(c).encode()) for c in COMMANDS]
+
+
+def call_all(client, handlers, messages):
+    for message in messages:
+        for handler in handlers:
+            handler(client, message)
+
+
+def call_indexed(client, table, messages):
+    for message in messages:
+        for handler in table.handlers_for(message.command):
+            handler(client, message)
+
+
+def main(number=2000):
+    client = Client(handlers=[], nick='bench', real_name='bench')
+    messages = make_messages()
+    print('{:>9} {:>14} {:>17}'.format('handlers', 'all (us/msg)', 'indexed (us/msg)'))
+    for count in HANDLER_COUNTS:
+        handlers = make_handlers(count)
+        table = DispatchTable(handlers)
+        per_message = 1e6 / (number * len(messages))
+        linear = timeit.timeit(
+            lambda: call_all(client, handlers, messages), number=number)
+        indexed = timeit.timeit(
+            lambda: call_indexed(client, table, messages), number=number)
+        print('{:>9} {:>14.3f} {:>17.3f}'.format(
+            count, linear * per_message, indexed * per_message))
+
+
+if __name__ == '__main__':
+    main()
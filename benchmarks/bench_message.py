@@ -0,0 +1,41 @@
+"""
+Compare eager and lazy parsing of received messages on mixed traffic.
+
+Two consumers are measured: one that only reads `command` (like filters and
+the PING handler), and one that reads every part of every message. Run with:
+
+    python -m benchmarks.bench_message
+"""
+import timeit
+
+from framewirc.message import LazyReceivedMessage, ReceivedMessage
+
+from .corpus import make_corpus
+
+
+def read_command(message_class, lines):
+    for line in lines:
+        message_class(line).command
+
+
+def read_everything(message_class, lines):
+    for line in lines:
+        message = message_class(line)
+        message.command, message.prefix, message.params, message.suffix
+
+
+def main(number=10):
+    lines = make_corpus()
+    per_line = 1e6 / (number * len(lines))
+    print('{:>20} {:>15} {:>15}'.format('consumer', 'eager (us/line)', 'lazy (us/line)'))
+    for consumer in (read_command, read_everything):
+        eager = timeit.timeit(
+            lambda: consumer(ReceivedMessage, lines), number=number)
+        lazy = timeit.timeit(
+            lambda: consumer(LazyReceivedMessage, lines), number=number)
+        print('{:>20} {:>15.3f} {:>15.3f}'.format(
+            consumer.__name__, eager * per_line, lazy * per_line))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+How much does skipping re-validation save when sending in bulk?
+
+Sends the output of `make_privmsgs` for a long paste, once as the validated
+messages it returns and once as plain bytes. Run with:
+
+    python -m benchmarks.bench_send
+"""
+import timeit
+
+from framewirc.connection import Connection
+from framewirc.message import make_privmsgs
+
+from .corpus import TEXTS
+
+
+class NullTransport:
+    def get_write_buffer_size(self):
+        return 0
+
+
+class NullWriter:
+    """Accepts writes, and throws them away."""
+    transport = NullTransport()
+
+    def write(self, data):
+        pass
+
+    def writelines(self, data):
+        pass
+
+
+def main(number=2000):
+    connection = Connection(client=None, host='irc.example.com')
+    connection.writer = NullWriter()
+    validated = make_privmsgs('#channel', '\n'.join(TEXTS * 20))
+    plain = [bytes(message) for message in validated]
+
+    per_message = 1e6 / (number * len(validated))
+    print('{:>10} {:>12}'.format('type', 'us/message'))
+    for name, messages in (('validated', validated), ('bytes', plain)):
+        seconds = timeit.timeit(lambda: connection.send_batch(messages), number=number)
+        print('{:>10} {:>12.3f}'.format(name, seconds * per_message))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""A synthetic, but realistic, mix of IRC traffic for the benchmarks."""
+import random
+from bisect import bisect
+
+
+NICKS = ['nick{}'.format(i) for i in range(500)] + ['Zoë', 'Ōkubo', 'Дмитрий']
+CHANNELS = ['#python', '#framewirc', '#chat', '#ops', '#общий']
+TEXTS = [
+    'hello everyone',
+    'has anyone seen https://example.com/some/long/path?with=query yet?',
+    'lol',
+    'Ça marche très bien, merci beaucoup !',
+    '失敗を繰り返すことで、成功に至る。',
+    '\1ACTION waves\1',
+    'a somewhat longer message that goes on for a while, as people do ' * 3,
+]
+
+
+def _prefix(rng):
+    nick = rng.choice(NICKS)
+    return '{0}!~{0}@host-{1}.example.com'.format(nick, rng.randrange(1000))
+
+
+def _privmsg(rng):
+    return ':{} PRIVMSG {} :{}'.format(
+        _prefix(rng), rng.choice(CHANNELS), rng.choice(TEXTS))
+
+
+def _notice(rng):
+    return ':{} NOTICE {} :{}'.format(
+        _prefix(rng), rng.choice(NICKS), rng.choice(TEXTS))
+
+
+def _join(rng):
+    return ':{} JOIN {}'.format(_prefix(rng), rng.choice(CHANNELS))
+
+
+def _part(rng):
+    return ':{} PART {} :Leaving'.format(_prefix(rng), rng.choice(CHANNELS))
+
+
+def _quit(rng):
+    return ':{} QUIT :Quit: irc.example.com irc2.example.com'.format(_prefix(rng))
+
+
+def _nick(rng):
+    return ':{} NICK {}'.format(_prefix(rng), rng.choice(NICKS) + '_')
+
+
+def _mode(rng):
+    return ':{} MODE {} +o {}'.format(
+        _prefix(rng), rng.choice(CHANNELS), rng.choice(NICKS))
+
+
+def _ping(rng):
+    return 'PING :irc.example.com'
+
+
+def _names(rng):
+    names = ' '.join(rng.sample(NICKS, 40))
+    return ':irc.example.com 353 bot = {} :{}'.format(rng.choice(CHANNELS), names)
+
+
+# (weight, line maker) pairs, roughly matching a busy network.
+TRAFFIC = (
+    (60, _privmsg),
+    (5, _notice),
+    (8, _join),
+    (6, _part),
+    (6, _quit),
+    (3, _nick),
+    (4, _mode),
+    (2, _ping),
+    (6, _names),
+)
+
+
+def make_corpus(size=10000, seed=0):
+    """Make a list of `size` raw lines, as received from the network."""
+    rng = random.Random(seed)
+    cumulative = []
+    total = 0
+    for weight, _ in TRAFFIC:
+        total += weight
+        cumulative.append(total)
+    # A weighted pick of every line's maker up front, as `Random.choices` does
+    # (which is not available before Python 3.6).
+    picks = [bisect(cumulative, rng.random() * total) for _ in range(size)]
+    lines = []
+    for pick in picks:
+        lines.append(TRAFFIC[pick][1](rng).encode() + b'\r\n')
+    return lines
@@ -0,0 +1,148 @@
+"""
+A stand-in IRC server that floods a connected client with traffic.
+
+After the client registers (NICK and USER), the server sends lines at a
+configurable rate and burst size. Every `probe_every` lines, it sends a probe
+PRIVMSG, and times how long the client takes to reply to it. When all of the
+lines have been sent and the probes answered (or `timeout` has passed), the
+server closes the connection and reports its results.
+"""
+import asyncio
+import ssl
+import time
+
+from .corpus import make_corpus
+
+
+PROBE = b':probe!probe@load.test PRIVMSG #loadtest :probe '
+
+
+def percentile(values, percent):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(len(values) * percent / 100))
+    return values[index]
+
+
+class FakeServer:
+    def __init__(
+            self,
+            lines=None,
+            total=100000,
+            rate=None,
+            burst=100,
+            probe_every=100,
+            timeout=10,
+            ssl=None):
+        # Lines to replay, in a loop. Defaults to the synthetic corpus.
+        self.lines = lines or make_corpus()
+        self.total = total
+        self.rate = rate  # Lines per second, or None for as fast as possible.
+        self.burst = burst  # Lines written together.
+        self.probe_every = probe_every
+        self.timeout = timeout
+        self.ssl = ssl
+        self.probes = {}  # id: time sent
+        self.latencies = []
+        self.done = asyncio.Future()
+
+    @asyncio.coroutine
+    def start(self, host='127.0.0.1', port=0):
+        """Start listening. Returns the port."""
+        self.server = yield from asyncio.start_server(
+            self.handle_client, host, port, ssl=self.ssl)
+        return self.server.sockets[0].getsockname()[1]
+
+    @asyncio.coroutine
+    def handle_client(self, reader, writer):
+        registered = set()
+        while registered != {b'NICK', b'USER'}:
+            line = yield from reader.readline()
+            if not line:
+                return
+            registered.add(line.split(None, 1)[0])
+        writer.write(b':load.test 001 bot :Welcome to the load test\r\n')
+
+        reading = asyncio.Task(self.read_replies(reader))
+        started = time.monotonic()
+        yield from self.send_traffic(writer)
+        sent = time.monotonic()
+        try:
+            yield from asyncio.wait_for(reading, self.timeout)
+        except asyncio.TimeoutError:
+            pass
+        writer.close()
+
+        self.done.set_result({
+            'lines': self.total,
+            'send_seconds': sent - started,
+            'lines_per_second': self.total / (sent - started),
+            'probes': len(self.latencies) + len(self.probes),
+            'unanswered': len(self.probes),
+            'latency_p50': percentile(self.latencies, 50),
+            'latency_p90': percentile(self.latencies, 90),
+            'latency_p99': percentile(self.latencies, 99),
+            'latency_max': max(self.latencies, default=None),
+        })
+
+    @asyncio.coroutine
+    def send_traffic(self, writer):
+        """Send `total` lines in bursts, at `rate` lines per second."""
+        lines = self.lines
+        interval = self.burst / self.rate if self.rate else 0
+        next_burst = time.monotonic()
+        for start in range(0, self.total, self.burst):
+            batch = []
+            for i in range(start, min(start + self.burst, self.total)):
+                if i % self.probe_every == 0:
+                    self.probes[i] = time.monotonic()
+                    batch.append(PROBE + str(i).encode() + b'\r\n')
+                else:
+                    batch.append(lines[i % len(lines)])
+            writer.writelines(batch)
+            yield from writer.drain()
+
+            if interval:
+                next_burst += interval
+                yield from asyncio.sleep(max(0, next_burst - time.monotonic()))
+            else:
+                # Let other tasks (eg: reading replies) have a go.
+                yield from asyncio.sleep(0)
+
+    @asyncio.coroutine
+    def read_replies(self, reader):
+        """Time replies to probes, until every probe has been answered."""
+        while True:
+            line = yield from reader.readline()
+            if not line:
+                return
+            if b' :pong ' not in line:
+                continue
+            probe = int(line.rsplit(b' ', 1)[1])
+            sent = self.probes.pop(probe, None)
+            if sent is not None:
+                self.latencies.append(time.monotonic() - sent)
+            if not self.probes and len(self.latencies) * self.probe_every >= self.total:
+                return
+
+
+def serve(conn, replay=None, certfile=None, keyfile=None, **kwargs):
+    """Run a FakeServer in this process, sending the port and results to conn."""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    context = None
+    if certfile:
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(certfile, keyfile)
+
+    lines = None
+    if replay:
+        with open(replay, 'rb') as f:
+            lines = [line.rstrip(b'\r\n') + b'\r\n' for line in f if line.strip()]
+
+    server = FakeServer(lines=lines, ssl=context, **kwargs)
+    conn.send(loop.run_until_complete(server.start()))
+    conn.send(loop.run_until_complete(server.done))
+    loop.close()
@@ -0,0 +1,118 @@
+"""
+Drive a real Client and Connection with a fake IRC server over TCP.
+
+The server runs in its own process, and floods the client with traffic. The
+client replies to the server's probes, so the server can measure the time from
+sending a line to receiving the reply. Run with, eg:
+
+    python -m benchmarks.loadtest --total 200000 --burst 500
+    python -m benchmarks.loadtest --rate 5000 --connection buffered
+    python -m benchmarks.loadtest --certfile cert.pem --keyfile key.pem
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import ssl
+import time
+
+from framewirc import commands, filters, parsers
+from framewirc.client import Client
+from framewirc.connection import BufferedConnection, Connection
+from framewirc.handlers import basic_handlers
+
+from .fakeserver import serve
+
+
+CONNECTIONS = {'stream': Connection, 'buffered': BufferedConnection}
+
+
+@filters.allow(commands.PRIVMSG)
+@parsers.apply_message_parser(parsers.privmsg)
+def reply_to_probe(client, message, channel, raw_body, **kwargs):
+    if raw_body.startswith(b'probe '):
+        client.privmsg(channel, 'pong ' + raw_body[6:].decode())
+
+
+class LoadTestClient(Client):
+    nick = 'bot'
+    real_name = 'framewirc load test'
+
+    def __init__(self, **kwargs):
+        self.received = 0
+        self.first_received = self.last_received = None
+        self.handlers = basic_handlers + (self.count, reply_to_probe)
+        super().__init__(**kwargs)
+
+    def count(self, client, message):
+        self.last_received = time.monotonic()
+        if self.first_received is None:
+            self.first_received = self.last_received
+        self.received += 1
+
+
+def run(args):
+    server_conn, conn = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=serve, args=(server_conn,), kwargs={
+        'total': args.total,
+        'rate': args.rate,
+        'burst': args.burst,
+        'probe_every': args.probe_every,
+        'replay': args.replay,
+        'certfile': args.certfile,
+        'keyfile': args.keyfile,
+    })
+    server.daemon = True
+    server.start()
+    port = conn.recv()
+
+    context = False
+    if args.certfile:
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    client = LoadTestClient(connection_class=CONNECTIONS[args.connection])
+    try:
+        loop.run_until_complete(client.connect_to('127.0.0.1', port=port, ssl=context))
+    except ConnectionError:
+        pass  # The server hung up while we were still replying: the test is over.
+    loop.close()
+
+    results = conn.recv()
+    server.join()
+
+    elapsed = client.last_received - client.first_received
+    results['connection'] = args.connection
+    results['client_lines'] = client.received
+    results['client_lines_per_second'] = client.received / elapsed if elapsed else None
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--total', type=int, default=100000, help='lines to send')
+    parser.add_argument('--rate', type=float, help='lines per second (default: flat out)')
+    parser.add_argument('--burst', type=int, default=100, help='lines per write')
+    parser.add_argument('--probe-every', type=int, default=100)
+    parser.add_argument('--replay', help='replay lines from this file')
+    parser.add_argument('--connection', choices=sorted(CONNECTIONS), default='stream')
+    parser.add_argument('--certfile', help='serve TLS with this certificate')
+    parser.add_argument('--keyfile')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+        return
+    for key, value in sorted(results.items()):
+        if isinstance(value, float):
+            value = '{:.6f}'.format(value)
+        print('{:<24} {}'.format(key, value))
+
+
+if __name__ == '__main__':
+    main()
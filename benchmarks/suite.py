@@ -0,0 +1,161 @@
+"""
+The benchmarks of framewirc's hot paths.
+
+Each benchmark is a function that sets up its data, and returns a callable to
+be timed along with the number of items (messages, lines...) that one call
+handles. Results are reported per item.
+"""
+from framewirc import commands, filters, parsers
+from framewirc.client import Client
+from framewirc.handlers import basic_handlers
+from framewirc.message import (
+    build_message,
+    LazyReceivedMessage,
+    make_privmsgs,
+    MessageTemplate,
+    ReceivedMessage,
+)
+from framewirc.utils import chunk_message, to_unicode
+
+from .corpus import make_corpus, TEXTS
+
+
+BENCHMARKS = {}
+
+
+def benchmark(function):
+    """Register a benchmark under the name of its function."""
+    BENCHMARKS[function.__name__] = function
+    return function
+
+
+def _messages(message_class=ReceivedMessage):
+    return [message_class(line) for line in make_corpus()]
+
+
+@benchmark
+def parse_received_message():
+    lines = make_corpus()
+
+    def run():
+        for line in lines:
+            ReceivedMessage(line)
+    return run, len(lines)
+
+
+@benchmark
+def parse_lazy_message_command():
+    lines = make_corpus()
+
+    def run():
+        for line in lines:
+            LazyReceivedMessage(line).command
+    return run, len(lines)
+
+
+@benchmark
+def build_privmsg():
+    texts = TEXTS
+
+    def run():
+        for text in texts:
+            build_message(commands.PRIVMSG, '#channel', suffix=text)
+    return run, len(texts)
+
+
+@benchmark
+def template_privmsg():
+    texts = TEXTS
+    template = MessageTemplate(commands.PRIVMSG, '#channel')
+
+    def run():
+        for text in texts:
+            template(text)
+    return run, len(texts)
+
+
+@benchmark
+def make_privmsgs_paste():
+    paste = '\n'.join(TEXTS * 10)
+    count = len(make_privmsgs('#channel', paste))
+
+    def run():
+        make_privmsgs('#channel', paste)
+    return run, count
+
+
+@benchmark
+def chunk_message_long_line():
+    paste = ' '.join(TEXTS * 100)
+    count = len(chunk_message(paste, max_length=495))
+
+    def run():
+        chunk_message(paste, max_length=495)
+    return run, count
+
+
+@benchmark
+def to_unicode_utf8():
+    suffixes = [m.suffix for m in _messages() if m.suffix]
+
+    def run():
+        for suffix in suffixes:
+            to_unicode(suffix)
+    return run, len(suffixes)
+
+
+@benchmark
+def to_unicode_chardet_fallback():
+    suffixes = [text.encode('cp1251') for text in ('Привет всем', 'Как дела?')] * 50
+
+    def run():
+        for suffix in suffixes:
+            to_unicode(suffix)
+    return run, len(suffixes)
+
+
+@benchmark
+def parse_nick():
+    prefixes = [m.prefix for m in _messages() if '!' in m.prefix]
+
+    def run():
+        for prefix in prefixes:
+            parsers.nick(prefix)
+    return run, len(prefixes)
+
+
+@benchmark
+def parse_privmsg():
+    messages = [m for m in _messages() if m.command == commands.PRIVMSG]
+
+    def run():
+        for message in messages:
+            parsers.privmsg(message)
+    return run, len(messages)
+
+
+def _bot_handlers():
+    """A realistic stack: the basics, some commands, and a few listeners."""
+    def noop(client, **kwargs):
+        pass
+
+    handlers = list(basic_handlers)
+    for trigger in ('!help', '!seen', '!weather', '!title', '!quote'):
+        handlers.append(
+            filters.allow(commands.PRIVMSG)(
+                parsers.apply_message_parser(parsers.privmsg)(noop)))
+    for command in (commands.JOIN, commands.PART, commands.QUIT, commands.NICK):
+        handlers.append(filters.allow(command)(noop))
+    handlers.append(filters.deny(commands.PING)(noop))
+    return handlers
+
+
+@benchmark
+def client_on_message():
+    client = Client(handlers=_bot_handlers(), nick='bench', real_name='bench')
+    messages = [m for m in _messages() if m.command != commands.PING]
+
+    def run():
+        for message in messages:
+            client.on_message(message)
+    return run, len(messages)
@@ -0,0 +1,120 @@
+"""
+IRCv3 batches: https://ircv3.net/specs/extensions/batch
+
+Servers that have been sent `CAP REQ :batch` (see `Client.capabilities`)
+may group related lines (eg: the QUITs of a netsplit, or chat history) into a
+batch. The lines are collected, and when the batch ends it is passed to each
+of the Client's `batch_handlers`:
+
+    def on_netsplit(client, batch):
+        if batch.type == 'netsplit':
+            ...
+
+    class MyClient(Client):
+        batch_handlers = [on_netsplit]
+
+Lines in a batch are not passed to the usual handlers, unless they are
+decorated with `per_line`.
+"""
+from . import commands
+from .utils import to_unicode
+
+
+class Batch:
+    """
+    The lines sent by a server between `BATCH +reference` and `BATCH -reference`.
+
+    `messages` are the lines in the batch, in the order they arrived. Batches
+    inside this one are in `batches`, and are only passed to batch handlers as
+    part of this one.
+    """
+    def __init__(self, reference, type, params=(), parent=None, connection=None):
+        self.reference = reference
+        self.type = type
+        self.params = params
+        self.parent = parent
+        self.connection = connection
+        self.messages = []
+        self.batches = []
+
+    def __repr__(self):
+        return '<Batch {} {}>'.format(self.type, self.reference)
+
+    def __iter__(self):
+        """Every line in this batch, and in the batches inside it."""
+        yield from self.messages
+        for batch in self.batches:
+            yield from batch
+
+
+def per_line(handler):
+    """
+    Decorates a handler to also be passed each line of a batch as it arrives.
+
+    The line's Batch is set as `message.batch`.
+    """
+    handler.per_line = True
+    return handler
+
+
+def _batch_tag(message):
+    """The reference of the batch that a message is in, if any."""
+    # Avoid parsing the tags of the many messages that aren't in a batch.
+    if b'batch=' not in message.raw_tags:
+        return None
+    return message.tags.get('batch')
+
+
+class BatchCollector:
+    """Collects the lines of the batches open on a Connection."""
+    def __init__(self, connection=None):
+        self.connection = connection
+        self.open = {}
+
+    def clear(self):
+        self.open.clear()
+
+    def collect(self, message, client):
+        """
+        Add the message to its batch, if it is in one.
+
+        Returns True if the message has been dealt with, and so should not be
+        passed to the usual handlers.
+        """
+        if message.command == commands.BATCH:
+            return self._batch_command(message, client)
+
+        batch = self.open.get(_batch_tag(message))
+        if batch is None:
+            return False
+        message.batch = batch
+        batch.messages.append(message)
+        client.on_batch_line(message)
+        return True
+
+    def _batch_command(self, message, client):
+        reference = message.params[0] if message.params else ''
+        if reference[:1] == '+':
+            params = message.params[2:]
+            if message.suffix:
+                params += (to_unicode(message.suffix),)
+            parent = self.open.get(_batch_tag(message))
+            batch = Batch(
+                reference=reference[1:],
+                type=message.params[1] if len(message.params) > 1 else '',
+                params=params,
+                parent=parent,
+                connection=self.connection,
+            )
+            if parent is not None:
+                parent.batches.append(batch)
+            self.open[batch.reference] = batch
+            return True
+
+        if reference[:1] == '-':
+            batch = self.open.pop(reference[1:], None)
+            if batch is not None and batch.parent is None:
+                client.on_batch(batch)
+            return True
+
+        return False
@@ -1,37 +1,255 @@
 import asyncio
+import logging
 
 from . import commands
+from . import metrics
 from . import utils
 from .connection import Connection
+from .dispatch import DispatchTable
 from .message import build_message, make_privmsgs
 
 
+logger = logging.getLogger(__name__)
+
+
 class Client(utils.RequiredAttributesMixin):
-    """Handle events from Connection and offer methods for sending data."""
+    """
+    Handle events from Connection and offer methods for sending data.
+
+    A Client can be connected to any number of networks (or servers) at once
+    by calling `connect_to` for each. They all share the same handlers. All of
+    the connections are kept in `connections`, and `connection` is the one
+    that the message currently being handled came from, so replies are sent
+    back to the right network.
+
+    Handlers may be coroutines. They are run as tasks, so that they do not
+    hold up other messages, with at most `max_concurrent_handlers` running at
+    once. They are cancelled after `handler_timeout` seconds (see also
+    `concurrency.timeout`), and calls to handlers decorated with
+    `concurrency.ordered` are run one at a time. As other messages may be
+    handled while they wait, coroutine handlers on more than one network
+    should pass `connection=message.connection` when replying.
+
+    The `capabilities` (eg: 'batch') are requested from each network with `CAP
+    REQ` when connecting, unless the connection has its own `capabilities`.
+    Batches of lines (see `batch`) are passed to the `batch_handlers` as a
+    whole.
+
+    Each network is asked for `nick`, unless the connection has its own
+    `nick`. Our nick on each network is then kept as `connection.nick`, as it
+    may differ between them (see `current_nick`).
+
+    When `metrics.sink` is enabled, the number of calls to each handler and
+    the time they take are reported to it. Set `profiler` to a
+    `profiling.Profiler` to find handlers that are slow or hold up the loop.
+    """
+    batch_handlers = ()
+    capabilities = ()
     connection_class = Connection
+    handler_timeout = None
+    max_concurrent_handlers = 100
+    profiler = None
     required_attributes = ('handlers', 'real_name', 'nick')
 
+    def __init__(self, **kwargs):
+        self.connections = []
+        self.handler_tasks = set()
+        self._handler_locks = {}
+        self._handler_names = {}
+        self._handler_semaphore = None
+        super().__init__(**kwargs)
+
     def connect_to(self, host, **kwargs):
         """Create a Connection. Handled in the event loop."""
         self.connection = self.connection_class(client=self, host=host, **kwargs)
+        self.connections.append(self.connection)
         return asyncio.Task(self.connection.connect())
 
     def on_connect(self):
         """We're connected! Send our identity to the network!"""
-        nick = self.nick
+        nick = self.current_nick()
+        capabilities = self.connection.capabilities
+        if capabilities is None:
+            capabilities = self.capabilities
+        if capabilities:
+            self.connection.send(
+                build_message(commands.CAP, 'REQ', suffix=' '.join(capabilities)))
         msg = build_message(commands.USER, nick, '0 *', suffix=self.real_name)
         self.connection.send(msg)
         self.set_nick(nick)
+        if capabilities:
+            self.connection.send(build_message(commands.CAP, 'END'))
+
+    @property
+    def dispatch_table(self):
+        """
+        The handlers, indexed by the commands that they accept.
+
+        The index is rebuilt when `handlers` is replaced. If the `handlers`
+        list is changed in place, call `reindex_handlers`.
+        """
+        table = self.__dict__.get('_dispatch_table')
+        if table is None or table.handlers is not self.handlers:
+            table = self.reindex_handlers()
+        return table
+
+    def reindex_handlers(self):
+        """Rebuild the dispatch table from the current handlers."""
+        self._dispatch_table = DispatchTable(self.handlers)
+        return self._dispatch_table
 
     def on_message(self, message):
-        """Get a message from IRC and send it to all handlers."""
-        for handler in self.handlers:
-            handler(self, message)
+        """Get a message from IRC and send it to the handlers that accept it."""
+        # Replies should go back to the network the message came from.
+        connection = getattr(message, 'connection', None)
+        if connection is not None:
+            self.connection = connection
+
+        handlers = self.dispatch_table.handlers_for(message.command)
+        if metrics.sink.enabled or self.profiler is not None:
+            self._measured_dispatch(handlers, message)
+            return
+
+        for handler in handlers:
+            result = handler(self, message)
+            if asyncio.iscoroutine(result):
+                self._schedule(handler, result)
+
+    def on_batch(self, batch):
+        """Send a finished IRCv3 batch to the `batch_handlers`."""
+        if batch.connection is not None:
+            self.connection = batch.connection
+        for handler in self.batch_handlers:
+            result = handler(self, batch)
+            if asyncio.iscoroutine(result):
+                self._schedule(handler, result)
+
+    def on_batch_line(self, message):
+        """Send a line of an unfinished batch to the `batch.per_line` handlers."""
+        self.connection = message.connection
+        for handler in self.dispatch_table.handlers_for(message.command):
+            if getattr(handler, 'per_line', False) is True:
+                result = handler(self, message)
+                if asyncio.iscoroutine(result):
+                    self._schedule(handler, result)
+
+    def _measured_dispatch(self, handlers, message):
+        """Call the handlers, reporting their times to metrics and the profiler."""
+        sink = metrics.sink
+        profiler = self.profiler
+        for handler in handlers:
+            start = metrics.clock()
+            result = handler(self, message)
+            elapsed = metrics.clock() - start
+            name = self._handler_name(handler)
+            if sink.enabled:
+                labels = (('handler', name),)
+                sink.increment('framewirc_handler_calls_total', labels=labels)
+                sink.observe('framewirc_handler_seconds', elapsed, labels)
+            if profiler is not None:
+                profiler.record(name, elapsed)
+            if asyncio.iscoroutine(result):
+                self._schedule(handler, result)
+
+    def _handler_name(self, handler):
+        try:
+            return self._handler_names[handler]
+        except KeyError:
+            name = self._handler_names[handler] = metrics.handler_name(handler)
+            return name
+
+    def _schedule(self, handler, coroutine):
+        """Run a coroutine handler's work as a task."""
+        task = asyncio.Task(self._run_handler(handler, coroutine))
+        self.handler_tasks.add(task)
+        task.add_done_callback(self.handler_tasks.discard)
+
+    @asyncio.coroutine
+    def _run_handler(self, handler, coroutine):
+        """Run a coroutine, with the limits that apply to the handler."""
+        if self._handler_semaphore is None:
+            self._handler_semaphore = asyncio.Semaphore(self.max_concurrent_handlers)
+        held = []
+        started = False
+        try:
+            if getattr(handler, 'ordered', False) is True:
+                lock = self._handler_locks.setdefault(handler, asyncio.Lock())
+                yield from lock.acquire()
+                held.append(lock)
+            yield from self._handler_semaphore.acquire()
+            held.append(self._handler_semaphore)
+            started = True
+            yield from self._await_handler(handler, coroutine)
+        finally:
+            for primitive in reversed(held):
+                primitive.release()
+            if not started:
+                # Cancelled while waiting for its turn.
+                coroutine.close()
+
+    @asyncio.coroutine
+    def _await_handler(self, handler, coroutine):
+        """Wait for a coroutine handler, logging any timeout or exception."""
+        timeout = getattr(handler, 'timeout', self.handler_timeout)
+        if not isinstance(timeout, (int, float)):
+            timeout = self.handler_timeout
+        start = metrics.clock()
+        try:
+            yield from asyncio.wait_for(coroutine, timeout)
+        except asyncio.TimeoutError:
+            logger.warning('Handler %r timed out after %s seconds.', handler, timeout)
+        except Exception:
+            logger.exception('Handler %r raised an exception.', handler)
+        finally:
+            if metrics.sink.enabled:
+                metrics.sink.observe(
+                    'framewirc_handler_task_seconds',
+                    metrics.clock() - start,
+                    (('handler', self._handler_name(handler)),),
+                )
+
+    def privmsg(self, target, message, connection=None):
+        """Send a message to a user or channel (by default, on `connection`)."""
+        connection = connection or self.connection
+        connection.send_batch(
+            make_privmsgs(target, message, connection.isupport.linelen))
+
+    def broadcast(self, targets, message, connection=None):
+        """
+        Send the same message to many users or channels.
+
+        Targets are packed into each PRIVMSG until either the server's limit
+        (see `ISupport.max_targets`) is reached, or the next target would leave
+        too little of the line for the message itself.
+        """
+        connection = connection or self.connection
+        isupport = connection.isupport
+        linelen = isupport.linelen
+        per_message = isupport.max_targets(commands.PRIVMSG)
+        # Leave room for "PRIVMSG  :", the line ending, and (up to half of the
+        # line) the message, so that it isn't split into many tiny lines.
+        suffix = min(len(utils.to_bytes(message)), linelen // 2)
+        room = linelen - len(b'PRIVMSG  :\r\n') - suffix
+
+        messages = []
+        batch = []
+        for target in targets:
+            full = len(batch) == per_message
+            if batch and (full or len(','.join(batch + [target]).encode()) > room):
+                messages.extend(make_privmsgs(','.join(batch), message, linelen))
+                batch = []
+            batch.append(target)
+        if batch:
+            messages.extend(make_privmsgs(','.join(batch), message, linelen))
+        connection.send_batch(messages)
 
-    def privmsg(self, target, message):
-        self.connection.send_batch(make_privmsgs(target, message))
+    def current_nick(self, connection=None):
+        """Our nick on a network (by default, that of `connection`)."""
+        connection = connection or self.connection
+        return connection.nick or self.nick
 
-    def set_nick(self, new_nick):
-        """Set a nick on the network."""
-        self.connection.send(build_message(commands.NICK, new_nick))
-        self.nick = new_nick
+    def set_nick(self, new_nick, connection=None):
+        """Set a nick on the network (by default, that of `connection`)."""
+        connection = connection or self.connection
+        connection.send(build_message(commands.NICK, new_nick))
+        connection.nick = new_nick
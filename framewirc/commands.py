@@ -56,6 +56,10 @@ USERS = 'USERS'
 USERHOST = 'USERHOST'
 ISON = 'ISON'  # "Is on"
 
+# IRCv3 extensions
+BATCH = 'BATCH'
+CAP = 'CAP'
+
 ###########
 # REPLIES #
 ###########
@@ -69,6 +73,9 @@ RPL_MYINFO = '004'
 # Sent by the server to suggest an alternative server when full or refused.
 RPL_BOUNCE = '005'
 
+# Modern servers use 005 to list the features that they support instead.
+RPL_ISUPPORT = '005'
+
 # Reply to the USERHOST command.
 RPL_USERHOST = '302'
 
@@ -0,0 +1,134 @@
+import asyncio
+import importlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import wraps
+
+from . import exceptions
+
+
+# Handlers run by `in_executor` in other processes, so that the workers can
+# find them by name.
+_offloaded = {}
+
+
+def ordered(handler):
+    """
+    Decorates a coroutine handler so that its calls run one at a time.
+
+    Calls run in the order that their messages arrived, rather than all at
+    once:
+
+        @ordered
+        @allow(PRIVMSG)
+        @asyncio.coroutine
+        def log_to_database(client, message):
+            yield from database.insert(message)
+    """
+    handler.ordered = True
+    return handler
+
+
+def timeout(seconds):
+    """
+    Decorates a coroutine handler to give up after `seconds`.
+
+    This overrides `Client.handler_timeout`:
+
+        @timeout(5)
+        @allow(PRIVMSG)
+        @asyncio.coroutine
+        def fetch_url_title(client, message):
+            ...
+    """
+    def inner_decorator(handler):
+        handler.timeout = seconds
+        return handler
+    return inner_decorator
+
+
+class Replies:
+    """
+    Stands in for the Client in handlers run by `in_executor`.
+
+    Messages sent with `privmsg` are recorded, and sent by the real Client
+    once the handler has finished.
+    """
+    def __init__(self, nick):
+        self.nick = nick
+        self.replies = []
+
+    def privmsg(self, target, message):
+        self.replies.append((target, message))
+
+
+def _register(handler):
+    """Make `handler` findable by name in worker processes."""
+    key = (handler.__module__, handler.__qualname__)
+    if _offloaded.setdefault(key, handler) is not handler:
+        raise exceptions.DuplicateHandlerName(key)
+    return key
+
+
+def _run_offloaded(handler, nick, message_class, raw_message, kwargs):
+    """Call an offloaded handler (in the executor), returning its replies."""
+    client = Replies(nick)
+    handler(client=client, message=message_class(raw_message), **kwargs)
+    return client.replies
+
+
+def _run_registered(key, *args):
+    """Call an offloaded handler by name (in another process)."""
+    if key not in _offloaded:
+        # A fresh worker process: importing the module registers the handler.
+        importlib.import_module(key[0])
+    return _run_offloaded(_offloaded[key], *args)
+
+
+@asyncio.coroutine
+def _offload(executor, run, offloaded, client, message, kwargs):
+    connection = getattr(message, 'connection', None)
+    loop = asyncio.get_event_loop()
+    replies = yield from loop.run_in_executor(
+        executor,
+        run,
+        offloaded,
+        client.current_nick(connection),
+        type(message),
+        bytes(message),
+        kwargs,
+    )
+    for target, text in replies:
+        client.privmsg(target, text, connection=connection)
+
+
+def in_executor(executor=None):
+    """
+    Decorates a handler to run it in an executor, off the event loop.
+
+    For CPU-heavy handlers, so that they don't hold up everything else. By
+    default, the loop's default executor (a thread pool) is used. To run the
+    handler in other processes, pass a `concurrent.futures.ProcessPoolExecutor`.
+    Worker processes find the handler by its module and name, so it must be
+    decorated at the top level of a module that they can import (not
+    `__main__`), and no other offloaded handler may have the same name.
+
+        @allow(PRIVMSG)
+        @in_executor(process_pool)
+        def score(client, message):
+            client.privmsg(message.params[0], expensive_scoring(message.suffix))
+
+    The handler is given a fresh copy of the message, and a `Replies` object in
+    place of the client. Messages sent with `client.privmsg` are sent by the
+    real Client, on the event loop, once the handler has finished.
+    """
+    def inner_decorator(handler):
+        if isinstance(executor, ProcessPoolExecutor):
+            run, offloaded = _run_registered, _register(handler)
+        else:
+            run, offloaded = _run_offloaded, handler
+
+        @wraps(handler)
+        def wrapped(client, message, **kwargs):
+            return _offload(executor, run, offloaded, client, message, kwargs)
+        return wrapped
+    return inner_decorator
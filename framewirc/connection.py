@@ -1,27 +1,84 @@
 import asyncio
+from collections import deque
 
+from . import commands
 from . import exceptions
+from . import metrics
 from . import utils
-from .message import MAX_LENGTH, ReceivedMessage
+from .batch import BatchCollector
+from .isupport import ISupport
+from .message import ReceivedMessage, ValidatedMessage
 
 
 class Connection(utils.RequiredAttributesMixin):
     """
     Communicates with an IRC network.
 
-    Incoming data is sent to `client.on_message`.
+    Incoming data is sent to `client.on_message` as instances of
+    `message_class`. Set it to `LazyReceivedMessage` to only parse the parts
+    of each message that the handlers use.
+
+    Outgoing messages are written straight to the network until more than
+    `write_high_water` bytes are waiting in the transport. Messages are then
+    queued until the transport has drained to `write_low_water` bytes, and are
+    written together. Sending raises `SendQueueFull` rather than let the queue
+    grow past `max_queued_bytes`.
+
+    To avoid being disconnected for flooding, pass a `flood.FloodControl` as
+    `flood_control`. Messages are then paced before they are written.
+
+    The features that the server supports (from RPL_ISUPPORT) are kept in
+    `isupport`, and our nick on the network (once the client has set one) in
+    `nick`. Lines in IRCv3 batches are collected, and passed to `client.on_batch`
+    when the batch ends (see `batch`).
+
+    Lines and bytes in and out, parse times, and the size of the send queue
+    are reported to `metrics.sink`, labelled with the `host`.
     """
+    capabilities = None
+    flood_control = None
+    message_class = ReceivedMessage
+    nick = None
     required_attributes = ('client', 'host')
     port = 6697
     ssl = True
+    write_high_water = 64 * 1024
+    write_low_water = 16 * 1024
+    max_queued_bytes = 1024 * 1024
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.send_queue = deque()
+        self.queued_bytes = 0
+        self.writing_paused = False
+        self.batches = BatchCollector(self)
+        self.isupport = ISupport()
+        self.send_stats = {
+            'max_queued_bytes': 0,
+            'messages_written': 0,
+            'pauses': 0,
+            'writes': 0,
+        }
+        if self.flood_control is not None:
+            self.flood_control.output = self._send_now
+
+    @property
+    def metric_labels(self):
+        """Labels for the metrics of this connection."""
+        return (('host', self.host),)
 
     @asyncio.coroutine
     def connect(self):
         """Connect to the server, and dispatch incoming messages."""
         connection = asyncio.open_connection(self.host, self.port, ssl=self.ssl)
         self.reader, self.writer = yield from connection
+        self.writer.transport.set_write_buffer_limits(
+            high=self.write_high_water,
+            low=self.write_low_water,
+        )
 
         self._connected = True
+        self.client.connection = self  # The client may have many connections.
         self.client.on_connect()
 
         while self._connected:
@@ -31,25 +88,61 @@ class Connection(utils.RequiredAttributesMixin):
     def disconnect(self):
         """Close the connection to the server."""
         self._connected = False
+        self.send_queue.clear()
+        self.queued_bytes = 0
+        self.batches.clear()
+        if self.flood_control is not None:
+            self.flood_control.clear()
         self.writer.close()
 
     def handle(self, raw_message):
-        """Dispatch the message to the client."""
+        """Dispatch the message to the client, noting where it came from."""
         if not raw_message:
             # A blank message means that the connection has closed.
             self.disconnect()
             return
 
-        self.client.on_message(ReceivedMessage(raw_message))
+        sink = metrics.sink
+        if sink.enabled:
+            labels = self.metric_labels
+            sink.increment('framewirc_lines_received_total', labels=labels)
+            sink.increment('framewirc_bytes_received_total', len(raw_message), labels)
+            start = metrics.clock()
+            message = self.message_class(raw_message)
+            sink.observe('framewirc_parse_seconds', metrics.clock() - start, labels)
+        else:
+            message = self.message_class(raw_message)
+        message.connection = self
+        if message.command == commands.RPL_ISUPPORT:
+            self.isupport.update(message)
+        if message.raw_tags or message.command == commands.BATCH:
+            if self.batches.collect(message, self.client):
+                return
+        self.client.on_message(message)
 
     def send(self, message):
         """Dispatch a message to the IRC network."""
+        # Messages from build_message have already been checked.
+        if type(message) is not ValidatedMessage:
+            self.validate(message)
+        self._queue((message,))
+
+    def send_batch(self, messages):
+        """Dispatch a number of messages to the IRC network together."""
+        messages = list(messages)
+        for message in messages:
+            if type(message) is not ValidatedMessage:
+                self.validate(message)
+        self._queue(messages)
+
+    def validate(self, message):
+        """Make sure that a message is safe to send to the network."""
         # Must be bytes.
         if not isinstance(message, bytes):
             raise exceptions.MustBeBytes
 
-        # Must not exceed 512 characters in length.
-        if len(message) > MAX_LENGTH:
+        # Must not exceed 512 characters in length (or the server's LINELEN).
+        if len(message) > self.isupport.linelen:
             raise exceptions.MessageTooLong
 
         # Must end in windows line feed (CR-LF).
@@ -60,9 +153,207 @@ class Connection(utils.RequiredAttributesMixin):
         if message.count(utils.LINEFEED) > 1:
             raise exceptions.StrayLineEnding
 
-        # Send to network.
-        self.writer.write(message)
+    def _queue(self, messages):
+        """Pass the messages through flood control, if there is any."""
+        if self.flood_control is None:
+            self._send_now(messages)
+        else:
+            self.flood_control.put(messages)
 
-    def send_batch(self, messages):
-        for message in messages:
-            self.send(message)
+    def _send_now(self, messages):
+        """Write the messages, or queue them if the network is backed up."""
+        if not self.writing_paused:
+            self._write(messages)
+            return
+
+        size = sum(map(len, messages))
+        if self.queued_bytes + size > self.max_queued_bytes:
+            raise exceptions.SendQueueFull
+        self.send_queue.extend(messages)
+        self.queued_bytes += size
+        if self.queued_bytes > self.send_stats['max_queued_bytes']:
+            self.send_stats['max_queued_bytes'] = self.queued_bytes
+        metrics.sink.gauge(
+            'framewirc_send_queue_bytes', self.queued_bytes, self.metric_labels)
+
+    def _write(self, messages):
+        """Send to network, and pause writing if the transport is backed up."""
+        if len(messages) == 1:
+            self.writer.write(messages[0])
+        else:
+            self.writer.writelines(messages)
+        self.send_stats['messages_written'] += len(messages)
+        self.send_stats['writes'] += 1
+        sink = metrics.sink
+        if sink.enabled:
+            labels = self.metric_labels
+            sink.increment('framewirc_lines_sent_total', len(messages), labels)
+            sink.increment('framewirc_bytes_sent_total', sum(map(len, messages)), labels)
+
+        if self.write_buffer_size() > self.write_high_water:
+            self.writing_paused = True
+            self.send_stats['pauses'] += 1
+            asyncio.Task(self._flush_when_drained())
+
+    def write_buffer_size(self):
+        """How many bytes are waiting to be sent by the transport?"""
+        return self.writer.transport.get_write_buffer_size()
+
+    @asyncio.coroutine
+    def drain(self):
+        """Wait until the transport has drained to `write_low_water` bytes."""
+        yield from self.writer.drain()
+
+    @asyncio.coroutine
+    def _flush_when_drained(self):
+        """Once the transport has drained, write the queue in one go."""
+        try:
+            yield from self.drain()
+        except ConnectionError:
+            # The connection has gone, and the queue with it.
+            return
+        self.writing_paused = False
+
+        messages = list(self.send_queue)
+        self.send_queue.clear()
+        self.queued_bytes = 0
+        metrics.sink.gauge('framewirc_send_queue_bytes', 0, self.metric_labels)
+        if messages:
+            self._write(messages)
+
+
+# BufferedProtocol is new in Python 3.7. Older versions fall back to copying
+# into the buffer from `LineProtocol.data_received`.
+_BaseProtocol = getattr(asyncio, 'BufferedProtocol', asyncio.Protocol)
+
+
+class LineProtocol(_BaseProtocol):
+    """
+    Reads lines from the network straight into a preallocated buffer.
+
+    Every complete line in the buffer is passed to `connection.handle` as soon
+    as it arrives, so a burst of lines (eg: a netsplit, or a large NAMES reply)
+    is dealt with in one pass rather than one loop wakeup per line. Lines are
+    passed as memoryview slices of the buffer, so are only valid for the
+    duration of the `handle` call.
+
+    Lines that do not fit in the buffer are discarded.
+    """
+    buffer_size = 64 * 1024
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.buffer = bytearray(self.buffer_size)
+        self.view = memoryview(self.buffer)
+        self.end = 0  # Where the unprocessed data in the buffer ends.
+        self.discarding = False  # Are we skipping the rest of a long line?
+        self.closed = asyncio.Future()
+        self.drain_waiter = None
+
+    def connection_made(self, transport):
+        self.connection.writer = transport
+
+    def connection_lost(self, exc):
+        # A blank message tells the connection that it has been closed.
+        self.connection.handle(b'')
+        if not self.closed.done():
+            self.closed.set_result(None)
+        if self.drain_waiter is not None and not self.drain_waiter.done():
+            self.drain_waiter.set_exception(ConnectionResetError('Connection lost'))
+
+    def pause_writing(self):
+        self.drain_waiter = asyncio.Future()
+
+    def resume_writing(self):
+        if not self.drain_waiter.done():
+            self.drain_waiter.set_result(None)
+        self.drain_waiter = None
+
+    @asyncio.coroutine
+    def drained(self):
+        """Wait until the transport has asked us to resume writing."""
+        if self.drain_waiter is not None:
+            yield from self.drain_waiter
+
+    def get_buffer(self, sizehint):
+        if self.end == self.buffer_size:
+            # The buffer is full, and contains no line ending.
+            self.end = 0
+            self.discarding = True
+        return self.view[self.end:]
+
+    def data_received(self, data):
+        """Copy data into the buffer. Only used by Python < 3.7."""
+        data = memoryview(data)
+        while data:
+            buffer = self.get_buffer(len(data))
+            nbytes = min(len(buffer), len(data))
+            buffer[:nbytes] = data[:nbytes]
+            self.buffer_updated(nbytes)
+            data = data[nbytes:]
+
+    def buffer_updated(self, nbytes):
+        buffer = self.buffer
+        start = 0
+        end = self.end + nbytes
+
+        # Only the new data needs searching: we'd have found any line ending
+        # in the data that was already here.
+        linefeed = buffer.find(b'\n', self.end, end)
+        if self.discarding and linefeed != -1:
+            start = linefeed + 1
+            linefeed = buffer.find(b'\n', start, end)
+            self.discarding = False
+
+        handle = self.connection.handle
+        while linefeed != -1:
+            handle(self.view[start:linefeed + 1])
+            start = linefeed + 1
+            linefeed = buffer.find(b'\n', start, end)
+
+        # Move the incomplete line to the start of the buffer.
+        if start:
+            remaining = end - start
+            buffer[:remaining] = self.view[start:end].tobytes()
+            end = remaining
+        self.end = end
+
+
+class BufferedConnection(Connection):
+    """
+    A Connection that reads from the network with a LineProtocol.
+
+    This avoids the copying and per-line loop wakeups of a StreamReader, at
+    the cost of messages only being valid until `handle` returns. `writer` is
+    the transport, rather than a StreamWriter.
+    """
+    protocol_class = LineProtocol
+
+    @asyncio.coroutine
+    def connect(self):
+        """Connect to the server. Incoming messages are dispatched as they arrive."""
+        loop = asyncio.get_event_loop()
+        connection = loop.create_connection(
+            lambda: self.protocol_class(self),
+            self.host,
+            self.port,
+            ssl=self.ssl,
+        )
+        self.writer, self.protocol = yield from connection
+        self.writer.set_write_buffer_limits(
+            high=self.write_high_water,
+            low=self.write_low_water,
+        )
+
+        self._connected = True
+        self.client.connection = self  # The client may have many connections.
+        self.client.on_connect()
+
+        yield from self.protocol.closed
+
+    def write_buffer_size(self):
+        return self.writer.get_write_buffer_size()
+
+    @asyncio.coroutine
+    def drain(self):
+        yield from self.protocol.drained()
@@ -0,0 +1,39 @@
+from .filters import get_command_filter
+
+
+class DispatchTable:
+    """
+    An index of handlers by the commands that they accept.
+
+    Handlers decorated with `filters.allow` and `filters.deny` carry their
+    `CommandFilter`, so the commands that each handler accepts are known up
+    front. The index is built once, and each message is only passed to the
+    handlers that would not immediately discard it. Handlers keep the order in
+    which they were given.
+    """
+    def __init__(self, handlers):
+        self.handlers = handlers
+        command_filters = [(h, get_command_filter(h)) for h in handlers]
+
+        commands = set()
+        for _, command_filter in command_filters:
+            commands.update(command_filter.commands)
+
+        self.table = {}
+        for command in commands:
+            self.table[command] = tuple(
+                handler
+                for handler, command_filter in command_filters
+                if command_filter.accepts(command)
+            )
+
+        # Commands no filter mentions only reach handlers without a whitelist.
+        self.default = tuple(
+            handler
+            for handler, command_filter in command_filters
+            if command_filter.allowed is None
+        )
+
+    def handlers_for(self, command):
+        """Get the handlers that accept `command`, in order."""
+        return self.table.get(command, self.default)
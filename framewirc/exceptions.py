@@ -1,3 +1,9 @@
+class DuplicateHandlerName(Exception):
+    def __init__(self, key):
+        msg = 'Another handler is already offloaded as {}.{}'.format(*key)
+        super().__init__(msg)
+
+
 class MessageTooLong(Exception):
     pass
 
@@ -16,5 +22,9 @@ class NoLineEnding(Exception):
     pass
 
 
+class SendQueueFull(Exception):
+    pass
+
+
 class StrayLineEnding(Exception):
     pass
@@ -1,3 +1,148 @@
+from functools import wraps
+
+
+class CommandFilter:
+    """
+    The set of commands that a filtered handler will accept.
+
+    `allowed` is a frozenset of commands, or `None` if the handler accepts
+    everything that is not `denied`. Filters are attached to the handlers that
+    `allow` and `deny` decorate as `handler.command_filter`, so that the
+    `Client` can index its handlers by command.
+    """
+    def __init__(self, allowed=None, denied=()):
+        self.allowed = None if allowed is None else frozenset(allowed)
+        self.denied = frozenset(denied)
+
+    def __and__(self, other):
+        """Combine two filters into one that only accepts what both accept."""
+        if self.allowed is None:
+            allowed = other.allowed
+        elif other.allowed is None:
+            allowed = self.allowed
+        else:
+            allowed = self.allowed & other.allowed
+        return CommandFilter(allowed, self.denied | other.denied)
+
+    def accepts(self, command):
+        """Will a handler with this filter accept `command`?"""
+        if command in self.denied:
+            return False
+        return self.allowed is None or command in self.allowed
+
+    @property
+    def commands(self):
+        """Every command that this filter mentions."""
+        return (self.allowed or frozenset()) | self.denied
+
+
+ACCEPT_ALL = CommandFilter()
+
+
+def get_command_filter(handler):
+    """Get the CommandFilter of a handler, or ACCEPT_ALL if it has none."""
+    command_filter = getattr(handler, 'command_filter', None)
+    if isinstance(command_filter, CommandFilter):
+        return command_filter
+    return ACCEPT_ALL
+
+
+class Chain:
+    """
+    The filter and message parsers that decorators have stacked on a handler.
+
+    Each `allow`, `deny`, or `parsers.apply_message_parser` decorator adds to
+    the chain of the handler it decorates, and `compile_chain` turns the
+    result into a single wrapper. However many decorators are stacked, each
+    message is checked against one filter, then passed through the parsers
+    (outermost first) on the way to `handler`.
+
+    `wrapper` is the function that `compile_chain` made, which is the only
+    thing that runs the chain. Other decorators that use `functools.wraps`
+    copy the `chain` attribute along, but don't run it.
+    """
+    def __init__(self, handler, command_filter=ACCEPT_ALL, parsers=()):
+        self.handler = handler
+        self.command_filter = command_filter
+        self.parsers = tuple(parsers)
+        self.wrapper = None
+
+
+def get_chain(handler):
+    """Get the Chain of a compiled handler, or start a new one around it."""
+    chain = getattr(handler, '__dict__', {}).get('chain')
+    if isinstance(chain, Chain) and chain.wrapper is handler:
+        return chain
+    return Chain(handler, get_command_filter(handler))
+
+
+def _parse_all(parsers, message):
+    kwargs = {}
+    for parse in parsers:
+        kwargs.update(parse(message))
+    return kwargs
+
+
+def _parsing_call(handler, command_filter, parsers):
+    """Call `handler` with the parsers' results, if the filter accepts."""
+    if command_filter.allowed is None and not command_filter.denied:
+        def wrapped(client, message):
+            kwargs = _parse_all(parsers, message)
+            return handler(client=client, message=message, **kwargs)
+        return wrapped
+
+    accepts = command_filter.accepts
+
+    def wrapped(client, message):
+        if accepts(message.command):
+            kwargs = _parse_all(parsers, message)
+            return handler(client=client, message=message, **kwargs)
+    return wrapped
+
+
+def _filtering_call(handler, command_filter):
+    """Call `handler` if the filter accepts, with a single set lookup."""
+    denied = command_filter.denied
+    if command_filter.allowed is None:
+        def wrapped(client, message):
+            if message.command not in denied:
+                return handler(client=client, message=message)
+        return wrapped
+
+    allowed = command_filter.allowed - denied
+
+    def wrapped(client, message):
+        if message.command in allowed:
+            return handler(client=client, message=message)
+    return wrapped
+
+
+def compile_chain(decorated, chain):
+    """
+    Make a single wrapper that runs `chain` in place of `decorated`.
+
+    `decorated` is the handler that the newest decorator was applied to.
+    """
+    if chain.parsers:
+        wrapped = _parsing_call(chain.handler, chain.command_filter, chain.parsers)
+    else:
+        wrapped = _filtering_call(chain.handler, chain.command_filter)
+
+    wrapped = wraps(decorated)(wrapped)
+    wrapped.chain = chain
+    wrapped.command_filter = chain.command_filter
+    chain.wrapper = wrapped
+    return wrapped
+
+
+def _apply_filter(handler, command_filter):
+    """Merge the filter into the handler's chain, and compile it."""
+    chain = get_chain(handler)
+    chain = Chain(
+        chain.handler, chain.command_filter & command_filter, chain.parsers)
+    return compile_chain(handler, chain)
+
+
 def deny(blacklist):
     """
     Decorates a handler to filter out a blacklist of commands.
@@ -16,12 +161,10 @@ def deny(blacklist):
             pass
     """
     blacklist = [blacklist] if isinstance(blacklist, str) else blacklist
+    command_filter = CommandFilter(denied=blacklist)
 
     def inner_decorator(handler):
-        def wrapped(client, message):
-            if message.command not in blacklist:
-                handler(client=client, message=message)
-        return wrapped
+        return _apply_filter(handler, command_filter)
     return inner_decorator
 
 
@@ -43,10 +186,8 @@ def allow(whitelist):
             pass
     """
     whitelist = [whitelist] if isinstance(whitelist, str) else whitelist
+    command_filter = CommandFilter(allowed=whitelist)
 
     def inner_decorator(handler):
-        def wrapped(client, message):
-            if message.command in whitelist:
-                handler(client=client, message=message)
-        return wrapped
+        return _apply_filter(handler, command_filter)
     return inner_decorator
@@ -0,0 +1,166 @@
+import asyncio
+import time
+from collections import deque
+
+from . import commands, exceptions
+from .utils import to_bytes
+
+
+# Lanes are emptied in order, so messages in earlier lanes skip ahead.
+PRIORITY = 'priority'
+NORMAL = 'normal'
+BULK = 'bulk'
+LANES = (PRIORITY, NORMAL, BULK)
+
+# Commands that keep us connected and registered must not wait behind chatter.
+PRIORITY_COMMANDS = frozenset(map(to_bytes, (
+    commands.CAP,
+    commands.NICK,
+    commands.PASS,
+    commands.PONG,
+    commands.QUIT,
+    commands.USER,
+)))
+BULK_COMMANDS = frozenset(map(to_bytes, (commands.NOTICE, commands.PRIVMSG)))
+
+
+def lane_for(message):
+    """Which lane should a (valid, bytes) message be sent in?"""
+    if message[0:1] == b':':
+        message = message.split(b' ', 1)[1]
+    command = message.split(None, 1)[0].upper()
+    if command in PRIORITY_COMMANDS:
+        return PRIORITY
+    if command in BULK_COMMANDS:
+        return BULK
+    return NORMAL
+
+
+class TokenBucket:
+    """
+    Allow `capacity` messages at once, refilling at `rate` messages a second.
+
+    The defaults follow the flood control described in RFC1459 §8.10: five
+    messages in a burst, then one every two seconds.
+    """
+    def __init__(self, rate=0.5, capacity=5, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self):
+        """Take a token if one is available. Returns True if one was taken."""
+        self._refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def delay(self):
+        """How many seconds until the next token will be available?"""
+        self._refill()
+        return max(0, (1 - self.tokens) / self.rate)
+
+
+class FloodControl:
+    """
+    Paces messages sent by a Connection, sending the most urgent first.
+
+    Messages wait in one of the `LANES` (see `lane_for`) until `bucket` has a
+    token for them. Pass an instance to each Connection:
+
+        Connection(client=client, host=host, flood_control=FloodControl())
+
+    Putting messages raises `SendQueueFull` rather than let the queued
+    messages grow past `max_queued_bytes`. Statistics for each lane are
+    available from `stats()`.
+    """
+    def __init__(self, bucket=None, clock=time.monotonic, max_queued_bytes=1024 * 1024):
+        self.bucket = TokenBucket(clock=clock) if bucket is None else bucket
+        self.clock = clock
+        self.max_queued_bytes = max_queued_bytes
+        self.output = None  # Set by the Connection.
+        self.lanes = {lane: deque() for lane in LANES}
+        self.queued = 0
+        self.queued_bytes = 0
+        self.started = clock()
+        self.lane_stats = {
+            lane: {'sent': 0, 'total_latency': 0, 'max_latency': 0}
+            for lane in LANES
+        }
+        self._timer = None
+
+    def put(self, messages):
+        """Queue messages, and send as many as the bucket allows."""
+        size = sum(map(len, messages))
+        if self.queued_bytes + size > self.max_queued_bytes:
+            raise exceptions.SendQueueFull
+        now = self.clock()
+        for message in messages:
+            self.lanes[lane_for(message)].append((now, message))
+        self.queued += len(messages)
+        self.queued_bytes += size
+        # While a release is scheduled, the bucket is empty, so just wait for it.
+        if self._timer is None:
+            self.release()
+
+    def release(self):
+        """Send queued messages until we run out of tokens."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = self.clock()
+        batch = []
+        while self.queued and self.bucket.take():
+            lane = next(lane for lane in LANES if self.lanes[lane])
+            queued_at, message = self.lanes[lane].popleft()
+            self.queued -= 1
+            self.queued_bytes -= len(message)
+            self._record(lane, now - queued_at)
+            batch.append(message)
+
+        if batch:
+            self.output(batch)
+
+        if self.queued and self._timer is None:
+            loop = asyncio.get_event_loop()
+            self._timer = loop.call_later(self.bucket.delay(), self.release)
+
+    def clear(self):
+        """Forget every queued message."""
+        for lane in self.lanes.values():
+            lane.clear()
+        self.queued = 0
+        self.queued_bytes = 0
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _record(self, lane, latency):
+        stats = self.lane_stats[lane]
+        stats['sent'] += 1
+        stats['total_latency'] += latency
+        stats['max_latency'] = max(stats['max_latency'], latency)
+
+    def stats(self):
+        """Queue depth, throughput, and latency (in seconds) for each lane."""
+        elapsed = self.clock() - self.started
+        result = {}
+        for lane in LANES:
+            stats = self.lane_stats[lane]
+            sent = stats['sent']
+            result[lane] = {
+                'queued': len(self.lanes[lane]),
+                'sent': sent,
+                'per_second': sent / elapsed if elapsed else 0,
+                'mean_latency': stats['total_latency'] / sent if sent else 0,
+                'max_latency': stats['max_latency'],
+            }
+        return result
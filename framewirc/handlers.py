@@ -1,18 +1,20 @@
 from . import commands, filters
-from .message import build_message
+from .message import MessageTemplate
+
+
+PONG = MessageTemplate(commands.PONG)
 
 
 @filters.allow(commands.PING)
 def ping(client, message):
     """On recieving PING, repond with PONG."""
-    payload = build_message('PONG', suffix=message.suffix)
-    client.connection.send(payload)
+    client.connection.send(PONG(message.suffix))
 
 
 @filters.allow(commands.ERR_NICKNAMEINUSE)
 def nickname_in_use(client, message):
     """If nick is being used, append a caret."""
-    client.set_nick(client.nick + '^')
+    client.set_nick(client.current_nick() + '^')
 
 
 basic_handlers = (ping, nickname_in_use)
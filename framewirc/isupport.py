@@ -0,0 +1,88 @@
+"""
+The features that a server says it supports, in RPL_ISUPPORT (005) replies.
+
+See https://modern.ircdocs.horse/#rplisupport-005
+"""
+import re
+
+from .message import MAX_LENGTH
+
+
+# Channel name prefixes from RFC2812 §1.3, for servers that don't say.
+CHANTYPES = '&#+!'
+
+_ESCAPE = re.compile(r'\\x([0-9a-fA-F]{2})')
+
+
+def _unescape(value):
+    return _ESCAPE.sub(lambda match: chr(int(match.group(1), 16)), value)
+
+
+class ISupport:
+    """
+    The ISUPPORT tokens sent by a server, and the limits that they set.
+
+    Each `Connection` has one, as `connection.isupport`, which is updated as
+    RPL_ISUPPORT replies arrive. `tokens` maps each token to its value, which
+    is '' for tokens without one.
+    """
+    def __init__(self):
+        self.tokens = {}
+
+    def update(self, message):
+        """Add the tokens from an RPL_ISUPPORT message."""
+        # The first param is our nick. The suffix is "are supported by...".
+        for token in message.params[1:]:
+            if token.startswith('-'):
+                self.tokens.pop(token[1:], None)
+                continue
+            key, _, value = token.partition('=')
+            self.tokens[key] = _unescape(value)
+
+    @property
+    def casemapping(self):
+        return self.tokens.get('CASEMAPPING') or 'rfc1459'
+
+    @property
+    def chantypes(self):
+        """The characters that channel names may start with."""
+        chantypes = self.tokens.get('CHANTYPES')
+        return CHANTYPES if chantypes is None else chantypes
+
+    @property
+    def linelen(self):
+        """The longest line, in bytes, that may be sent (including CR-LF)."""
+        try:
+            return int(self.tokens['LINELEN'])
+        except (KeyError, ValueError):
+            return MAX_LENGTH
+
+    @property
+    def targmax(self):
+        """
+        The most targets each command accepts, by command.
+
+        Commands with no limit map to None. Commands that are not mentioned
+        are not in the dict.
+        """
+        targmax = {}
+        for entry in self.tokens.get('TARGMAX', '').split(','):
+            command, _, limit = entry.partition(':')
+            if command:
+                targmax[command.upper()] = int(limit) if limit else None
+        return targmax
+
+    def max_targets(self, command):
+        """
+        The most targets that `command` may be sent to at once.
+
+        Uses TARGMAX, falling back to MAXTARGETS, or 1 if the server gives
+        neither. No limit is returned as None.
+        """
+        targmax = self.targmax
+        if command in targmax:
+            return targmax[command]
+        try:
+            return int(self.tokens['MAXTARGETS'])
+        except (KeyError, ValueError):
+            return 1
@@ -1,16 +1,42 @@
 from . import commands, exceptions
-from .utils import chunk_message, LINEFEED, to_bytes, to_unicode
+from .utils import chunk_message, LINEFEED, LRUCache, to_bytes, to_unicode
 
 
 MAX_LENGTH = 512  # The largest legal size of an IRC command.
 
 
+class _LazyElement:
+    """
+    An attribute of a message that is parsed on first access.
+
+    The `parse` method must store the attribute on the instance. As this is
+    not a data descriptor, the stored value is then found before it.
+    """
+    def __init__(self, name, parse):
+        self.name = name
+        self.parse = parse
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        getattr(instance, self.parse)()
+        return instance.__dict__[self.name]
+
+
 class ReceivedMessage(bytes):
-    """A message recieved from the IRC network."""
+    """
+    A message recieved from the IRC network.
+
+    IRCv3 message tags are kept undecoded in `raw_tags`, and are only split up
+    into the `tags` dict when it is first read.
+    """
+    tags = _LazyElement('tags', '_parse_tags')
 
     def __init__(self, raw_message_bytes_ignored):
         super().__init__()
-        self.prefix, self.command, self.params, self.suffix = self._elements()
+        (
+            self.prefix, self.command, self.params, self.suffix, self.raw_tags,
+        ) = self._elements()
 
     def _elements(self):
         """
@@ -18,7 +44,7 @@ class ReceivedMessage(bytes):
 
         Adapted from http://stackoverflow.com/a/930706/400691
         """
-        message = self.rstrip()
+        raw_tags, message = _split_tags(self.rstrip())
 
         prefix = b''
         # Odd slicing required for bytes to avoid getting int instead of char
@@ -34,11 +60,115 @@ class ReceivedMessage(bytes):
         params = tuple(to_unicode(p) for p in params if p)
 
         # Suffix not yet turned to unicode to allow more complex encoding logic
-        return to_unicode(prefix), to_unicode(command), params, suffix
+        return to_unicode(prefix), to_unicode(command), params, suffix, raw_tags
+
+    def _parse_tags(self):
+        self.tags = parse_tags(self.raw_tags)
+
+
+def _split_tags(message):
+    """Split the raw tags (without the leading '@') from the rest of a message."""
+    if message[0:1] != b'@':
+        return b'', message
+    raw_tags, message = message[1:].split(b' ', 1)
+    return raw_tags, message.lstrip(b' ')
+
+
+# Escaped characters in tag values. See https://ircv3.net/specs/extensions/message-tags
+TAG_ESCAPES = {
+    ':': ';',
+    's': ' ',
+    '\\': '\\',
+    'r': '\r',
+    'n': '\n',
+}
+
+
+def parse_tags(raw_tags):
+    """
+    Split raw IRCv3 message tags into a dict, unescaping the values.
+
+    Tags without a value are given the value ''.
+    """
+    tags = {}
+    if not raw_tags:
+        return tags
+    for tag in to_unicode(raw_tags).split(';'):
+        if not tag:
+            continue
+        key, _, value = tag.partition('=')
+        if '\\' in value:
+            value = _unescape_tag_value(value)
+        tags[key] = value
+    return tags
+
+
+def _unescape_tag_value(value):
+    unescaped = []
+    characters = iter(value)
+    for character in characters:
+        if character == '\\':
+            # A backslash at the end is dropped. Unknown escapes are unescaped.
+            escaped = next(characters, '')
+            character = TAG_ESCAPES.get(escaped, escaped)
+        unescaped.append(character)
+    return ''.join(unescaped)
+
+
+class LazyReceivedMessage(ReceivedMessage):
+    """
+    A ReceivedMessage that is only parsed when its parts are needed.
+
+    Reading `command` only finds and decodes the command. The `prefix`,
+    `params`, and `suffix` are parsed together the first time one of them is
+    read, and are then cached on the message. This saves work when most
+    messages are only looked at by filters and simple handlers (eg: PING).
+    Reading `raw_tags` only finds the tags.
+    """
+    command = _LazyElement('command', '_parse_command')
+    prefix = _LazyElement('prefix', '_parse')
+    params = _LazyElement('params', '_parse')
+    suffix = _LazyElement('suffix', '_parse')
+    raw_tags = _LazyElement('raw_tags', '_parse_raw_tags')
+
+    def __init__(self, raw_message_bytes_ignored):
+        # Don't call ReceivedMessage.__init__, as that parses everything.
+        pass
+
+    def _parse_command(self):
+        """Find the command without splitting up the rest of the message."""
+        message = self
+        if message[0:1] == b'@':
+            message = message.split(None, 1)[1]
+        if message[0:1] == b':':
+            message = message.split(None, 1)[1]
+        self.command = to_unicode(message.split(None, 1)[0])
+
+    def _parse_raw_tags(self):
+        self.raw_tags = _split_tags(self)[0]
+
+    def _parse(self):
+        """Parse the whole message, and cache the parts on the instance."""
+        (
+            self.prefix, self.command, self.params, self.suffix, self.raw_tags,
+        ) = self._elements()
+
+
+class ValidatedMessage(bytes):
+    """
+    A message that is known to be safe to send to the IRC network.
+
+    `Connection.send` trusts these, and skips its checks. Only `build_message`
+    and `MessageTemplate` should create them.
+    """
 
 
-def build_message(command, *args, prefix=b'', suffix=b''):
-    """Construct a message that can be sent to the IRC network."""
+def build_message(command, *args, prefix=b'', suffix=b'', max_length=MAX_LENGTH):
+    """
+    Construct a message that can be sent to the IRC network.
+
+    Messages may be up to `max_length` bytes long, including the line ending.
+    """
 
     # Make sure everything is bytes.
     command = to_bytes(command)
@@ -62,17 +192,63 @@ def build_message(command, *args, prefix=b'', suffix=b''):
         message = message + b' :' + suffix
     message = message + LINEFEED
 
-    # Must not exceed 512 characters in length.
-    if len(message) > 512:
+    # Must not exceed 512 characters in length (or the server's LINELEN).
+    if len(message) > max_length:
         raise exceptions.MessageTooLong
 
-    return message
+    return ValidatedMessage(message)
+
+
+class MessageTemplate:
+    """
+    The fixed start of a message (eg: `PRIVMSG #channel`), for many suffixes.
+
+    The command, params, and prefix are encoded and checked once. Each call
+    then only checks the suffix:
+
+        to_channel = MessageTemplate(commands.PRIVMSG, '#channel')
+        connection.send(to_channel('Hello!'))
+
+    Calling a template gives the same message as `build_message` would, given
+    the same arguments.
+    """
+    def __init__(self, command, *args, prefix=b'', max_length=MAX_LENGTH):
+        message = build_message(command, *args, prefix=prefix, max_length=max_length)
+        self.header = message[:-len(LINEFEED)]
+        self.max_length = max_length
+
+    def __call__(self, suffix=b''):
+        if type(suffix) is not bytes:
+            suffix = to_bytes(suffix)
+
+        if suffix:
+            # Must not contain line feeds.
+            if LINEFEED in suffix:
+                raise exceptions.StrayLineEnding
+            message = self.header + b' :' + suffix + LINEFEED
+        else:
+            message = self.header + LINEFEED
+
+        if len(message) > self.max_length:
+            raise exceptions.MessageTooLong
+        return ValidatedMessage(message)
+
+
+# PRIVMSG templates, by target and line length.
+_privmsg_templates = LRUCache(maxsize=1024)
+
 
+def make_privmsgs(target, message, line_length=MAX_LENGTH):
+    """
+    Turn a string into a number of PRIVMSG commands.
 
-def make_privmsgs(target, message):
-    """Turn a string into a number of PRIVMSG commands."""
-    max_length = MAX_LENGTH - (len(commands.PRIVMSG) + len(target) + 5)
-    messages = []
-    for line in chunk_message(message, max_length=max_length):
-        messages.append(build_message(commands.PRIVMSG, target, suffix=line))
-    return messages
+    Pass the server's `line_length` (see `ISupport.linelen`) if it allows
+    longer lines than the standard 512 bytes.
+    """
+    max_length = line_length - (len(commands.PRIVMSG) + len(to_bytes(target)) + 5)
+    key = (target, line_length)
+    template = _privmsg_templates.get(key)
+    if template is None:
+        template = MessageTemplate(commands.PRIVMSG, target, max_length=line_length)
+        _privmsg_templates[key] = template
+    return [template(line) for line in chunk_message(message, max_length=max_length)]
@@ -0,0 +1,167 @@
+"""
+Counters, gauges, and histograms describing what a bot is doing.
+
+Metrics are reported to `sink`, which throws them away by default. To keep
+them, install an `InMemorySink` (or anything with the same methods):
+
+    from framewirc import metrics
+
+    sink = metrics.set_sink(metrics.InMemorySink())
+    ...
+    sink.snapshot()    # A dict of every metric.
+    sink.exposition()  # The same, in the Prometheus text format.
+
+Labels are passed as a tuple of `(name, value)` pairs.
+"""
+import time
+from bisect import bisect_left
+
+
+# Upper bounds of histogram buckets, in seconds.
+DEFAULT_BUCKETS = (
+    0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5,
+)
+
+clock = time.perf_counter
+
+
+class NullSink:
+    """Ignores every metric. Instrumented code skips timing when not `enabled`."""
+    enabled = False
+
+    def increment(self, name, value=1, labels=()):
+        pass
+
+    def gauge(self, name, value, labels=()):
+        pass
+
+    def observe(self, name, value, labels=()):
+        pass
+
+
+class Histogram:
+    """Counts observed values into buckets, and keeps their count and sum."""
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # The last is +Inf.
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        """The cumulative count of values up to each bucket's bound."""
+        cumulative = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return {'buckets': cumulative, 'count': self.count, 'sum': self.sum}
+
+
+class InMemorySink:
+    """Keeps every metric in memory, for reading with `snapshot`."""
+    enabled = True
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def increment(self, name, value=1, labels=()):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name, value, labels=()):
+        self.gauges[(name, labels)] = value
+
+    def observe(self, name, value, labels=()):
+        key = (name, labels)
+        try:
+            histogram = self.histograms[key]
+        except KeyError:
+            histogram = self.histograms[key] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def snapshot(self):
+        """
+        Get the current value of every metric.
+
+        Keys are metric names, with any labels in braces (as in `exposition`).
+        Histograms are dicts, as returned by `Histogram.snapshot`.
+        """
+        snapshot = {}
+        for (name, labels), value in self.counters.items():
+            snapshot[_key(name, labels)] = value
+        for (name, labels), value in self.gauges.items():
+            snapshot[_key(name, labels)] = value
+        for (name, labels), histogram in self.histograms.items():
+            snapshot[_key(name, labels)] = histogram.snapshot()
+        return snapshot
+
+    def exposition(self):
+        """Every metric in the Prometheus text exposition format."""
+        lines = []
+        for kind, metrics in (('counter', self.counters), ('gauge', self.gauges)):
+            for name, series in _by_name(metrics):
+                lines.append('# TYPE {} {}'.format(name, kind))
+                for labels, value in series:
+                    lines.append('{} {}'.format(_key(name, labels), value))
+
+        for name, series in _by_name(self.histograms):
+            lines.append('# TYPE {} histogram'.format(name))
+            for labels, histogram in series:
+                for bound, count in histogram.snapshot()['buckets']:
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    bucket_labels = labels + (('le', le),)
+                    lines.append('{} {}'.format(
+                        _key(name + '_bucket', bucket_labels), count))
+                lines.append('{} {}'.format(
+                    _key(name + '_count', labels), histogram.count))
+                lines.append('{} {}'.format(
+                    _key(name + '_sum', labels), histogram.sum))
+        return '\n'.join(lines) + '\n'
+
+
+def _key(name, labels):
+    if not labels:
+        return name
+    pairs = ('{}="{}"'.format(label, _escape(value)) for label, value in labels)
+    return '{}{{{}}}'.format(name, ','.join(pairs))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _by_name(metrics):
+    """Group `{(name, labels): value}` into sorted `(name, [(labels, value)])`."""
+    grouped = {}
+    for (name, labels), value in metrics.items():
+        grouped.setdefault(name, []).append((labels, value))
+    return sorted((name, sorted(series)) for name, series in grouped.items())
+
+
+def handler_name(handler):
+    """A readable name for a handler, looking through any decorators."""
+    while '__wrapped__' in getattr(handler, '__dict__', {}):
+        handler = handler.__wrapped__
+    name = getattr(handler, '__qualname__', None)
+    if not isinstance(name, str):  # Probably a callable instance.
+        handler = type(handler)
+        name = handler.__qualname__
+    return '{}.{}'.format(handler.__module__, name)
+
+
+sink = NullSink()
+
+
+def set_sink(new_sink):
+    """Send metrics to `new_sink` from now on, and return it."""
+    global sink
+    sink = new_sink
+    return new_sink
@@ -1,7 +1,23 @@
-def is_channel(name):
+import sys
+from functools import partial, wraps
+from types import MappingProxyType
+
+from .filters import Chain, compile_chain, get_chain
+from .isupport import CHANTYPES
+from .utils import LRUCache
+
+
+# Parsed nicks, by raw nick. The same few prefixes are seen over and over.
+nick_cache = LRUCache(maxsize=4096)
+
+
+def is_channel(name, chantypes=CHANTYPES):
     """
     Determine if a string is a valid channel name.
 
+    Pass the server's `chantypes` (see `ISupport.chantypes`) to use its
+    channel prefixes rather than those from the RFC.
+
     The exact text from RFC2812 §1.3 is as follows:
 
     Channels names are strings (beginning with a '&', '#', '+' or '!'
@@ -17,7 +33,7 @@ def is_channel(name):
         return False
     if set(name).intersection(',\7 '):  # Note the space
         return False
-    if name[0] not in '&#+!':
+    if name[0] not in chantypes:
         return False
     return True
 
@@ -33,18 +49,29 @@ def nick(raw_nick):
     When they don't have an ident, they have a leading tilde instead:
 
         ~nick@hostname
+
+    Results are cached in `nick_cache`, so they are read-only mappings shared
+    between calls. Their strings are interned.
     """
+    parts = nick_cache.get(raw_nick)
+    if parts is None:
+        parts = nick_cache[raw_nick] = MappingProxyType(_parse_nick(raw_nick))
+    return parts
+
+
+def _parse_nick(raw_nick):
     if '!' in raw_nick:
         nick, _rest = raw_nick.split('!')
         ident, host = _rest.split('@')
+        ident = sys.intern(ident)
     else:
         nick, host = raw_nick.split('@')
         nick = nick.lstrip('~')
         ident = None
     return {
-        'nick': nick,
+        'nick': sys.intern(nick),
         'ident': ident,
-        'host': host,
+        'host': sys.intern(host),
     }
 
 
@@ -53,13 +80,16 @@ def privmsg(message):
     Split received PRIVMSG command into a dictionary of parts.
 
     When the message target is a channel, 'channel' is set to that. Otherwise,
-    'channel' is defined as the sender's nick.
+    'channel' is defined as the sender's nick. Channels are recognised by the
+    CHANTYPES of the connection that the message came from.
     """
     target = message.params[0]
     raw_sender = message.prefix
     sender_nick = nick(raw_sender)['nick']
 
-    if is_channel(target):
+    connection = getattr(message, 'connection', None)
+    chantypes = CHANTYPES if connection is None else connection.isupport.chantypes
+    if is_channel(target, chantypes):
         channel = target
     else:
         channel = sender_nick
@@ -90,23 +120,51 @@ def apply_kwargs_parser(parser):
     otherwise have received.
     """
     def inner_decorator(handler):
+        @wraps(handler)
         def wrapped(**kwargs):
             parser_result = parser(**kwargs)
             kwargs.update(parser_result)
-            handler(**kwargs)
+            return handler(**kwargs)
         return wrapped
     return inner_decorator
 
 
-def apply_message_parser(parser):
+def apply_message_parser(parser, cache=True):
     """
     Decorator that passes the result of a message parser to a handler as kwargs.
 
     The parser will only be passed a `message` kwarg.
+
+    The result is cached on the message, so a message is only parsed once by
+    each parser however many handlers use it. Pass `cache=False` for parsers
+    that do not always return the same result for the same message.
+
+    Message parsers and filters may be stacked in any order. They are compiled
+    into one wrapper (see `filters.Chain`), which only parses messages that
+    pass the filters.
     """
+    if cache:
+        parse = partial(_cached_parse, parser)
+    else:
+        def parse(message):
+            return parser(message=message)
+
     def inner_decorator(handler):
-        def wrapped(client, message):
-            parser_result = parser(message=message)
-            handler(client=client, message=message, **parser_result)
-        return wrapped
+        chain = get_chain(handler)
+        chain = Chain(
+            chain.handler, chain.command_filter, (parse,) + chain.parsers)
+        return compile_chain(handler, chain)
     return inner_decorator
+
+
+def _cached_parse(parser, message):
+    """Parse the message, or get the result of parsing it before."""
+    try:
+        results = message.__dict__.setdefault('parser_results', {})
+    except AttributeError:  # Can't store attributes on this message.
+        return parser(message=message)
+    try:
+        return results[parser]
+    except KeyError:
+        result = results[parser] = parser(message=message)
+        return result
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+from collections import deque
+
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class Profiler:
+    """
+    Find the handlers that are slow, or that hold up the event loop.
+
+    Set it as a Client's `profiler`, and every handler call is timed. Calls
+    that take at least `threshold` seconds are logged, and kept in
+    `slow_calls` as `(handler name, seconds)`.
+
+    Once started, it also checks how late the event loop is to run a timer
+    every `lag_interval` seconds. Lag of at least `lag_threshold` seconds is
+    logged, and kept in `lag_spikes` as `(seconds, handler name)`, blaming
+    the slowest handler call since the last check. The name is None when no
+    handler has run, as the lag came from elsewhere (eg: a coroutine handler,
+    which is not timed while it runs as a task).
+
+        profiler = Profiler(threshold=0.05)
+        client = MyClient(profiler=profiler)
+        profiler.start()
+
+    Handler names are looked up through `filters` and `parsers` decorators.
+    """
+    def __init__(self, threshold=0.1, lag_interval=0.5, lag_threshold=0.1, history=100):
+        self.threshold = threshold
+        self.lag_interval = lag_interval
+        self.lag_threshold = lag_threshold
+        self.slow_calls = deque(maxlen=history)
+        self.lag_spikes = deque(maxlen=history)
+        self.max_lag = 0
+        self.loop = None
+        self._slowest = (0, None)  # Since the last lag check.
+        self._expected = None
+        self._timer = None
+
+    def record(self, name, seconds):
+        """Note how long a call to the named handler took."""
+        if seconds > self._slowest[0]:
+            self._slowest = (seconds, name)
+        if seconds >= self.threshold:
+            self.slow_calls.append((name, seconds))
+            metrics.sink.increment(
+                'framewirc_slow_handler_calls_total', labels=(('handler', name),))
+            logger.warning('Handler %s took %.3f seconds.', name, seconds)
+
+    def start(self, loop=None):
+        """Start checking the event loop for lag."""
+        self.loop = loop or asyncio.get_event_loop()
+        self._schedule()
+
+    def stop(self):
+        """Stop checking the event loop for lag."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def stats(self):
+        return {
+            'lag_spikes': list(self.lag_spikes),
+            'max_lag': self.max_lag,
+            'slow_calls': list(self.slow_calls),
+        }
+
+    def _schedule(self):
+        self._expected = self.loop.time() + self.lag_interval
+        self._timer = self.loop.call_later(self.lag_interval, self._check_lag)
+
+    def _check_lag(self):
+        """Measure how late this call is, and blame the slowest handler."""
+        lag = max(0, self.loop.time() - self._expected)
+        self.max_lag = max(self.max_lag, lag)
+        metrics.sink.observe('framewirc_loop_lag_seconds', lag)
+
+        if lag >= self.lag_threshold:
+            name = self._slowest[1]
+            self.lag_spikes.append((lag, name))
+            metrics.sink.increment(
+                'framewirc_loop_lag_spikes_total',
+                labels=(('handler', name or 'unknown'),),
+            )
+            logger.warning(
+                'Event loop lagged by %.3f seconds. Slowest handler: %s.',
+                lag, name or 'unknown',
+            )
+
+        self._slowest = (0, None)
+        self._schedule()
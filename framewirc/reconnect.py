@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import random
+
+from . import commands
+from .filters import CommandFilter
+from .message import build_message, MAX_LENGTH
+from .state import CASEMAPPINGS
+from .utils import to_unicode
+
+
+logger = logging.getLogger(__name__)
+
+# Replies to JOIN that mean that we won't be getting into the channel.
+JOIN_ERRORS = (
+    commands.ERR_BADCHANMASK,
+    commands.ERR_BADCHANNELKEY,
+    commands.ERR_BANNEDFROMCHAN,
+    commands.ERR_CHANNELISFULL,
+    commands.ERR_INVITEONLYCHAN,
+    commands.ERR_NOSUCHCHANNEL,
+    commands.ERR_TOOMANYCHANNELS,
+)
+
+
+class Backoff:
+    """
+    Exponential backoff, with "full jitter".
+
+    The delay before attempt `n` (counting from 0) is a random time of up to
+    `base * factor ** n` seconds, but no more than `maximum`. The randomness
+    stops many clients that lost the same server from all coming back at once.
+    """
+    def __init__(self, base=1, factor=2, maximum=300, random=random.random):
+        self.base = base
+        self.factor = factor
+        self.maximum = maximum
+        self.random = random
+
+    def delay(self, attempt):
+        return min(self.maximum, self.base * self.factor ** attempt) * self.random()
+
+
+def _fold(name):
+    return name.translate(CASEMAPPINGS['rfc1459'])
+
+
+class Session:
+    """
+    What we knew about a network the last time we were connected to it.
+
+    `channels` maps casefolded names to the names that were joined.
+    `capabilities` are those that the server acknowledged, or None if it never
+    replied to our request.
+    """
+    def __init__(self):
+        self.nick = None
+        self.channels = {}
+        self.capabilities = None
+
+    def join_messages(self):
+        """JOIN messages for every channel, with as many in each as will fit."""
+        messages = []
+        channels = []
+        # Leave room for "JOIN " and the line ending.
+        room = MAX_LENGTH - len(b'JOIN \r\n')
+        for name in sorted(self.channels.values()):
+            if channels and len(','.join(channels + [name]).encode('utf8')) > room:
+                messages.append(build_message(commands.JOIN, ','.join(channels)))
+                channels = []
+            channels.append(name)
+        if channels:
+            messages.append(build_message(commands.JOIN, ','.join(channels)))
+        return messages
+
+
+class Supervisor:
+    """
+    Keeps a Client connected to a network, reconnecting when it is lost.
+
+        supervisor = Supervisor(client, 'irc.example.com')
+        asyncio.Task(supervisor.run())
+
+    Each time the connection is lost (or can't be made, or ends with an
+    exception, eg: from a handler), the supervisor waits for a delay from
+    `backoff` and tries again. The delays grow with each failed attempt, and
+    start again from the shortest once a connection has got as far as
+    registering.
+
+    While connected, it remembers our nick, the channels we are in, and the
+    capabilities the server gave us in `session`. When it reconnects, it asks
+    for the same nick and capabilities, and rejoins all of the channels at
+    once as soon as we are registered. The time that this takes (from starting
+    to connect until every channel is joined) is kept in `stats`.
+
+    The supervisor adds itself to the start of the client's handlers.
+    """
+    command_filter = CommandFilter(allowed=(
+        commands.CAP,
+        commands.JOIN,
+        commands.KICK,
+        commands.NICK,
+        commands.PART,
+        commands.RPL_WELCOME,
+    ) + JOIN_ERRORS)
+
+    def __init__(self, client, host, backoff=None, **connection_kwargs):
+        self.client = client
+        self.host = host
+        self.backoff = backoff or Backoff()
+        self.connection_kwargs = connection_kwargs
+        self.connection = None
+        self.session = Session()
+        self.stats = {
+            'attempts': 0,
+            'connections': 0,
+            'last_downtime': None,
+            'last_time_to_operational': None,
+        }
+        self.operational = False
+        self._pending = {}
+        self._registered = False
+        self._started = None
+        self._lost = None
+        self._stopped = False
+        client.handlers = (self,) + tuple(client.handlers)
+
+    @asyncio.coroutine
+    def run(self):
+        """Connect, and reconnect whenever the connection is lost, until `stop`."""
+        loop = asyncio.get_event_loop()
+        attempt = 0
+        while not self._stopped:
+            self._connect(loop)
+            try:
+                yield from self.connection.connect()
+            except OSError as error:
+                logger.warning('Could not connect to %s: %s', self.host, error)
+            except Exception:
+                logger.exception('Connection to %s failed.', self.host)
+            if getattr(self.connection, '_connected', False):
+                self.connection.disconnect()
+            if self._stopped:
+                break
+
+            if self._registered:
+                attempt = 0
+                self._lost = loop.time()
+            self.operational = False
+            delay = self.backoff.delay(attempt)
+            attempt += 1
+            logger.info('Reconnecting to %s in %.1f seconds.', self.host, delay)
+            yield from asyncio.sleep(delay)
+
+    def stop(self):
+        """Disconnect, and don't reconnect."""
+        self._stopped = True
+        if getattr(self.connection, '_connected', False):
+            self.connection.disconnect()
+
+    def _connect(self, loop):
+        """Make a new connection, primed with what we know from the session."""
+        session = self.session
+        kwargs = dict(self.connection_kwargs)
+        if session.capabilities is not None:
+            kwargs['capabilities'] = tuple(sorted(session.capabilities))
+        if session.nick is not None:
+            kwargs['nick'] = session.nick
+
+        if self.connection in self.client.connections:
+            self.client.connections.remove(self.connection)
+        self.connection = self.client.connection_class(
+            client=self.client, host=self.host, **kwargs)
+        self.client.connections.append(self.connection)
+        self.stats['attempts'] += 1
+        self._registered = False
+        self._started = loop.time()
+
+    def _now_operational(self):
+        self.operational = True
+        now = asyncio.get_event_loop().time()
+        self.stats['last_time_to_operational'] = now - self._started
+        if self._lost is not None:
+            self.stats['last_downtime'] = now - self._lost
+        logger.info(
+            'Back on %s in %.3f seconds.',
+            self.host, self.stats['last_time_to_operational'],
+        )
+
+    def __call__(self, client, message):
+        if getattr(message, 'connection', None) is not self.connection:
+            return  # Another network's business.
+
+        command = message.command
+        if command == commands.RPL_WELCOME:
+            self.on_welcome(message)
+        elif command in JOIN_ERRORS:
+            self._pending.pop(_fold(message.params[1]), None)
+            self.session.channels.pop(_fold(message.params[1]), None)
+            self._check_operational()
+        elif command == commands.CAP:
+            self.on_cap(message)
+        else:
+            self.on_user_change(client, message)
+
+    def on_welcome(self, message):
+        """Registered: rejoin every channel from the last session in one go."""
+        self.stats['connections'] += 1
+        self._registered = True
+        self.session.nick = self.connection.nick = message.params[0]
+        self._pending = dict(self.session.channels)
+        for join in self.session.join_messages():
+            self.connection.send(join)
+        self._check_operational()
+
+    def on_cap(self, message):
+        subcommand = message.params[1] if len(message.params) > 1 else ''
+        capabilities = set(to_unicode(message.suffix).split())
+        if subcommand == 'ACK':
+            if self.session.capabilities is None:
+                self.session.capabilities = set()
+            self.session.capabilities |= capabilities
+        elif subcommand == 'NAK' and self.session.capabilities is not None:
+            self.session.capabilities -= capabilities
+
+    def on_user_change(self, client, message):
+        """Follow our own nick, and the channels we are in."""
+        nick = message.prefix.split('!', 1)[0]
+        me = client.current_nick(self.connection)
+        if _fold(nick) != _fold(me) and message.command != commands.KICK:
+            return
+
+        if message.command == commands.NICK:
+            new_nick = message.params[0] if message.params else to_unicode(message.suffix)
+            self.session.nick = self.connection.nick = new_nick
+        elif message.command == commands.JOIN:
+            name = message.params[0] if message.params else to_unicode(message.suffix)
+            self.session.channels[_fold(name)] = name
+            self._pending.pop(_fold(name), None)
+            self._check_operational()
+        elif message.command == commands.PART:
+            self.session.channels.pop(_fold(message.params[0]), None)
+        elif _fold(message.params[1]) == _fold(me):  # KICK
+            self.session.channels.pop(_fold(message.params[0]), None)
+
+    def _check_operational(self):
+        if self._registered and not self.operational and not self._pending:
+            self._now_operational()
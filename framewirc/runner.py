@@ -0,0 +1,176 @@
+import asyncio
+import multiprocessing
+
+from . import commands, filters
+from .message import build_message
+
+
+@filters.allow(commands.RPL_WELCOME)
+def _registered(client, message):
+    """Once registered on a network, join the channels waiting for it."""
+    connection = client.connection
+    connection.registered = True
+    for channel in connection.channels:
+        connection.send(build_message(commands.JOIN, channel))
+
+
+class Worker:
+    """
+    Runs a Client in a worker process, taking orders from a ShardedRunner.
+
+    Orders arrive as tuples on `control`, a multiprocessing Connection:
+
+        ('connect', host, kwargs)
+        ('join', channel, host)  # host may be None for all connections
+        ('part', channel, host)
+        ('stats',)
+        ('stop',)
+
+    Stats are sent back on `control`.
+    """
+    def __init__(self, index, control, client_factory):
+        self.index = index
+        self.control = control
+        self.client = client_factory(index)
+        self.client.handlers = (_registered, self.count) + tuple(self.client.handlers)
+        self.messages = 0
+
+    def count(self, client, message):
+        self.messages += 1
+
+    def run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.add_reader(self.control.fileno(), self.on_control)
+        loop.run_forever()
+        loop.close()
+
+    def on_control(self):
+        order, *args = self.control.recv()
+        getattr(self, 'do_' + order)(*args)
+
+    def _connections(self, host):
+        return [c for c in self.client.connections if host in (None, c.host)]
+
+    def do_connect(self, host, kwargs):
+        self.client.connect_to(host, **kwargs)
+        connection = self.client.connection
+        connection.channels = set()
+        connection.registered = False
+
+    def do_join(self, channel, host):
+        for connection in self._connections(host):
+            connection.channels.add(channel)
+            if connection.registered:
+                connection.send(build_message(commands.JOIN, channel))
+
+    def do_part(self, channel, host):
+        for connection in self._connections(host):
+            connection.channels.discard(channel)
+            if connection.registered:
+                connection.send(build_message(commands.PART, channel))
+
+    def do_stats(self):
+        self.control.send({
+            'worker': self.index,
+            'connections': len(self.client.connections),
+            'channels': sum(len(c.channels) for c in self.client.connections),
+            'messages': self.messages,
+            'messages_written': sum(
+                c.send_stats['messages_written'] for c in self.client.connections),
+        })
+
+    def do_stop(self):
+        for connection in self.client.connections:
+            if getattr(connection, '_connected', False):
+                connection.disconnect()
+        asyncio.get_event_loop().stop()
+
+
+def _run_worker(index, control, client_factory):
+    Worker(index, control, client_factory).run()
+
+
+class ShardedRunner:
+    """
+    Spreads channels (or whole connections) across worker processes.
+
+    Each worker process runs its own event loop, with a Client made by
+    `client_factory(worker_index)`. The factory must be picklable (eg: a
+    module-level function), and should give each worker its own nick:
+
+        def make_client(index):
+            return MyClient(nick='mybot{}'.format(index))
+
+        runner = ShardedRunner(make_client, workers=4)
+        runner.start()
+        runner.connect('irc.example.com')  # Every worker connects.
+        for channel in channels:
+            runner.join(channel)  # Each channel is joined by one worker.
+
+    Channels go to the worker with the fewest channels. `stats()` gathers
+    statistics from every worker.
+    """
+    def __init__(self, client_factory, workers=None):
+        self.client_factory = client_factory
+        self.worker_count = workers or multiprocessing.cpu_count()
+        self.assignments = {}  # channel: worker index
+        self.processes = []
+        self.controls = []
+
+    def start(self):
+        """Start the worker processes."""
+        for index in range(self.worker_count):
+            control, worker_control = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_run_worker,
+                args=(index, worker_control, self.client_factory),
+                daemon=True,
+            )
+            process.start()
+            self.processes.append(process)
+            self.controls.append(control)
+
+    def connect(self, host, worker=None, **kwargs):
+        """Connect every worker (or just one) to `host`."""
+        workers = range(self.worker_count) if worker is None else [worker]
+        for index in workers:
+            self.controls[index].send(('connect', host, kwargs))
+
+    def assign(self, channel):
+        """Choose the worker for a channel. Channels stay where they are put."""
+        if channel not in self.assignments:
+            loads = [0] * self.worker_count
+            for index in self.assignments.values():
+                loads[index] += 1
+            self.assignments[channel] = loads.index(min(loads))
+        return self.assignments[channel]
+
+    def join(self, channel, host=None):
+        """Join a channel from the worker assigned to it."""
+        self.controls[self.assign(channel)].send(('join', channel, host))
+
+    def part(self, channel, host=None):
+        """Leave a channel, and forget which worker it was assigned to."""
+        index = self.assignments.pop(channel, None)
+        if index is not None:
+            self.controls[index].send(('part', channel, host))
+
+    def stats(self):
+        """Statistics for each worker, and totalled across all of them."""
+        for control in self.controls:
+            control.send(('stats',))
+        workers = [control.recv() for control in self.controls]
+        total = {}
+        for stats in workers:
+            for key, value in stats.items():
+                if key != 'worker':
+                    total[key] = total.get(key, 0) + value
+        return {'workers': workers, 'total': total}
+
+    def stop(self):
+        """Disconnect every worker, and wait for them to finish."""
+        for control in self.controls:
+            control.send(('stop',))
+        for process in self.processes:
+            process.join()
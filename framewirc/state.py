@@ -0,0 +1,279 @@
+import sys
+
+from . import commands
+from .filters import CommandFilter
+from .parsers import nick as parse_nick
+from .utils import to_unicode
+
+
+# Upper and lower case letters, as defined by each CASEMAPPING.
+CASEMAPPINGS = {
+    'ascii': str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'),
+    'rfc1459': str.maketrans(
+        'ABCDEFGHIJKLMNOPQRSTUVWXYZ[]\\~', 'abcdefghijklmnopqrstuvwxyz{}|^'),
+    'strict-rfc1459': str.maketrans(
+        'ABCDEFGHIJKLMNOPQRSTUVWXYZ[]\\', 'abcdefghijklmnopqrstuvwxyz{}|'),
+}
+
+# Channel membership prefixes that may come before nicks in RPL_NAMREPLY.
+MEMBERSHIP_PREFIXES = '~&@%+'
+
+
+class User:
+    """A user, shared between all of the channels they are in."""
+    __slots__ = ('nick', 'ident', 'host', 'channels')
+
+    def __init__(self, nick, ident=None, host=None):
+        self.nick = nick
+        self.ident = ident
+        self.host = host
+        self.channels = set()
+
+    def __repr__(self):
+        return '<User {}>'.format(self.nick)
+
+
+class Channel:
+    """
+    A channel, and the users in it.
+
+    `users` maps casefolded nicks to Users. Only users with membership
+    prefixes (eg: '@' for ops) appear in `prefixes`.
+    """
+    __slots__ = ('name', 'users', 'prefixes')
+
+    def __init__(self, name):
+        self.name = name
+        self.users = {}
+        self.prefixes = {}
+
+    def __repr__(self):
+        return '<Channel {}>'.format(self.name)
+
+
+class StateTracker:
+    """
+    Keeps track of the channels we are in, and who else is in them.
+
+    Add an instance to a Client's handlers to keep it up to date:
+
+        tracker = StateTracker()
+
+        class MyClient(Client):
+            handlers = basic_handlers + (tracker,)
+            batch_handlers = (tracker.handle_batch,)
+
+    Nicks are interned, and each user is stored once however many channels
+    they share with us. Names are compared using the server's CASEMAPPING.
+
+    A tracker follows one network: its `connection`, or else the first one
+    that it hears from. Messages from other connections are ignored, so a
+    Client on many networks needs a tracker for each:
+
+        for connection in client.connections:
+            tracker = StateTracker(connection=connection)
+            client.handlers = tuple(client.handlers) + (tracker,)
+            client.batch_handlers = tuple(client.batch_handlers) + (tracker.handle_batch,)
+    """
+    command_filter = CommandFilter(allowed=(
+        commands.JOIN,
+        commands.KICK,
+        commands.NICK,
+        commands.PART,
+        commands.QUIT,
+        commands.RPL_ISUPPORT,
+        commands.RPL_NAMREPLY,
+    ))
+
+    def __init__(self, casemapping='rfc1459', connection=None):
+        self.casemapping = casemapping
+        self.connection = connection
+        self.channels = {}
+        self.users = {}
+
+    def fold(self, name):
+        """The case-insensitive form of a nick or channel name."""
+        return sys.intern(name.translate(CASEMAPPINGS[self.casemapping]))
+
+    def __call__(self, client, message):
+        if not self._follows(getattr(message, 'connection', None)):
+            return  # Another network's business.
+        handle = self._handlers.get(message.command)
+        if handle is not None:
+            handle(self, client, message)
+
+    def handle_batch(self, client, batch):
+        """
+        Update from every line of an IRCv3 batch (eg: a netsplit) at once.
+
+        Add this to the Client's `batch_handlers`, as lines in batches are not
+        passed to the usual handlers.
+        """
+        if not self._follows(batch.connection):
+            return
+        handlers = self._handlers
+        for message in batch:
+            handle = handlers.get(message.command)
+            if handle is not None:
+                handle(self, client, message)
+
+    # Queries
+
+    def channel(self, name):
+        """Get a Channel by name, or None if we are not in it."""
+        return self.channels.get(self.fold(name))
+
+    def user(self, nick):
+        """Get a User by nick, or None if we share no channels with them."""
+        return self.users.get(self.fold(nick))
+
+    def is_on(self, nick, channel):
+        """Is the user in the channel?"""
+        channel = self.channel(channel)
+        return channel is not None and self.fold(nick) in channel.users
+
+    def memory_usage(self):
+        """Approximate bytes used by the tracked state, and object counts."""
+        size = sys.getsizeof
+        total = size(self.channels) + size(self.users)
+        memberships = 0
+        for channel in self.channels.values():
+            total += size(channel) + size(channel.users) + size(channel.prefixes)
+            memberships += len(channel.users)
+        for key, user in self.users.items():
+            total += size(user) + size(user.channels) + size(key)
+            if user.nick is not key:
+                total += size(user.nick)
+        return {
+            'bytes': total,
+            'channels': len(self.channels),
+            'memberships': memberships,
+            'users': len(self.users),
+        }
+
+    # Updating
+
+    def _follows(self, connection):
+        if self.connection is None and connection is not None:
+            self.connection = connection
+        return connection is self.connection
+
+    def _get_user(self, nick, ident=None, host=None):
+        key = self.fold(nick)
+        user = self.users.get(key)
+        if user is None:
+            user = self.users[key] = User(sys.intern(nick), ident, host)
+        elif host is not None:
+            user.ident, user.host = ident, host
+        return key, user
+
+    def _add(self, channel, nick, ident=None, host=None, prefix=''):
+        key, user = self._get_user(nick, ident, host)
+        channel.users[key] = user
+        if prefix:
+            channel.prefixes[key] = prefix
+        user.channels.add(channel)
+
+    def _remove(self, channel, key):
+        user = channel.users.pop(key, None)
+        channel.prefixes.pop(key, None)
+        if user is not None:
+            user.channels.discard(channel)
+            if not user.channels:
+                del self.users[key]
+
+    def _sender(self, message):
+        if '!' in message.prefix:
+            parts = parse_nick(message.prefix)
+            return parts['nick'], parts['ident'], parts['host']
+        return message.prefix, None, None
+
+    def _target(self, message):
+        """The first param, which some servers send as the suffix."""
+        if message.params:
+            return message.params[0]
+        return to_unicode(message.suffix)
+
+    def _is_me(self, client, nick):
+        return self.fold(nick) == self.fold(client.current_nick(self.connection))
+
+    def on_isupport(self, client, message):
+        """Fold names as the server does."""
+        casemapping = message.connection.isupport.casemapping
+        if casemapping in CASEMAPPINGS:
+            self.casemapping = casemapping
+
+    def on_names(self, client, message):
+        channel = self.channels.get(self.fold(message.params[-1]))
+        if channel is None:
+            return
+        for name in to_unicode(message.suffix).split():
+            nick = name.lstrip(MEMBERSHIP_PREFIXES)
+            prefix = name[:len(name) - len(nick)]
+            ident = host = None
+            if '!' in nick:  # userhost-in-names
+                parts = parse_nick(nick)
+                nick, ident, host = parts['nick'], parts['ident'], parts['host']
+            self._add(channel, nick, ident, host, prefix)
+
+    def on_join(self, client, message):
+        nick, ident, host = self._sender(message)
+        name = self._target(message)
+        key = self.fold(name)
+        if self._is_me(client, nick):
+            # Forget anyone left over from a channel we never saw ourselves leave.
+            self._leave(client, name, nick)
+            self.channels[key] = Channel(sys.intern(name))
+        channel = self.channels.get(key)
+        if channel is not None:
+            self._add(channel, nick, ident, host)
+
+    def _leave(self, client, channel_name, nick):
+        channel = self.channels.get(self.fold(channel_name))
+        if channel is None:
+            return
+        if self._is_me(client, nick):
+            for key in list(channel.users):
+                self._remove(channel, key)
+            del self.channels[self.fold(channel_name)]
+        else:
+            self._remove(channel, self.fold(nick))
+
+    def on_part(self, client, message):
+        self._leave(client, self._target(message), self._sender(message)[0])
+
+    def on_kick(self, client, message):
+        self._leave(client, message.params[0], message.params[1])
+
+    def on_quit(self, client, message):
+        key = self.fold(self._sender(message)[0])
+        user = self.users.get(key)
+        if user is not None:
+            for channel in list(user.channels):
+                self._remove(channel, key)
+
+    def on_nick(self, client, message):
+        old_key = self.fold(self._sender(message)[0])
+        user = self.users.pop(old_key, None)
+        if user is None:
+            return
+        new_nick = self._target(message)
+        new_key = self.fold(new_nick)
+        user.nick = sys.intern(new_nick)
+        self.users[new_key] = user
+        for channel in user.channels:
+            del channel.users[old_key]
+            channel.users[new_key] = user
+            prefix = channel.prefixes.pop(old_key, None)
+            if prefix:
+                channel.prefixes[new_key] = prefix
+
+    _handlers = {
+        commands.JOIN: on_join,
+        commands.KICK: on_kick,
+        commands.NICK: on_nick,
+        commands.PART: on_part,
+        commands.QUIT: on_quit,
+        commands.RPL_ISUPPORT: on_isupport,
+        commands.RPL_NAMREPLY: on_names,
+    }
@@ -1,8 +1,8 @@
-from collections import deque
+from collections import OrderedDict
 
 import cchardet
 
-from . import exceptions
+from . import exceptions, metrics
 
 
 LINEFEED = b'\r\n'
@@ -45,24 +45,130 @@ class RequiredAttributesMixin:
             raise exceptions.MissingAttributes(missing_attrs)
 
 
-def to_unicode(bytestring, encodings=('utf8',)):
-    """Try to convert a string of bytes into a unicode string."""
-    # If we already have a unicode string, just return it.
-    if isinstance(bytestring, str):
-        return bytestring
-
+def _decode(bytestring, encodings):
+    """Decode with the first of `encodings` that works, or return None."""
     # Try each of the encodings until no error is thrown.
-    for encoding in encodings:
+    for position, encoding in enumerate(encodings):
         try:
-            return bytestring.decode(encoding)
+            text = bytestring.decode(encoding)
         except UnicodeDecodeError:
             continue
+        if position > 0:
+            _count_fallback(encoding)
+        return text
+    return None
+
 
+def _guess(bytestring):
+    """Decode with a guessed encoding, and say which encoding was used."""
     # Try to guess the encoding. If that doesn't work use utf8.
     encoding = cchardet.detect(bytestring)['encoding'] or 'utf8'
+    _count_fallback(encoding)
 
     # As everything else failed, be more lenient with errors.
-    return bytestring.decode(encoding, errors='surrogateescape')
+    return bytestring.decode(encoding, errors='surrogateescape'), encoding
+
+
+def _count_fallback(encoding):
+    metrics.sink.increment(
+        'framewirc_encoding_fallbacks_total', labels=(('encoding', encoding),))
+
+
+def to_unicode(bytestring, encodings=('utf8',)):
+    """Try to convert a string of bytes into a unicode string."""
+    # If we already have a unicode string, just return it.
+    if isinstance(bytestring, str):
+        return bytestring
+
+    text = _decode(bytestring, encodings)
+    if text is None:
+        text = _guess(bytestring)[0]
+    return text
+
+
+class LRUCache:
+    """
+    A mapping that forgets its least recently used keys past `maxsize`.
+
+    Counts its hits, misses, and evictions.
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        """Get the value for `key`, and mark it as recently used."""
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def stats(self):
+        return {
+            'evictions': self.evictions,
+            'hits': self.hits,
+            'maxsize': self.maxsize,
+            'misses': self.misses,
+            'size': len(self.data),
+        }
+
+
+class EncodingCache(LRUCache):
+    """
+    Remember the encoding that was guessed for each sender (or channel).
+
+    When none of the preferred encodings work, `to_unicode` asks `cchardet`
+    to guess, which is slow. This remembers the guess, and uses it in place
+    of asking again next time:
+
+        encodings = EncodingCache(maxsize=10000)
+        body = encodings.to_unicode(sender_nick, raw_body)
+
+    The preferred encodings are always tried first, so a sender who goes back
+    to one of them is decoded correctly. Only guesses are remembered, so that
+    the common case takes no space.
+    """
+    def to_unicode(self, key, bytestring, encodings=('utf8',)):
+        """Like `utils.to_unicode`, using the guess remembered for `key`."""
+        if isinstance(bytestring, str):
+            return bytestring
+
+        text = _decode(bytestring, encodings)
+        if text is not None:
+            return text
+
+        encoding = self.get(key)
+        if encoding is not None:
+            try:
+                text = bytestring.decode(encoding)
+            except UnicodeDecodeError:
+                pass
+            else:
+                _count_fallback(encoding)
+                return text
+
+        text, self[key] = _guess(bytestring)
+        return text
 
 
 def to_bytes(string):
@@ -75,43 +181,42 @@ def to_bytes(string):
 
 
 def _chunk_message(message, max_length):
-    # Split the message on linebreaks, and loop over lines.
-    lines = deque(message.splitlines())
-    while lines:
-        line = lines.popleft()
-        line_bytes = to_bytes(line)
-        # If the line fits, add it the the lines.
-        if len(line_bytes) < max_length:
-            yield line_bytes
-            continue
-
-        # Whole line doesn't fit, so see if it can be split on space.
-        letterpoint = None  # Where we should break if there is no space
-        spacepoint = None  # Where we should break if there is a space.
-        line_length = 0  # The running total size of the line
-        for i, str_char in enumerate(line):
-            char_length = len(to_bytes(str_char))
-            line_length += char_length
-            if str_char == ' ':
-                spacepoint = i
-            if line_length > max_length:
-                letterpoint = i
+    # Split the message on linebreaks, and encode each line once.
+    for line in message.splitlines():
+        line = to_bytes(line)
+        start = 0
+        end = len(line)
+        while True:
+            # If the rest of the line fits, add it to the lines.
+            if end - start < max_length:
+                yield line[start:]
                 break
 
-        if spacepoint is not None:
-            # Break on the last space that fits.
-            start = line[:spacepoint]
-            yield to_bytes(start)
-            # ... and add what's left back into the line pool.
-            end = line[(spacepoint + 1):]
-            lines.appendleft(end)
-            continue
-
-        # Whole line does not contain spaces, so split within word.
-        start = line[:letterpoint]
-        yield to_bytes(start)
-        end = line[letterpoint:]
-        lines.appendleft(end)
+            if end - start == max_length:
+                # Fits exactly, so only break on a space if there is one.
+                overflow = None
+                space = line.rfind(b' ', start, end)
+            else:
+                # Find the first char that doesn't fit by stepping back from
+                # the byte past the limit over any UTF-8 continuation bytes.
+                overflow = start + max_length
+                while line[overflow] & 0xC0 == 0x80:
+                    overflow -= 1
+                # The overflowing char is considered: a space there is fine.
+                space = line.rfind(b' ', start, overflow + 1)
+
+            if space != -1:
+                # Break on the last space that fits, dropping the space.
+                yield line[start:space]
+                start = space + 1
+            elif overflow is None or overflow == start:
+                # No space, and no way to split within the word.
+                yield line[start:]
+                break
+            else:
+                # Whole line does not contain spaces, so split within word.
+                yield line[start:overflow]
+                start = overflow
 
 
 def chunk_message(message, max_length):
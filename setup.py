@@ -24,7 +24,7 @@ setup(
         'cchardet>=0.3.5,<2',
     ],
     name='framewirc',
-    packages=find_packages(exclude=['tests']),
+    packages=find_packages(exclude=['benchmarks', 'tests']),
     url='https://github.com/meshy/framewirc/',
     version=version,
 )
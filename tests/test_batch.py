@@ -0,0 +1,97 @@
+from unittest import mock, TestCase
+
+from framewirc import batch, filters
+from framewirc.connection import Connection
+
+from .utils import BlankClient
+
+
+class BatchTestCase(TestCase):
+    def setUp(self):
+        self.handler = mock.Mock()
+        self.batch_handler = mock.Mock()
+        self.client = BlankClient(
+            handlers=[self.handler],
+            batch_handlers=[self.batch_handler],
+        )
+        self.connection = Connection(client=self.client, host='example.com')
+
+    def receive(self, *lines):
+        for line in lines:
+            self.connection.handle(line + b'\r\n')
+
+
+class TestBatch(BatchTestCase):
+    def test_collected(self):
+        """Lines in a batch are passed to batch handlers when it ends."""
+        self.receive(
+            b':irc.example.com BATCH +yXNAbvnRHTRBv netsplit irc.hub other.host',
+            b'@batch=yXNAbvnRHTRBv :aji!a@a QUIT :irc.hub other.host',
+            b'@batch=yXNAbvnRHTRBv :nenolod!a@a QUIT :irc.hub other.host',
+        )
+        self.assertFalse(self.batch_handler.called)
+
+        self.receive(b':irc.example.com BATCH -yXNAbvnRHTRBv')
+
+        self.batch_handler.assert_called_once_with(self.client, mock.ANY)
+        collected = self.batch_handler.call_args[0][1]
+        self.assertEqual(collected.type, 'netsplit')
+        self.assertEqual(collected.params, ('irc.hub', 'other.host'))
+        self.assertIs(collected.connection, self.connection)
+        self.assertEqual([m.prefix for m in collected], ['aji!a@a', 'nenolod!a@a'])
+
+    def test_not_passed_to_handlers(self):
+        """Handlers don't see BATCH commands, or lines in batches."""
+        self.receive(
+            b'BATCH +abc chathistory #chan',
+            b'@batch=abc :nick!a@a PRIVMSG #chan :old',
+            b'BATCH -abc',
+        )
+        self.assertFalse(self.handler.called)
+
+    def test_outside_batch(self):
+        """Tagged lines not in an open batch are handled as usual."""
+        self.receive(b'@batch=unknown;msgid=x PING :server', b'@msgid=y PING :server')
+        self.assertEqual(self.handler.call_count, 2)
+
+    def test_nested(self):
+        """Nested batches are delivered with the outer batch."""
+        self.receive(
+            b'BATCH +outer example.com/outer',
+            b'@batch=outer BATCH +inner example.com/inner',
+            b'@batch=inner :nick!a@a PRIVMSG #chan :inner',
+            b'@batch=outer :nick!a@a PRIVMSG #chan :outer',
+            b'@batch=outer BATCH -inner',
+        )
+        self.assertFalse(self.batch_handler.called)
+
+        self.receive(b'BATCH -outer')
+
+        outer = self.batch_handler.call_args[0][1]
+        [inner] = outer.batches
+        self.assertEqual(inner.type, 'example.com/inner')
+        self.assertEqual([m.suffix for m in outer], [b'outer', b'inner'])
+
+    def test_disconnect(self):
+        """Open batches are forgotten when the connection closes."""
+        self.connection.writer = mock.Mock()
+        self.receive(b'BATCH +abc netjoin')
+        self.connection.disconnect()
+        self.assertEqual(self.connection.batches.open, {})
+
+
+class TestPerLine(BatchTestCase):
+    def test_per_line(self):
+        """Handlers marked per_line also get each line in a batch."""
+        per_line_handler = mock.Mock()
+        per_line = batch.per_line(filters.allow('PRIVMSG')(per_line_handler))
+        self.client.handlers = [self.handler, per_line]
+
+        self.receive(
+            b'BATCH +abc chathistory #chan',
+            b'@batch=abc :nick!a@a PRIVMSG #chan :old',
+        )
+
+        self.assertFalse(self.handler.called)
+        message = per_line_handler.call_args[1]['message']
+        self.assertEqual(message.batch.reference, 'abc')
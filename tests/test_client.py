@@ -1,12 +1,12 @@
 import asyncio
 from unittest import mock, TestCase
 
-from framewirc import exceptions
+from framewirc import concurrency, exceptions, filters, handlers
 from framewirc.client import Client
 from framewirc.connection import Connection
 from framewirc.message import ReceivedMessage
 
-from .utils import BlankClient
+from .utils import BlankClient, EventLoopMixin, mock_connection
 
 
 class TestConnectTo(TestCase):
@@ -17,6 +17,16 @@ class TestConnectTo(TestCase):
             client.connect_to('irc.example.com')
         self.assertIsInstance(client.connection, Connection)
 
+    def test_many_connections(self):
+        """Every connection is kept in the pool."""
+        client = BlankClient()
+        with mock.patch('asyncio.Task', spec=asyncio.Task):
+            client.connect_to('irc.example.com')
+            first = client.connection
+            client.connect_to('irc.example.org')
+        self.assertEqual(client.connections, [first, client.connection])
+        self.assertNotEqual(first, client.connection)
+
     def test_task_returned(self):
         """Is the correct "Task" created and returned?"""
         client = BlankClient()
@@ -36,6 +46,162 @@ class TestOnMessage(TestCase):
 
         handler.assert_called_with(client, message)
 
+    def test_replies_routed(self):
+        """Replies go to the connection that the message came from."""
+        client = BlankClient(handlers=[handlers.ping])
+        client.connection = mock_connection()
+        origin = mock_connection()
+        message = ReceivedMessage(b'PING :irc.example.com\r\n')
+        message.connection = origin
+
+        client.on_message(message)
+
+        origin.send.assert_called_once_with(b'PONG :irc.example.com\r\n')
+
+    def test_filtered_handlers_skipped(self):
+        """Handlers that do not accept the command are not called."""
+        inner = mock.MagicMock()
+        handler = filters.allow('OTHER')(inner)
+        client = BlankClient(handlers=[handler])
+
+        client.on_message(ReceivedMessage(b'TEST message\r\n'))
+
+        self.assertFalse(inner.called)
+
+    def test_handlers_replaced(self):
+        """Replacing the handlers rebuilds the dispatch table."""
+        client = BlankClient(handlers=[])
+        client.on_message(ReceivedMessage(b'TEST message\r\n'))
+        handler = mock.MagicMock()
+        client.handlers = [handler]
+
+        client.on_message(ReceivedMessage(b'TEST message\r\n'))
+
+        self.assertTrue(handler.called)
+
+    def test_reindex_handlers(self):
+        """Handlers added in place are found after reindex_handlers()."""
+        client = BlankClient(handlers=[])
+        client.on_message(ReceivedMessage(b'TEST message\r\n'))
+        handler = mock.MagicMock()
+        client.handlers.append(handler)
+
+        client.reindex_handlers()
+        client.on_message(ReceivedMessage(b'TEST message\r\n'))
+
+        self.assertTrue(handler.called)
+
+
+class TestCoroutineHandlers(EventLoopMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.events = []
+        self.message = ReceivedMessage(b'TEST message\r\n')
+
+    def run_handlers(self, client, *messages):
+        """Handle some messages, and wait until the handlers are finished."""
+        for message in messages:
+            client.on_message(message)
+        self.loop.run_until_complete(asyncio.gather(*client.handler_tasks))
+
+    def slow_handler(self, name, delay=0.01):
+        @asyncio.coroutine
+        def handler(client, message):
+            self.events.append(('start', name, message.params))
+            yield from asyncio.sleep(delay)
+            self.events.append(('end', name, message.params))
+        return handler
+
+    def test_not_blocking(self):
+        """Coroutine handlers do not hold up other handlers."""
+        client = BlankClient(handlers=[
+            self.slow_handler('slow'),
+            lambda client, message: self.events.append(('sync',)),
+        ])
+        client.on_message(self.message)
+        self.assertEqual(self.events, [('sync',)])
+
+        self.run_handlers(client)
+        self.assertEqual(self.events[1:], [
+            ('start', 'slow', ('message',)),
+            ('end', 'slow', ('message',)),
+        ])
+
+    def test_filtered(self):
+        """Coroutine handlers can be filtered."""
+        handler = filters.allow('TEST')(self.slow_handler('slow'))
+        client = BlankClient(handlers=[handler])
+        self.run_handlers(client, self.message)
+        self.assertEqual(len(self.events), 2)
+
+    def test_max_concurrent_handlers(self):
+        """No more than max_concurrent_handlers run at once."""
+        client = BlankClient(
+            handlers=[self.slow_handler('a'), self.slow_handler('b')],
+            max_concurrent_handlers=1,
+        )
+        self.run_handlers(client, self.message)
+        self.assertEqual([event[0] for event in self.events], ['start', 'end'] * 2)
+
+    def test_timeout(self):
+        """Handlers are cancelled after handler_timeout."""
+        client = BlankClient(handlers=[self.slow_handler('slow', delay=10)])
+        client.handler_timeout = 0.01
+        with self.assertLogs('framewirc.client', 'WARNING'):
+            self.run_handlers(client, self.message)
+        self.assertEqual(self.events, [('start', 'slow', ('message',))])
+
+    def test_handler_timeout(self):
+        """A handler's own timeout overrides the client's."""
+        handler = concurrency.timeout(0.01)(self.slow_handler('slow', delay=10))
+        client = BlankClient(handlers=[handler])
+        with self.assertLogs('framewirc.client', 'WARNING'):
+            self.run_handlers(client, self.message)
+
+    def test_exception_logged(self):
+        @asyncio.coroutine
+        def broken(client, message):
+            raise ValueError
+        client = BlankClient(handlers=[broken])
+        with self.assertLogs('framewirc.client', 'ERROR'):
+            self.run_handlers(client, self.message)
+
+    def test_ordered(self):
+        """Calls to an ordered handler run one at a time, in order."""
+        handler = concurrency.ordered(self.slow_handler('slow'))
+        client = BlankClient(handlers=[handler])
+        first = ReceivedMessage(b'TEST first\r\n')
+        second = ReceivedMessage(b'TEST second\r\n')
+
+        self.run_handlers(client, first, second)
+
+        self.assertEqual(self.events, [
+            ('start', 'slow', ('first',)),
+            ('end', 'slow', ('first',)),
+            ('start', 'slow', ('second',)),
+            ('end', 'slow', ('second',)),
+        ])
+
+    def test_cancelled_while_waiting(self):
+        """An ordered handler cancelled before its turn doesn't keep the lock."""
+        handler = concurrency.ordered(self.slow_handler('ordered'))
+        client = BlankClient(
+            handlers=[self.slow_handler('other'), handler],
+            max_concurrent_handlers=1,
+        )
+        client.on_message(self.message)
+        self.loop.run_until_complete(asyncio.sleep(0))
+
+        for task in client.handler_tasks:
+            task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            self.loop.run_until_complete(asyncio.gather(*client.handler_tasks))
+
+        self.assertFalse(client._handler_locks[handler].locked())
+        client.handlers = [handler]
+        self.run_handlers(client, self.message)
+        self.assertEqual(self.events[-1], ('end', 'ordered', ('message',)))
+
 
 class TestOnConnect(TestCase):
     def setUp(self):
@@ -45,7 +211,8 @@ class TestOnConnect(TestCase):
             nick='anick',
             real_name='Real Name',
         )
-        self.client.connection = mock.MagicMock(spec=Connection)
+        self.client.connection = mock_connection()
+        self.client.connection.capabilities = None
 
     def test_user_command_sent(self):
         self.client.on_connect()
@@ -57,11 +224,32 @@ class TestOnConnect(TestCase):
         expected = b'NICK anick\r\n'
         self.client.connection.send.assert_called_with(expected)
 
+    def test_capabilities(self):
+        """Capabilities are requested around registration."""
+        self.client.capabilities = ('batch', 'message-tags')
+        self.client.on_connect()
+
+        sent = [c[0][0] for c in self.client.connection.send.call_args_list]
+        self.assertEqual(sent, [
+            b'CAP REQ :batch message-tags\r\n',
+            b'USER anick 0 * :Real Name\r\n',
+            b'NICK anick\r\n',
+            b'CAP END\r\n',
+        ])
+
+    def test_connection_capabilities(self):
+        """A connection's own capabilities take precedence."""
+        self.client.capabilities = ('batch', 'message-tags')
+        self.client.connection.capabilities = ('batch',)
+        self.client.on_connect()
+
+        self.client.connection.send.assert_any_call(b'CAP REQ :batch\r\n')
+
 
 class TestPrivmsg(TestCase):
     def test_simple_message(self):
         client = BlankClient()
-        client.connection = mock.MagicMock(spec=Connection)
+        client.connection = mock_connection()
         client.privmsg('#channel', 'Morning, everyone.')
 
         expected = [b'PRIVMSG #channel :Morning, everyone.\r\n']
@@ -69,7 +257,7 @@ class TestPrivmsg(TestCase):
 
     def test_multiline_message(self):
         client = BlankClient()
-        client.connection = mock.MagicMock(spec=Connection)
+        client.connection = mock_connection()
         client.privmsg('#channel', 'Multi\r\nline\r\nmessage.')
 
         expected = [
@@ -79,6 +267,69 @@ class TestPrivmsg(TestCase):
         ]
         client.connection.send_batch.assert_called_once_with(expected)
 
+    def test_other_connection(self):
+        client = BlankClient()
+        client.connection = mock_connection()
+        other = mock_connection()
+        client.privmsg('#channel', 'Over here!', connection=other)
+
+        expected = [b'PRIVMSG #channel :Over here!\r\n']
+        other.send_batch.assert_called_once_with(expected)
+        self.assertFalse(client.connection.send_batch.called)
+
+    def test_line_length(self):
+        """Messages are split at the server's LINELEN."""
+        client = BlankClient()
+        client.connection = mock_connection()
+        client.connection.isupport.tokens['LINELEN'] = '1024'
+        client.privmsg('#channel', 'x' * 1000)
+
+        expected = [b'PRIVMSG #channel :' + b'x' * 1000 + b'\r\n']
+        client.connection.send_batch.assert_called_once_with(expected)
+
+
+class TestBroadcast(TestCase):
+    def setUp(self):
+        self.client = BlankClient()
+        self.client.connection = mock_connection()
+        self.isupport = self.client.connection.isupport
+
+    def test_one_target_each(self):
+        """Without TARGMAX or MAXTARGETS, each target gets its own message."""
+        self.client.broadcast(['#a', '#b'], 'hi')
+
+        expected = [b'PRIVMSG #a :hi\r\n', b'PRIVMSG #b :hi\r\n']
+        self.client.connection.send_batch.assert_called_once_with(expected)
+
+    def test_targmax(self):
+        self.isupport.tokens['TARGMAX'] = 'NAMES:1,PRIVMSG:2,NOTICE:4'
+        self.client.broadcast(['#a', '#b', '#c'], 'hi')
+
+        expected = [b'PRIVMSG #a,#b :hi\r\n', b'PRIVMSG #c :hi\r\n']
+        self.client.connection.send_batch.assert_called_once_with(expected)
+
+    def test_unlimited(self):
+        self.isupport.tokens['TARGMAX'] = 'PRIVMSG:'
+        self.client.broadcast(['#a', '#b', '#c'], 'hi')
+
+        expected = [b'PRIVMSG #a,#b,#c :hi\r\n']
+        self.client.connection.send_batch.assert_called_once_with(expected)
+
+    def test_unlimited_packed_by_length(self):
+        """Without a TARGMAX limit, targets are packed to fit the line."""
+        self.isupport.tokens['TARGMAX'] = 'PRIVMSG:'
+        targets = ['#channel-{:02}'.format(n) for n in range(60)]
+        self.client.broadcast(targets, 'hi')
+
+        messages = self.client.connection.send_batch.call_args[0][0]
+        self.assertEqual(len(messages), 2)
+        sent = []
+        for line in messages:
+            self.assertLessEqual(len(line), 512)
+            self.assertTrue(line.endswith(b' :hi\r\n'))
+            sent.extend(line.split()[1].decode().split(','))
+        self.assertEqual(sent, targets)
+
 
 class TestRequiredFields(TestCase):
     """Test to show that RequiredAttribuesMixin is properly configured."""
@@ -102,7 +353,7 @@ class TestSetNick(TestCase):
     def setUp(self):
         """Can't make an IRC connection in tests, so a mock will have to do."""
         self.client = BlankClient()
-        self.client.connection = mock.MagicMock(spec=Connection)
+        self.client.connection = mock_connection()
 
     def test_command_sent(self):
         """Should send a message to the network."""
@@ -111,7 +362,17 @@ class TestSetNick(TestCase):
         self.client.connection.send.assert_called_with(b'NICK meshy\r\n')
 
     def test_new_nick_kept(self):
-        """Should store the new nick on the Client."""
+        """Should store the new nick on the connection."""
         new_nick = 'meshy'
         self.client.set_nick(new_nick)
-        self.assertEqual(self.client.nick, new_nick)
+        self.assertEqual(self.client.connection.nick, new_nick)
+        self.assertEqual(self.client.current_nick(), new_nick)
+
+    def test_per_connection(self):
+        """Each network keeps its own nick."""
+        other = mock_connection()
+        self.client.set_nick('meshy', connection=other)
+
+        self.assertEqual(self.client.current_nick(other), 'meshy')
+        self.assertEqual(self.client.current_nick(), 'test_nick')
+        self.assertEqual(self.client.nick, 'test_nick')
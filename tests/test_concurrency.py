@@ -0,0 +1,108 @@
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock, TestCase
+
+from framewirc import concurrency, exceptions, filters
+from framewirc.message import ReceivedMessage
+
+from .utils import BlankClient, EventLoopMixin, mock_connection
+
+
+class TestOrdered(TestCase):
+    def test_marked(self):
+        handler = concurrency.ordered(lambda client, message: None)
+        self.assertIs(handler.ordered, True)
+
+    def test_through_filter(self):
+        """The mark is kept when a filter is applied on top."""
+        handler = filters.allow('A')(concurrency.ordered(mock.Mock()))
+        self.assertIs(handler.ordered, True)
+
+
+class TestTimeout(TestCase):
+    def test_marked(self):
+        handler = concurrency.timeout(5)(lambda client, message: None)
+        self.assertEqual(handler.timeout, 5)
+
+
+def shout(client, message, **kwargs):
+    """A handler that can be found by worker processes."""
+    client.privmsg(message.params[0], message.suffix.decode().upper())
+
+
+class TestInExecutor(EventLoopMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = BlankClient()
+        self.client.connection = mock_connection()
+        self.message = ReceivedMessage(b'PRIVMSG #channel :hello\r\n')
+
+    def test_replies_sent(self):
+        """Replies from the handler are sent by the real client."""
+        wrapped = concurrency.in_executor()(shout)
+        self.loop.run_until_complete(wrapped(self.client, self.message))
+
+        expected = [b'PRIVMSG #channel :HELLO\r\n']
+        self.client.connection.send_batch.assert_called_once_with(expected)
+
+    def test_replies_to_origin(self):
+        """Replies go to the connection the message came from."""
+        origin = mock_connection()
+        self.message.connection = origin
+        wrapped = concurrency.in_executor()(shout)
+        self.loop.run_until_complete(wrapped(self.client, self.message))
+
+        self.assertTrue(origin.send_batch.called)
+        self.assertFalse(self.client.connection.send_batch.called)
+
+    def test_parser_kwargs(self):
+        """Kwargs from parsers are passed through to the handler."""
+        calls = []
+
+        def handler(**kwargs):
+            calls.append(kwargs)
+
+        wrapped = concurrency.in_executor()(handler)
+        self.loop.run_until_complete(wrapped(self.client, self.message, key='value'))
+
+        kwargs = calls[0]
+        self.assertEqual(kwargs['key'], 'value')
+        self.assertIsInstance(kwargs['client'], concurrency.Replies)
+        self.assertEqual(kwargs['message'], self.message)
+        self.assertIsNot(kwargs['message'], self.message)
+
+    def test_process_pool(self):
+        """Handlers can be run in other processes."""
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            wrapped = concurrency.in_executor(executor)(shout)
+            self.loop.run_until_complete(wrapped(self.client, self.message))
+
+        expected = [b'PRIVMSG #channel :HELLO\r\n']
+        self.client.connection.send_batch.assert_called_once_with(expected)
+
+    def test_same_name_in_threads(self):
+        """Handlers made by the same factory don't replace each other."""
+        def make_handler(reply):
+            def handler(client, message):
+                client.privmsg(message.params[0], reply)
+            return handler
+
+        first = concurrency.in_executor()(make_handler('first'))
+        concurrency.in_executor()(make_handler('second'))
+        self.loop.run_until_complete(first(self.client, self.message))
+
+        expected = [b'PRIVMSG #channel :first\r\n']
+        self.client.connection.send_batch.assert_called_once_with(expected)
+
+    def test_same_name_in_processes(self):
+        """Offloading a different handler under a taken name is an error."""
+        def handler(client, message):
+            pass
+        other = handler
+
+        def handler(client, message):
+            pass
+
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            concurrency.in_executor(executor)(other)
+            with self.assertRaises(exceptions.DuplicateHandlerName):
+                concurrency.in_executor(executor)(handler)
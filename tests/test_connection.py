@@ -1,17 +1,26 @@
+import asyncio
 from asyncio import StreamWriter
 from unittest import mock, TestCase
 
 from framewirc.client import Client
-from framewirc.connection import Connection
+from framewirc.connection import BufferedConnection, Connection, LineProtocol
 from framewirc.exceptions import (
     MessageTooLong,
     MustBeBytes,
     NoLineEnding,
+    SendQueueFull,
     StrayLineEnding,
 )
-from framewirc.message import ReceivedMessage
+from framewirc.flood import FloodControl
+from framewirc.message import (
+    build_message,
+    LazyReceivedMessage,
+    make_privmsgs,
+    ReceivedMessage,
+    ValidatedMessage,
+)
 
-from .utils import BlankClient
+from .utils import BlankClient, EventLoopMixin
 
 
 class TestRequiredFields(TestCase):
@@ -41,6 +50,7 @@ class ConnectionTestCase(TestCase):
             real_name='Charlie Denton',
         )
         self.connection.writer = mock.MagicMock(spec=StreamWriter)
+        self.connection.writer.transport.get_write_buffer_size.return_value = 0
 
 
 class TestHandle(ConnectionTestCase):
@@ -53,6 +63,23 @@ class TestHandle(ConnectionTestCase):
         expected = ReceivedMessage(raw_message)
         self.connection.client.on_message.assert_called_with(expected)
 
+    def test_connection_noted(self):
+        """Messages know which connection they came from."""
+        self.connection.client = mock.MagicMock(spec=Client)
+        self.connection.handle(b'PING :server.example.com\r\n')
+
+        message = self.connection.client.on_message.call_args[0][0]
+        self.assertIs(message.connection, self.connection)
+
+    def test_message_class(self):
+        """Messages are built with the connection's message_class."""
+        self.connection.client = mock.MagicMock(spec=Client)
+        self.connection.message_class = LazyReceivedMessage
+        self.connection.handle(b'PING :server.example.com\r\n')
+
+        message = self.connection.client.on_message.call_args[0][0]
+        self.assertIsInstance(message, LazyReceivedMessage)
+
     def test_empty_message_does_not_call_on_message(self):
         """Do not pass empty messages through to client.on_message()."""
         self.connection.client = mock.MagicMock(spec=Client)
@@ -102,6 +129,22 @@ class TestSend(ConnectionTestCase):
             self.connection.send(message)
         self.assertFalse(self.connection.writer.write.called)
 
+    def test_validated_message_trusted(self):
+        """Messages from build_message are not checked again."""
+        message = build_message('PRIVMSG', 'meshy', suffix='Checked already')
+        with mock.patch.object(Connection, 'validate') as validate:
+            self.connection.send(message)
+        self.assertFalse(validate.called)
+        self.connection.writer.write.assert_called_with(message)
+
+    def test_validated_subclass_checked(self):
+        """Only exactly ValidatedMessage is trusted."""
+        class Sneaky(ValidatedMessage):
+            pass
+        message = Sneaky(b'PRIVMSG meshy :Nice \r\nCODE :injection\r\n')
+        with self.assertRaises(StrayLineEnding):
+            self.connection.send(message)
+
     def test_message_just_right(self):
         message = b'FIFTEEN chars :' + 495 * b'a' + b'\r\n'  # 512 chars
         self.connection.send(message)
@@ -115,5 +158,166 @@ class TestSendBatch(ConnectionTestCase):
             b'PRIVMSG meshy :It is almost usable!\r\n',
         ]
         self.connection.send_batch(messages)
-        calls = self.connection.writer.write.mock_calls
-        self.assertEqual(calls, list(map(mock.call, messages)))
+        self.connection.writer.writelines.assert_called_once_with(messages)
+
+    def test_validated_messages_trusted(self):
+        """Messages from make_privmsgs are not checked again."""
+        messages = make_privmsgs('meshy', 'Checked\nalready')
+        with mock.patch.object(Connection, 'validate') as validate:
+            self.connection.send_batch(messages)
+        self.assertFalse(validate.called)
+
+    def test_invalid_message(self):
+        """Nothing is sent if any message is invalid."""
+        messages = [b'PRIVMSG meshy :Fine\r\n', b'PRIVMSG meshy :Not fine']
+        with self.assertRaises(NoLineEnding):
+            self.connection.send_batch(messages)
+        self.assertFalse(self.connection.writer.writelines.called)
+
+
+class TestFloodControl(TestCase):
+    def test_paced(self):
+        """Messages are passed through flood control before being written."""
+        flood_control = mock.MagicMock(spec=FloodControl)
+        connection = Connection(
+            client=BlankClient(), host='example.com', flood_control=flood_control)
+        message = b'PRIVMSG meshy :Slow down!\r\n'
+
+        connection.send(message)
+
+        flood_control.put.assert_called_once_with((message,))
+        self.assertEqual(flood_control.output, connection._send_now)
+
+
+class TestBackpressure(EventLoopMixin, ConnectionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.drained = asyncio.Future()
+        self.connection.writer.drain.side_effect = lambda: self.drained
+        self.buffer_size = self.connection.writer.transport.get_write_buffer_size
+        self.buffer_size.return_value = self.connection.write_high_water + 1
+
+    def test_paused(self):
+        """Messages are queued when the transport is backed up."""
+        self.connection.send(b'PRIVMSG meshy :first\r\n')
+        self.connection.send(b'PRIVMSG meshy :second\r\n')
+
+        self.connection.writer.write.assert_called_once_with(b'PRIVMSG meshy :first\r\n')
+        self.assertEqual(list(self.connection.send_queue), [b'PRIVMSG meshy :second\r\n'])
+        self.assertEqual(self.connection.queued_bytes, 23)
+        self.assertEqual(self.connection.send_stats['pauses'], 1)
+
+    def test_flushed_when_drained(self):
+        """The queue is written in one go once the transport has drained."""
+        messages = [b'PRIVMSG meshy :second\r\n', b'PRIVMSG meshy :third\r\n']
+        self.connection.send(b'PRIVMSG meshy :first\r\n')
+        self.connection.send_batch(messages)
+        self.buffer_size.return_value = 0
+
+        self.drained.set_result(None)
+        self.loop.run_until_complete(asyncio.sleep(0))
+
+        self.connection.writer.writelines.assert_called_once_with(messages)
+        self.assertFalse(self.connection.writing_paused)
+        self.assertEqual(self.connection.queued_bytes, 0)
+
+    def test_queue_full(self):
+        """The queue will not grow past max_queued_bytes."""
+        self.connection.max_queued_bytes = 30
+        self.connection.send(b'PRIVMSG meshy :first\r\n')
+        self.connection.send(b'PRIVMSG meshy :second\r\n')
+        with self.assertRaises(SendQueueFull):
+            self.connection.send(b'PRIVMSG meshy :third\r\n')
+        self.assertEqual(self.connection.send_stats['max_queued_bytes'], 23)
+
+
+class TestLineProtocol(EventLoopMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.connection = mock.MagicMock(spec=Connection)
+        self.handled = []
+        self.connection.handle.side_effect = lambda m: self.handled.append(bytes(m))
+        self.protocol = LineProtocol(self.connection)
+
+    def receive(self, data):
+        """Pretend that the transport has read some data into the buffer."""
+        buffer = self.protocol.get_buffer(-1)
+        buffer[:len(data)] = data
+        self.protocol.buffer_updated(len(data))
+
+    def test_connection_made(self):
+        """The transport is used to write to the network."""
+        transport = mock.Mock()
+        self.protocol.connection_made(transport)
+        self.assertEqual(self.connection.writer, transport)
+
+    def test_lines(self):
+        """Every complete line is handled."""
+        self.receive(b'PING :one\r\nPING :two\r\n')
+        self.assertEqual(self.handled, [b'PING :one\r\n', b'PING :two\r\n'])
+
+    def test_partial_line(self):
+        """Incomplete lines wait for the rest of the line."""
+        self.receive(b'PING :one\r\nPING :t')
+        self.receive(b'wo\r\n')
+        self.assertEqual(self.handled, [b'PING :one\r\n', b'PING :two\r\n'])
+
+    def test_line_too_long(self):
+        """Lines longer than the buffer are discarded."""
+        self.protocol.buffer_size = 16
+        self.protocol.__init__(self.connection)
+        self.receive(b'PRIVMSG #c :0123')
+        self.receive(b'456789\r\nPING :o')
+        self.receive(b'k\r\n')
+        self.assertEqual(self.handled, [b'PING :ok\r\n'])
+
+    def test_data_received(self):
+        """Data can also be copied in, as on Python versions before 3.7."""
+        self.protocol.buffer_size = 16
+        self.protocol.__init__(self.connection)
+        self.protocol.data_received(b'PING :one\r\nPING :two\r\n')
+        self.assertEqual(self.handled, [b'PING :one\r\n', b'PING :two\r\n'])
+
+    def test_drained(self):
+        """Draining waits until the transport resumes writing."""
+        self.protocol.pause_writing()
+        drained = asyncio.Task(self.protocol.drained())
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertFalse(drained.done())
+
+        self.protocol.resume_writing()
+        self.loop.run_until_complete(drained)
+
+    def test_connection_lost(self):
+        """The connection is told when the network connection closes."""
+        self.protocol.connection_lost(None)
+        self.connection.handle.assert_called_once_with(b'')
+        self.assertTrue(self.protocol.closed.done())
+
+
+class TestBufferedConnection(EventLoopMixin, TestCase):
+    def test_connect(self):
+        """Messages from a real socket are handled, and replies are sent."""
+        loop = self.loop
+        received = []
+
+        @asyncio.coroutine
+        def serve(reader, writer):
+            writer.write(b'PING :one\r\nPING :two\r\n')
+            received.append((yield from reader.readline()))
+            writer.close()
+
+        server = loop.run_until_complete(asyncio.start_server(serve, '127.0.0.1', 0))
+        self.addCleanup(server.close)
+        port = server.sockets[0].getsockname()[1]
+
+        client = mock.MagicMock(spec=Client)
+        connection = BufferedConnection(
+            client=client, host='127.0.0.1', port=port, ssl=False)
+        client.on_connect.side_effect = lambda: connection.send(b'NICK bot\r\n')
+
+        loop.run_until_complete(asyncio.wait_for(connection.connect(), 5))
+
+        commands = [c[0][0].command for c in client.on_message.call_args_list]
+        self.assertEqual(commands, ['PING', 'PING'])
+        self.assertEqual(received, [b'NICK bot\r\n'])
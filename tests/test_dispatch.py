@@ -0,0 +1,33 @@
+from unittest import mock, TestCase
+
+from framewirc import filters
+from framewirc.dispatch import DispatchTable
+
+
+class TestDispatchTable(TestCase):
+    def setUp(self):
+        self.allow_a = filters.allow('A')(mock.Mock())
+        self.allow_ab = filters.allow(['A', 'B'])(mock.Mock())
+        self.deny_a = filters.deny('A')(mock.Mock())
+        self.unfiltered = mock.Mock()
+        self.handlers = [self.allow_a, self.deny_a, self.allow_ab, self.unfiltered]
+        self.table = DispatchTable(self.handlers)
+
+    def test_allowed_command(self):
+        """Whitelisted handlers are only found for their commands."""
+        expected = (self.allow_a, self.allow_ab, self.unfiltered)
+        self.assertEqual(self.table.handlers_for('A'), expected)
+
+    def test_other_allowed_command(self):
+        """Handlers that do not deny a command receive it."""
+        expected = (self.deny_a, self.allow_ab, self.unfiltered)
+        self.assertEqual(self.table.handlers_for('B'), expected)
+
+    def test_unmentioned_command(self):
+        """Commands not in any filter only reach handlers without a whitelist."""
+        expected = (self.deny_a, self.unfiltered)
+        self.assertEqual(self.table.handlers_for('C'), expected)
+
+    def test_handlers_kept(self):
+        """The source handlers are kept so that changes can be detected."""
+        self.assertIs(self.table.handlers, self.handlers)
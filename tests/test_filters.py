@@ -1,6 +1,7 @@
+from functools import wraps
 from unittest import mock, TestCase
 
-from framewirc import filters
+from framewirc import filters, parsers
 from framewirc.message import ReceivedMessage
 
 
@@ -107,3 +108,162 @@ class TestAllow(TestCase):
         wrapped(self.client, message)
 
         self.assertFalse(self.handler.called)
+
+
+class TestCommandFilter(TestCase):
+    def test_allow_recorded(self):
+        """The whitelist is recorded on the decorated handler."""
+        wrapped = filters.allow(['A', 'B'])(mock.Mock())
+
+        self.assertEqual(wrapped.command_filter.allowed, {'A', 'B'})
+        self.assertEqual(wrapped.command_filter.denied, set())
+
+    def test_deny_recorded(self):
+        """The blacklist is recorded on the decorated handler."""
+        wrapped = filters.deny('A')(mock.Mock())
+
+        self.assertIsNone(wrapped.command_filter.allowed)
+        self.assertEqual(wrapped.command_filter.denied, {'A'})
+
+    def test_stacked(self):
+        """Stacked filters record only what all of them accept."""
+        wrapped = filters.allow(['A', 'B'])(filters.deny('B')(mock.Mock()))
+
+        self.assertTrue(wrapped.command_filter.accepts('A'))
+        self.assertFalse(wrapped.command_filter.accepts('B'))
+        self.assertFalse(wrapped.command_filter.accepts('C'))
+
+    def test_through_parser(self):
+        """Filters are still visible through a parser decorator."""
+        handler = filters.allow('A')(mock.Mock())
+        wrapped = parsers.apply_message_parser(mock.Mock())(handler)
+
+        self.assertEqual(wrapped.command_filter.allowed, {'A'})
+
+    def test_unfiltered(self):
+        """Handlers without a filter accept everything."""
+        command_filter = filters.get_command_filter(mock.Mock())
+
+        self.assertIs(command_filter, filters.ACCEPT_ALL)
+        self.assertTrue(command_filter.accepts('ANYTHING'))
+
+
+class TestChain(TestCase):
+    def setUp(self):
+        self.client = object()
+        self.handler = mock.Mock()
+
+    def test_stacked_filters_compiled(self):
+        """Stacked filters call the original handler directly."""
+        inner = filters.deny('B')(self.handler)
+        wrapped = filters.allow(['A', 'B'])(inner)
+
+        self.assertIs(wrapped.chain.handler, self.handler)
+        self.assertIs(wrapped.__wrapped__, inner)
+
+    def test_stacked_filters(self):
+        wrapped = filters.allow(['A', 'B'])(filters.deny('B')(self.handler))
+
+        for command in (b'A', b'B', b'C'):
+            wrapped(self.client, ReceivedMessage(command))
+
+        self.assertEqual(self.handler.call_count, 1)
+        message = self.handler.call_args[1]['message']
+        self.assertEqual(message.command, 'A')
+
+    def test_filter_then_parser(self):
+        """Messages are not parsed when the filter rejects them."""
+        parser = mock.Mock(return_value={'key': 'value'})
+        wrapped = filters.allow('A')(
+            parsers.apply_message_parser(parser)(self.handler))
+
+        wrapped(self.client, ReceivedMessage(b'B'))
+        self.assertFalse(parser.called)
+
+        message = ReceivedMessage(b'A')
+        wrapped(self.client, message)
+        self.handler.assert_called_once_with(
+            client=self.client,
+            message=message,
+            key='value',
+        )
+
+    def test_parser_then_filter(self):
+        """A parser can be stacked on top of a filter."""
+        parser = mock.Mock(return_value={'key': 'value'})
+        wrapped = parsers.apply_message_parser(parser)(
+            filters.allow('A')(self.handler))
+
+        wrapped(self.client, ReceivedMessage(b'B'))
+        self.assertFalse(parser.called)
+
+        message = ReceivedMessage(b'A')
+        wrapped(self.client, message)
+        self.handler.assert_called_once_with(
+            client=self.client,
+            message=message,
+            key='value',
+        )
+
+    def test_stacked_parsers(self):
+        """Results of inner parsers take precedence."""
+        outer = mock.Mock(return_value={'a': 'outer', 'b': 'outer'})
+        inner = mock.Mock(return_value={'b': 'inner'})
+        wrapped = parsers.apply_message_parser(outer)(
+            parsers.apply_message_parser(inner)(self.handler))
+
+        message = ReceivedMessage(b'A')
+        wrapped(self.client, message)
+
+        self.handler.assert_called_once_with(
+            client=self.client,
+            message=message,
+            a='outer',
+            b='inner',
+        )
+
+    def test_foreign_decorator_kept(self):
+        """Decorators that copy `chain` with `functools.wraps` are still called."""
+        calls = []
+
+        def logged(handler):
+            @wraps(handler)
+            def wrapper(client, message):
+                calls.append(message.command)
+                return handler(client=client, message=message)
+            return wrapper
+
+        wrapped = filters.allow(['A', 'B'])(logged(filters.deny('B')(self.handler)))
+
+        for command in (b'A', b'B', b'C'):
+            wrapped(self.client, ReceivedMessage(command))
+
+        # The inner filter was copied to the wrapper, so it is checked early.
+        self.assertEqual(calls, ['A'])
+        self.assertEqual(self.handler.call_count, 1)
+        self.assertIsNot(wrapped.chain.handler, self.handler)
+
+    def test_foreign_decorator_under_parser(self):
+        """A foreign decorator under a filter still gets the parsed kwargs."""
+        parser = mock.Mock(return_value={'key': 'value'})
+        calls = []
+
+        def logged(handler):
+            @wraps(handler)
+            def wrapper(client, message, **kwargs):
+                calls.append(kwargs)
+                return handler(client=client, message=message, **kwargs)
+            return wrapper
+
+        wrapped = filters.allow('A')(
+            logged(parsers.apply_message_parser(parser)(self.handler)))
+
+        message = ReceivedMessage(b'A')
+        wrapped(self.client, message)
+
+        self.assertEqual(calls, [{}])
+        self.handler.assert_called_once_with(
+            client=self.client,
+            message=message,
+            key='value',
+        )
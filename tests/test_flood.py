@@ -0,0 +1,139 @@
+from unittest import mock, TestCase
+
+from framewirc import exceptions, flood
+
+from .utils import EventLoopMixin
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLaneFor(TestCase):
+    def test_priority(self):
+        """Registration commands and PONG replies skip ahead."""
+        self.assertEqual(flood.lane_for(b'PONG :server\r\n'), flood.PRIORITY)
+        self.assertEqual(flood.lane_for(b'NICK meshy\r\n'), flood.PRIORITY)
+        self.assertEqual(flood.lane_for(b'CAP END\r\n'), flood.PRIORITY)
+
+    def test_bulk(self):
+        """Messages to users and channels are bulk traffic."""
+        self.assertEqual(flood.lane_for(b'PRIVMSG #chan :hi\r\n'), flood.BULK)
+        self.assertEqual(flood.lane_for(b'NOTICE meshy :hi\r\n'), flood.BULK)
+
+    def test_normal(self):
+        self.assertEqual(flood.lane_for(b'JOIN #chan\r\n'), flood.NORMAL)
+
+    def test_prefix(self):
+        """A prefix is skipped when finding the command."""
+        self.assertEqual(flood.lane_for(b':me PONG :server\r\n'), flood.PRIORITY)
+
+
+class TestTokenBucket(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.bucket = flood.TokenBucket(rate=0.5, capacity=2, clock=self.clock)
+
+    def test_burst(self):
+        """Up to `capacity` tokens can be taken at once."""
+        self.assertTrue(self.bucket.take())
+        self.assertTrue(self.bucket.take())
+        self.assertFalse(self.bucket.take())
+
+    def test_refill(self):
+        """Tokens are refilled at `rate` per second."""
+        self.bucket.take()
+        self.bucket.take()
+        self.assertEqual(self.bucket.delay(), 2)
+
+        self.clock.now = 2
+        self.assertTrue(self.bucket.take())
+
+    def test_capacity(self):
+        """The bucket never holds more than `capacity` tokens."""
+        self.clock.now = 100
+        self.bucket.take()
+        self.bucket.take()
+        self.assertFalse(self.bucket.take())
+
+
+class TestFloodControl(EventLoopMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.clock = FakeClock()
+        bucket = flood.TokenBucket(rate=1, capacity=1, clock=self.clock)
+        self.flood_control = flood.FloodControl(bucket=bucket, clock=self.clock)
+        self.flood_control.output = mock.Mock()
+
+    def test_within_burst(self):
+        """Messages are sent straight away while tokens are available."""
+        self.flood_control.put([b'PRIVMSG #chan :hi\r\n'])
+        self.flood_control.output.assert_called_once_with([b'PRIVMSG #chan :hi\r\n'])
+
+    def test_priority_first(self):
+        """Priority messages skip ahead of queued bulk messages."""
+        self.flood_control.put([b'PRIVMSG #chan :1\r\n', b'PRIVMSG #chan :2\r\n'])
+        self.flood_control.put([b'PONG :server\r\n'])
+        self.flood_control.output.reset_mock()
+
+        self.clock.now = 1
+        self.flood_control.release()
+
+        self.flood_control.output.assert_called_once_with([b'PONG :server\r\n'])
+
+    def test_released_later(self):
+        """Queued messages are sent once a token is available."""
+        self.flood_control.put([b'PRIVMSG #chan :1\r\n', b'PRIVMSG #chan :2\r\n'])
+        self.assertEqual(self.flood_control.queued, 1)
+        self.assertIsNotNone(self.flood_control._timer)
+
+        self.clock.now = 1
+        self.flood_control.release()
+
+        self.flood_control.output.assert_called_with([b'PRIVMSG #chan :2\r\n'])
+        self.assertEqual(self.flood_control.queued, 0)
+
+    def test_stats(self):
+        """Latency and throughput are recorded for each lane."""
+        self.flood_control.put([b'PRIVMSG #chan :1\r\n', b'PRIVMSG #chan :2\r\n'])
+        self.clock.now = 2
+        self.flood_control.release()
+
+        stats = self.flood_control.stats()[flood.BULK]
+        self.assertEqual(stats['sent'], 2)
+        self.assertEqual(stats['queued'], 0)
+        self.assertEqual(stats['per_second'], 1)
+        self.assertEqual(stats['mean_latency'], 1)
+        self.assertEqual(stats['max_latency'], 2)
+
+    def test_one_timer(self):
+        """Putting more messages while some are waiting doesn't add timers."""
+        loop = mock.Mock()
+        with mock.patch('asyncio.get_event_loop', return_value=loop):
+            self.flood_control.put([b'PRIVMSG #chan :1\r\n', b'PRIVMSG #chan :2\r\n'])
+            self.flood_control.put([b'PRIVMSG #chan :3\r\n'])
+            self.flood_control.put([b'PRIVMSG #chan :4\r\n'])
+
+        self.assertEqual(loop.call_later.call_count, 1)
+        self.flood_control.clear()
+        loop.call_later.return_value.cancel.assert_called_once_with()
+
+    def test_full(self):
+        """Messages that would take the queue past its limit are refused."""
+        self.flood_control.max_queued_bytes = 30
+        self.flood_control.put([b'PRIVMSG #chan :1\r\n'])
+        self.flood_control.put([b'PRIVMSG #chan :2\r\n'])
+
+        with self.assertRaises(exceptions.SendQueueFull):
+            self.flood_control.put([b'PRIVMSG #chan :3\r\n'])
+        self.assertEqual(self.flood_control.queued, 1)
+
+    def test_clear(self):
+        self.flood_control.put([b'PRIVMSG #chan :1\r\n', b'PRIVMSG #chan :2\r\n'])
+        self.flood_control.clear()
+        self.assertEqual(self.flood_control.queued, 0)
+        self.assertIsNone(self.flood_control._timer)
@@ -27,7 +27,8 @@ class TestPing(TestCase):
 class TestBadNick(TestCase):
     def test_nicknameinuse(self):
         """Should call client.set_nick when there's a name clash."""
-        client = mock.MagicMock(nick='taken')
+        client = mock.MagicMock()
+        client.current_nick.return_value = 'taken'
         message = ReceivedMessage(b'433')  # ERR_NICKNAMEINUSE
 
         handlers.nickname_in_use(client, message)
@@ -0,0 +1,99 @@
+from unittest import mock, TestCase
+
+from framewirc import exceptions
+from framewirc.connection import Connection
+from framewirc.isupport import ISupport
+from framewirc.message import ReceivedMessage
+
+from .utils import BlankClient
+
+
+def isupport(*lines):
+    registry = ISupport()
+    for line in lines:
+        registry.update(ReceivedMessage(line))
+    return registry
+
+
+class TestISupport(TestCase):
+    def test_tokens(self):
+        registry = isupport(
+            b':server 005 meshy CHANTYPES=# EXCEPTS NETWORK=Example :are supported')
+
+        self.assertEqual(registry.tokens, {
+            'CHANTYPES': '#',
+            'EXCEPTS': '',
+            'NETWORK': 'Example',
+        })
+
+    def test_many_lines(self):
+        registry = isupport(
+            b':server 005 meshy CHANTYPES=# :are supported',
+            b':server 005 meshy LINELEN=1024 :are supported',
+        )
+        self.assertEqual(registry.chantypes, '#')
+        self.assertEqual(registry.linelen, 1024)
+
+    def test_negated(self):
+        """Tokens starting with - are no longer supported."""
+        registry = isupport(
+            b':server 005 meshy CHANTYPES=# :are supported',
+            b':server 005 meshy -CHANTYPES :are supported',
+        )
+        self.assertNotIn('CHANTYPES', registry.tokens)
+
+    def test_escaped(self):
+        registry = isupport(b':server 005 meshy NETWORK=Example\\x20Net :are supported')
+        self.assertEqual(registry.tokens['NETWORK'], 'Example Net')
+
+    def test_bounce(self):
+        """An old-style RPL_BOUNCE is ignored."""
+        registry = isupport(b':server 005 meshy :Try server irc.example.com, port 6667')
+        self.assertEqual(registry.tokens, {})
+
+    def test_defaults(self):
+        registry = ISupport()
+
+        self.assertEqual(registry.casemapping, 'rfc1459')
+        self.assertEqual(registry.chantypes, '&#+!')
+        self.assertEqual(registry.linelen, 512)
+        self.assertEqual(registry.max_targets('PRIVMSG'), 1)
+
+    def test_empty_chantypes(self):
+        """A server without channels sends an empty CHANTYPES."""
+        registry = isupport(b':server 005 meshy CHANTYPES= :are supported')
+        self.assertEqual(registry.chantypes, '')
+
+    def test_targmax(self):
+        registry = isupport(b':server 005 meshy TARGMAX=PRIVMSG:4,NOTICE:3,JOIN: :hi')
+
+        self.assertEqual(registry.targmax, {'PRIVMSG': 4, 'NOTICE': 3, 'JOIN': None})
+        self.assertEqual(registry.max_targets('PRIVMSG'), 4)
+        self.assertIsNone(registry.max_targets('JOIN'))
+
+    def test_maxtargets(self):
+        """MAXTARGETS applies to commands not in TARGMAX."""
+        registry = isupport(b':server 005 meshy MAXTARGETS=3 :are supported')
+        self.assertEqual(registry.max_targets('PRIVMSG'), 3)
+
+
+class TestConnectionISupport(TestCase):
+    def setUp(self):
+        self.connection = Connection(client=BlankClient(), host='example.com')
+        self.connection.writer = mock.MagicMock()
+        self.connection.writer.transport.get_write_buffer_size.return_value = 0
+
+    def test_updated(self):
+        """RPL_ISUPPORT replies are recorded on the connection."""
+        self.connection.handle(b':server 005 meshy LINELEN=1024 :are supported\r\n')
+        self.assertEqual(self.connection.isupport.linelen, 1024)
+
+    def test_linelen_validation(self):
+        """Messages may be as long as the server allows."""
+        message = b'PRIVMSG #chan :' + b'x' * 600 + b'\r\n'
+        with self.assertRaises(exceptions.MessageTooLong):
+            self.connection.send(message)
+
+        self.connection.isupport.tokens['LINELEN'] = '1024'
+        self.connection.send(message)
+        self.connection.writer.write.assert_called_once_with(message)
@@ -2,7 +2,15 @@ from itertools import product
 from unittest import mock, TestCase
 
 from framewirc import exceptions
-from framewirc.message import build_message, make_privmsgs, ReceivedMessage
+from framewirc.message import (
+    build_message,
+    LazyReceivedMessage,
+    make_privmsgs,
+    MessageTemplate,
+    parse_tags,
+    ReceivedMessage,
+    ValidatedMessage,
+)
 
 
 class TestReceivedMessage(TestCase):
@@ -40,6 +48,125 @@ class TestReceivedMessage(TestCase):
                 self.assertEqual(message.params, expected_params)
                 self.assertEqual(message.suffix, expected_suffix)
 
+    def test_tags(self):
+        """IRCv3 tags before the prefix are kept apart from the command."""
+        raw_message = (
+            b'@time=2020-01-01T00:00:00Z;msgid=abc '
+            b':nick!id@host PRIVMSG #chan :hi\r\n'
+        )
+
+        message = ReceivedMessage(raw_message)
+
+        self.assertEqual(message.command, 'PRIVMSG')
+        self.assertEqual(message.prefix, 'nick!id@host')
+        self.assertEqual(message.params, ('#chan',))
+        self.assertEqual(message.suffix, b'hi')
+        self.assertEqual(message.raw_tags, b'time=2020-01-01T00:00:00Z;msgid=abc')
+        self.assertEqual(message.tags, {'time': '2020-01-01T00:00:00Z', 'msgid': 'abc'})
+
+    def test_tags_without_prefix(self):
+        message = ReceivedMessage(b'@account=meshy PING :server\r\n')
+
+        self.assertEqual(message.command, 'PING')
+        self.assertEqual(message.tags, {'account': 'meshy'})
+
+    def test_no_tags(self):
+        message = ReceivedMessage(b'PING :server\r\n')
+
+        self.assertEqual(message.raw_tags, b'')
+        self.assertEqual(message.tags, {})
+
+    def test_tags_parsed_once(self):
+        """Tags are only split up when first read, then cached."""
+        message = ReceivedMessage(b'@a=b PING :server\r\n')
+        self.assertNotIn('tags', message.__dict__)
+
+        self.assertIs(message.tags, message.tags)
+
+
+class TestParseTags(TestCase):
+    def test_values(self):
+        self.assertEqual(parse_tags(b'a=1;b=2'), {'a': '1', 'b': '2'})
+
+    def test_no_value(self):
+        """Tags without values (or with empty ones) are given ''."""
+        self.assertEqual(parse_tags(b'a;b='), {'a': '', 'b': ''})
+
+    def test_vendor_key(self):
+        self.assertEqual(parse_tags(b'+example.com/foo=bar'), {'+example.com/foo': 'bar'})
+
+    def test_unescape(self):
+        raw_tags = b'a=semi\\:space\\sslash\\\\cr\\rlf\\n'
+        self.assertEqual(parse_tags(raw_tags), {'a': 'semi;space slash\\cr\rlf\n'})
+
+    def test_unknown_escape(self):
+        """Unknown escapes lose their backslash, as does a trailing one."""
+        self.assertEqual(parse_tags(b'a=\\b\\'), {'a': 'b'})
+
+    def test_duplicate(self):
+        """The last value of a repeated tag is used."""
+        self.assertEqual(parse_tags(b'a=1;a=2'), {'a': '2'})
+
+
+class TestLazyReceivedMessage(TestCase):
+    """Test the LazyReceivedMessage class."""
+    build_message = TestReceivedMessage.build_message
+
+    def test_permutations(self):
+        """Lazily parsed attributes match those parsed by ReceivedMessage."""
+        on_off = True, False
+        for prefix, params, suffix in product(on_off, on_off, on_off):
+            with self.subTest(prefix=prefix, params=params, suffix=suffix):
+                raw_message = self.build_message(prefix, params, suffix)
+
+                lazy = LazyReceivedMessage(raw_message)
+                eager = ReceivedMessage(raw_message)
+
+                self.assertEqual(lazy.command, eager.command)
+                self.assertEqual(lazy.prefix, eager.prefix)
+                self.assertEqual(lazy.params, eager.params)
+                self.assertEqual(lazy.suffix, eager.suffix)
+
+    def test_command_does_not_parse(self):
+        """Reading the command leaves the rest of the message unparsed."""
+        message = LazyReceivedMessage(b':prefix PING :server\r\n')
+        with mock.patch.object(LazyReceivedMessage, '_elements') as elements:
+            self.assertEqual(message.command, 'PING')
+        self.assertFalse(elements.called)
+
+    def test_parsed_once(self):
+        """The message is parsed once, then the parts are cached."""
+        message = LazyReceivedMessage(b':prefix COMMAND param :suffix\r\n')
+        elements = mock.Mock(wraps=message._elements)
+        with mock.patch.object(message, '_elements', elements):
+            message.prefix
+            message.params
+            message.suffix
+        elements.assert_called_once_with()
+
+    def test_tags(self):
+        """The command is found after the tags and prefix."""
+        raw_message = b'@msgid=abc :prefix PRIVMSG #chan :hi\r\n'
+        lazy = LazyReceivedMessage(raw_message)
+        eager = ReceivedMessage(raw_message)
+
+        self.assertEqual(lazy.command, 'PRIVMSG')
+        self.assertEqual(lazy.tags, eager.tags)
+        self.assertEqual(lazy.prefix, eager.prefix)
+        self.assertEqual(lazy.raw_tags, eager.raw_tags)
+
+    def test_tags_do_not_parse(self):
+        """Reading the tags leaves the rest of the message unparsed."""
+        message = LazyReceivedMessage(b'@a=b :prefix PING :server\r\n')
+        with mock.patch.object(LazyReceivedMessage, '_elements') as elements:
+            self.assertEqual(message.tags, {'a': 'b'})
+        self.assertFalse(elements.called)
+
+    def test_raw_bytes(self):
+        """The message is still equal to the raw bytes."""
+        raw_message = b':prefix COMMAND param :suffix\r\n'
+        self.assertEqual(LazyReceivedMessage(raw_message), raw_message)
+
 
 class TestBuildMessage(TestCase):
     """Make sure that build_message correctly builds bytes objects."""
@@ -48,6 +175,11 @@ class TestBuildMessage(TestCase):
         message = build_message(b'COMMAND')
         self.assertEqual(message, b'COMMAND\r\n')
 
+    def test_validated(self):
+        """Built messages are marked as valid."""
+        message = build_message(b'COMMAND')
+        self.assertIs(type(message), ValidatedMessage)
+
     def test_prefix(self):
         """Command with prefix."""
         message = build_message(b'COMMAND', prefix=b'something')
@@ -119,6 +251,44 @@ class TestBuildMessageExceptions(TestCase):
             build_message('A' * 511)  # 513 chars when \r\n added.
 
 
+class TestMessageTemplate(TestCase):
+    def test_matches_build_message(self):
+        """Templates build the same messages as build_message."""
+        cases = [
+            ((b'PONG',), {}),
+            ((b'PRIVMSG', '#channel'), {}),
+            (('MODE', '#channel', '+o', 'meshy'), {}),
+            ((b'PRIVMSG', b'#channel'), {'prefix': b'meshy!ident@host'}),
+        ]
+        for (args, kwargs), suffix in product(cases, (b'', b'suffix', 'unicod\xe9')):
+            with self.subTest(args=args, kwargs=kwargs, suffix=suffix):
+                expected = build_message(*args, suffix=suffix, **kwargs)
+                message = MessageTemplate(*args, **kwargs)(suffix)
+
+                self.assertEqual(message, expected)
+                self.assertIsInstance(message, ValidatedMessage)
+
+    def test_header_checked_once(self):
+        """A bad header is rejected when the template is made."""
+        with self.assertRaises(exceptions.StrayLineEnding):
+            MessageTemplate(b'PRIVMSG', b'#chan\r\nQUIT')
+
+    def test_stray_line_ending(self):
+        template = MessageTemplate(b'PRIVMSG', b'#channel')
+        with self.assertRaises(exceptions.StrayLineEnding):
+            template(b'hi\r\nQUIT')
+
+    def test_too_long(self):
+        template = MessageTemplate(b'PRIVMSG', b'#channel')
+        template(b'x' * 492)  # Just fits: 'PRIVMSG #channel :' is 18 bytes.
+        with self.assertRaises(exceptions.MessageTooLong):
+            template(b'x' * 493)
+
+    def test_max_length(self):
+        template = MessageTemplate(b'PRIVMSG', b'#channel', max_length=1024)
+        self.assertEqual(len(template(b'x' * 1000)), 1020)
+
+
 class TestMakePrivMsgs(TestCase):
     """Ensure make_privmsgs correctly constructs PRIVMSG command lists."""
     def test_simple(self):
@@ -183,3 +353,19 @@ class TestMakePrivMsgs(TestCase):
 
         expected_max = 495  # 512 - len(r'PRIVMSG meshy :' + '\r\n')
         chunk_message.assert_called_with(msg, max_length=expected_max)
+
+    def test_max_length_unicode_target(self):
+        """The target's length is counted in bytes."""
+        msg = 'A test message'
+        with mock.patch('framewirc.message.chunk_message') as chunk_message:
+            make_privmsgs('#café', msg)
+
+        expected_max = 494  # 512 - len(r'PRIVMSG #café :' + '\r\n') in bytes.
+        chunk_message.assert_called_with(msg, max_length=expected_max)
+
+    def test_line_length(self):
+        """Servers may allow longer lines (see ISUPPORT LINELEN)."""
+        msg = 'x' * 1000
+        messages = make_privmsgs('meshy', msg, line_length=1024)
+
+        self.assertEqual(messages, [b'PRIVMSG meshy :' + b'x' * 1000 + b'\r\n'])
@@ -0,0 +1,157 @@
+from asyncio import StreamWriter
+from unittest import mock, TestCase
+
+from framewirc import metrics
+from framewirc.connection import Connection
+from framewirc.utils import to_unicode
+
+from .utils import BlankClient
+
+
+def handler(client, message):
+    pass
+
+
+class SinkMixin:
+    """Collect metrics in an InMemorySink for the duration of each test."""
+    def setUp(self):
+        super().setUp()
+        old_sink = metrics.sink
+        self.sink = metrics.set_sink(metrics.InMemorySink())
+        self.addCleanup(metrics.set_sink, old_sink)
+
+
+class TestInMemorySink(TestCase):
+    def setUp(self):
+        self.sink = metrics.InMemorySink(buckets=(1, 10))
+
+    def test_counter(self):
+        self.sink.increment('lines')
+        self.sink.increment('lines', 2)
+        self.sink.increment('lines', labels=(('host', 'a'),))
+
+        snapshot = self.sink.snapshot()
+
+        self.assertEqual(snapshot['lines'], 3)
+        self.assertEqual(snapshot['lines{host="a"}'], 1)
+
+    def test_gauge(self):
+        self.sink.gauge('queue', 5)
+        self.sink.gauge('queue', 2)
+
+        self.assertEqual(self.sink.snapshot()['queue'], 2)
+
+    def test_histogram(self):
+        for value in (0.5, 5, 50):
+            self.sink.observe('seconds', value)
+
+        histogram = self.sink.snapshot()['seconds']
+
+        self.assertEqual(histogram['count'], 3)
+        self.assertEqual(histogram['sum'], 55.5)
+        self.assertEqual(
+            histogram['buckets'], [(1, 1), (10, 2), (float('inf'), 3)])
+
+    def test_exposition(self):
+        self.sink.increment('lines', labels=(('host', 'a"b'),))
+        self.sink.gauge('queue', 2)
+        self.sink.observe('seconds', 5)
+
+        expected = '\n'.join([
+            '# TYPE lines counter',
+            'lines{host="a\\"b"} 1',
+            '# TYPE queue gauge',
+            'queue 2',
+            '# TYPE seconds histogram',
+            'seconds_bucket{le="1"} 0',
+            'seconds_bucket{le="10"} 1',
+            'seconds_bucket{le="+Inf"} 1',
+            'seconds_count 1',
+            'seconds_sum 5',
+        ]) + '\n'
+        self.assertEqual(self.sink.exposition(), expected)
+
+
+class TestHandlerName(TestCase):
+    def test_function(self):
+        self.assertEqual(metrics.handler_name(handler), 'tests.test_metrics.handler')
+
+    def test_decorated(self):
+        """Decorators that use functools.wraps are looked through."""
+        from framewirc.filters import allow
+        wrapped = allow('PRIVMSG')(allow('PRIVMSG')(handler))
+        self.assertEqual(metrics.handler_name(wrapped), 'tests.test_metrics.handler')
+
+    def test_instance(self):
+        name = metrics.handler_name(metrics.NullSink())
+        self.assertEqual(name, 'framewirc.metrics.NullSink')
+
+
+class TestConnectionMetrics(SinkMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.connection = Connection(client=BlankClient(), host='example.com')
+        self.connection.writer = mock.MagicMock(spec=StreamWriter)
+        self.connection.writer.transport.get_write_buffer_size.return_value = 0
+
+    def test_received(self):
+        self.connection.handle(b'PING :server\r\n')
+
+        snapshot = self.sink.snapshot()
+        lines = snapshot['framewirc_lines_received_total{host="example.com"}']
+        self.assertEqual(lines, 1)
+        received = snapshot['framewirc_bytes_received_total{host="example.com"}']
+        self.assertEqual(received, 14)
+        parse = snapshot['framewirc_parse_seconds{host="example.com"}']
+        self.assertEqual(parse['count'], 1)
+
+    def test_sent(self):
+        self.connection.send_batch([b'PONG :a\r\n', b'PONG :b\r\n'])
+
+        snapshot = self.sink.snapshot()
+        self.assertEqual(snapshot['framewirc_lines_sent_total{host="example.com"}'], 2)
+        self.assertEqual(snapshot['framewirc_bytes_sent_total{host="example.com"}'], 18)
+
+    def test_queue_depth(self):
+        self.connection.writing_paused = True
+        self.connection.send(b'PONG :a\r\n')
+
+        snapshot = self.sink.snapshot()
+        self.assertEqual(snapshot['framewirc_send_queue_bytes{host="example.com"}'], 9)
+
+
+class TestClientMetrics(SinkMixin, TestCase):
+    def test_handler_calls(self):
+        client = BlankClient(handlers=[handler])
+        message = mock.Mock(command='PING')
+
+        client.on_message(message)
+        client.on_message(message)
+
+        snapshot = self.sink.snapshot()
+        labels = '{handler="tests.test_metrics.handler"}'
+        self.assertEqual(snapshot['framewirc_handler_calls_total' + labels], 2)
+        self.assertEqual(snapshot['framewirc_handler_seconds' + labels]['count'], 2)
+
+
+class TestEncodingMetrics(SinkMixin, TestCase):
+    def test_fallback(self):
+        to_unicode(b'Ume\xe5', encodings=('utf8', 'latin1'))
+
+        snapshot = self.sink.snapshot()
+        fallbacks = snapshot['framewirc_encoding_fallbacks_total{encoding="latin1"}']
+        self.assertEqual(fallbacks, 1)
+
+    def test_no_fallback(self):
+        to_unicode(b'hello')
+
+        self.assertEqual(self.sink.snapshot(), {})
+
+    def test_fallback_from_generator(self):
+        """Any iterable of encodings can be passed, as before."""
+        encodings = (encoding for encoding in ('utf8', 'latin1'))
+        self.assertEqual(to_unicode(b'Ume\xe5', encodings=encodings), 'Umeå')
+
+        snapshot = self.sink.snapshot()
+        fallbacks = snapshot['framewirc_encoding_fallbacks_total{encoding="latin1"}']
+        self.assertEqual(fallbacks, 1)
@@ -1,11 +1,13 @@
 from unittest import mock, TestCase
 
+from framewirc.isupport import ISupport
 from framewirc.message import build_message, ReceivedMessage
 from framewirc.parsers import (
     apply_kwargs_parser,
     apply_message_parser,
     is_channel,
     nick,
+    nick_cache,
     privmsg,
 )
 
@@ -55,6 +57,11 @@ class TestIsChannel:
         # "\7" is one way python can escape the ASCII BEL char.
         assert is_channel('#contains\7BEL') is False
 
+    def test_chantypes(self):
+        """The server may use other channel prefixes."""
+        assert is_channel('#channel', chantypes='#') is True
+        assert is_channel('&channel', chantypes='#') is False
+
 
 class TestNick(TestCase):
     """The nick parser can deal with several nick formats."""
@@ -68,6 +75,21 @@ class TestNick(TestCase):
         }
         self.assertEqual(result, expected)
 
+    def test_cached(self):
+        """The same nick is only parsed once."""
+        raw_nick = 'cached!ident@hostname'
+        first = nick(raw_nick)
+        hits = nick_cache.hits
+
+        self.assertIs(nick(raw_nick), first)
+        self.assertEqual(nick_cache.hits, hits + 1)
+
+    def test_read_only(self):
+        """Cached results can't be changed by the caller."""
+        result = nick('readonly!ident@hostname')
+        with self.assertRaises(TypeError):
+            result['nick'] = 'changed'
+
     def test_nick_without_ident(self):
         result = nick('~nickname@hostname')
 
@@ -129,6 +151,15 @@ class TestPrivmsg(TestCase):
 
         self.assertEqual(result['channel'], sender_nick)
 
+    def test_connection_chantypes(self):
+        """Channels are recognised by the CHANTYPES of the connection."""
+        message = ReceivedMessage(build_message(
+            'PRIVMSG', '&notachannel', prefix='nick!ident@host', suffix='hi'))
+        message.connection = mock.Mock(isupport=ISupport())
+        message.connection.isupport.tokens['CHANTYPES'] = '#'
+
+        self.assertEqual(privmsg(message)['channel'], 'nick')
+
     def test_not_third_person(self):
         """Normal messages should not be marked as `third_person`."""
         result = self.processed_message()
@@ -182,6 +213,47 @@ class TestApplyMessageParser(TestCase):
         wrapped(client=self.client, message=self.message)
         parser.assert_called_once_with(message=self.message)
 
+    def test_cached(self):
+        """Handlers using the same parser share its result."""
+        parser = mock.Mock(return_value={'key': 'value'})
+        other_handler = mock.Mock()
+        message = ReceivedMessage(b'PRIVMSG #channel :hello')
+
+        apply_message_parser(parser)(self.handler)(self.client, message)
+        apply_message_parser(parser)(other_handler)(self.client, message)
+
+        parser.assert_called_once_with(message=message)
+        other_handler.assert_called_once_with(
+            client=self.client,
+            message=message,
+            key='value',
+        )
+
+    def test_cached_per_parser(self):
+        """Different parsers don't share results."""
+        message = ReceivedMessage(b'PRIVMSG #channel :hello')
+        other_parser = mock.Mock(return_value={'key': 'other'})
+
+        apply_message_parser(parser_taking_message)(mock.Mock())(self.client, message)
+        apply_message_parser(other_parser)(self.handler)(self.client, message)
+
+        self.handler.assert_called_once_with(
+            client=self.client,
+            message=message,
+            key='other',
+        )
+
+    def test_not_cached(self):
+        """With `cache=False`, the parser is called every time."""
+        parser = mock.Mock(return_value={})
+        message = ReceivedMessage(b'PRIVMSG #channel :hello')
+        wrapped = apply_message_parser(parser, cache=False)(self.handler)
+
+        wrapped(self.client, message)
+        wrapped(self.client, message)
+
+        self.assertEqual(parser.call_count, 2)
+
 
 def parser_taking_kwargs(client, message, **kwargs):
     return {'key': 'value'}
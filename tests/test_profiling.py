@@ -0,0 +1,84 @@
+from unittest import mock, TestCase
+
+from framewirc import filters
+from framewirc.profiling import Profiler
+
+from .utils import BlankClient, EventLoopMixin
+
+
+def handler(client, message):
+    pass
+
+
+class TestRecord(TestCase):
+    def setUp(self):
+        self.profiler = Profiler(threshold=0.1)
+
+    def test_fast(self):
+        self.profiler.record('fast', 0.01)
+        self.assertEqual(list(self.profiler.slow_calls), [])
+
+    def test_slow(self):
+        with self.assertLogs('framewirc.profiling', 'WARNING'):
+            self.profiler.record('slow', 0.2)
+
+        self.assertEqual(list(self.profiler.slow_calls), [('slow', 0.2)])
+
+
+class TestClientProfiling(TestCase):
+    def test_names_through_decorators(self):
+        """Calls are recorded under the name of the undecorated handler."""
+        profiler = mock.Mock(spec=Profiler)
+        wrapped = filters.allow('PING')(filters.deny('PONG')(handler))
+        client = BlankClient(handlers=[wrapped], profiler=profiler)
+
+        client.on_message(mock.Mock(command='PING'))
+
+        profiler.record.assert_called_once_with(
+            'tests.test_profiling.handler', mock.ANY)
+
+
+class TestLag(EventLoopMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.profiler = Profiler(lag_interval=1, lag_threshold=0.1)
+        self.profiler.start(self.loop)
+        self.addCleanup(self.profiler.stop)
+
+    def check_after(self, seconds):
+        """Check the lag as though the timer ran after `seconds`."""
+        now = self.profiler._expected - self.profiler.lag_interval + seconds
+        with mock.patch.object(self.loop, 'time', return_value=now):
+            self.profiler._check_lag()
+
+    def test_no_lag(self):
+        self.check_after(1.01)
+
+        self.assertEqual(list(self.profiler.lag_spikes), [])
+        self.assertAlmostEqual(self.profiler.max_lag, 0.01)
+
+    def test_lag_blames_slowest_handler(self):
+        self.profiler.record('quick', 0.01)
+        self.profiler.record('slow', 0.09)
+
+        with self.assertLogs('framewirc.profiling', 'WARNING'):
+            self.check_after(1.5)
+
+        [(lag, name)] = self.profiler.lag_spikes
+        self.assertAlmostEqual(lag, 0.5)
+        self.assertEqual(name, 'slow')
+
+    def test_blame_reset(self):
+        """Only handlers since the last check are blamed."""
+        self.profiler.record('slow', 0.09)
+        self.check_after(1)
+
+        with self.assertLogs('framewirc.profiling', 'WARNING'):
+            self.check_after(1.5)
+
+        self.assertEqual(self.profiler.lag_spikes[0][1], None)
+
+    def test_reschedules(self):
+        self.check_after(1)
+        self.assertIsNotNone(self.profiler._timer)
+        self.assertFalse(self.profiler._timer.cancelled())
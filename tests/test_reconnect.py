@@ -0,0 +1,231 @@
+import asyncio
+from unittest import mock, TestCase
+
+from framewirc import reconnect
+from framewirc.message import ReceivedMessage
+
+from .utils import BlankClient, EventLoopMixin
+
+
+class TestBackoff(TestCase):
+    def test_grows(self):
+        backoff = reconnect.Backoff(base=1, factor=2, maximum=100, random=lambda: 1)
+        self.assertEqual([backoff.delay(n) for n in range(4)], [1, 2, 4, 8])
+
+    def test_maximum(self):
+        backoff = reconnect.Backoff(base=1, factor=2, maximum=5, random=lambda: 1)
+        self.assertEqual(backoff.delay(10), 5)
+
+    def test_jitter(self):
+        backoff = reconnect.Backoff(base=1, factor=2, random=lambda: 0.5)
+        self.assertEqual(backoff.delay(3), 4)
+
+
+class TestSession(TestCase):
+    def test_join_messages(self):
+        session = reconnect.Session()
+        session.channels = {'#b': '#b', '#a': '#A'}
+        self.assertEqual(session.join_messages(), [b'JOIN #A,#b\r\n'])
+
+    def test_join_messages_split(self):
+        """Channels are spread over as few lines as will fit."""
+        session = reconnect.Session()
+        names = ['#channel{:03}'.format(n) for n in range(100)]
+        session.channels = {name: name for name in names}
+
+        messages = session.join_messages()
+
+        self.assertEqual(len(messages), 3)
+        self.assertTrue(all(len(m) <= 512 for m in messages))
+        joined = b','.join(m[len(b'JOIN '):-2] for m in messages)
+        self.assertEqual(joined.decode().split(','), names)
+
+
+class TestSupervisorSession(EventLoopMixin, TestCase):
+    """The supervisor follows what happens to us on its connection."""
+    def setUp(self):
+        super().setUp()
+        self.client = BlankClient(handlers=[], nick='meshy')
+        self.supervisor = reconnect.Supervisor(self.client, 'example.com')
+        self.supervisor._connect(self.loop)
+        self.connection = self.supervisor.connection
+        self.connection.send = mock.Mock()
+
+    def receive(self, raw_message, connection=None):
+        message = ReceivedMessage(raw_message)
+        message.connection = connection or self.connection
+        self.supervisor(self.client, message)
+
+    def test_handler_added(self):
+        self.assertIs(self.client.handlers[0], self.supervisor)
+
+    def test_channels(self):
+        self.receive(b':meshy!m@host JOIN #a')
+        self.receive(b':meshy!m@host JOIN :#b')
+        self.receive(b':other!o@host JOIN #c')
+        self.receive(b':meshy!m@host PART #a')
+        self.receive(b':op!o@host KICK #b other')
+
+        self.assertEqual(self.supervisor.session.channels, {'#b': '#b'})
+
+    def test_kicked(self):
+        self.receive(b':meshy!m@host JOIN #a')
+        self.receive(b':op!o@host KICK #a Meshy :bye')
+        self.assertEqual(self.supervisor.session.channels, {})
+
+    def test_nick(self):
+        self.receive(b':meshy!m@host NICK :meshy_')
+        self.assertEqual(self.supervisor.session.nick, 'meshy_')
+        self.assertEqual(self.connection.nick, 'meshy_')
+        self.assertEqual(self.client.nick, 'meshy')
+
+    def test_capabilities(self):
+        self.receive(b':server CAP * ACK :batch message-tags')
+        self.assertEqual(self.supervisor.session.capabilities, {'batch', 'message-tags'})
+
+    def test_other_connection(self):
+        """Messages from other networks are ignored."""
+        self.receive(b':meshy!m@host JOIN #a', connection=mock.Mock())
+        self.assertEqual(self.supervisor.session.channels, {})
+
+    def test_welcome_rejoins(self):
+        self.supervisor.session.channels = {'#a': '#a', '#b': '#b'}
+
+        self.receive(b':server 001 meshy^ :Welcome')
+
+        self.connection.send.assert_called_once_with(b'JOIN #a,#b\r\n')
+        self.assertEqual(self.supervisor.session.nick, 'meshy^')
+        self.assertFalse(self.supervisor.operational)
+
+        self.receive(b':meshy^!m@host JOIN #a')
+        self.receive(b':server 474 meshy^ #b :Cannot join channel (+b)')
+
+        self.assertTrue(self.supervisor.operational)
+        self.assertIsNotNone(self.supervisor.stats['last_time_to_operational'])
+        self.assertEqual(self.supervisor.session.channels, {'#a': '#a'})
+
+    def test_reconnect_uses_session(self):
+        """A new connection asks for the nick and capabilities we had."""
+        self.supervisor.session.nick = 'meshy^'
+        self.supervisor.session.capabilities = {'batch'}
+
+        self.supervisor._connect(self.loop)
+
+        self.assertEqual(self.supervisor.connection.nick, 'meshy^')
+        self.assertEqual(self.supervisor.connection.capabilities, ('batch',))
+        self.assertEqual(self.client.connections, [self.supervisor.connection])
+
+
+class TestSupervisorRun(EventLoopMixin, TestCase):
+    def test_reconnects(self):
+        """After the server closes the connection, the channels are rejoined."""
+        loop = self.loop
+        sessions = []
+
+        @asyncio.coroutine
+        def serve(reader, writer):
+            lines = []
+            sessions.append(lines)
+            while True:
+                line = yield from reader.readline()
+                if not line:
+                    break
+                lines.append(line)
+                if line.startswith(b'NICK'):
+                    writer.write(b':server 001 bot :Welcome\r\n')
+                if line.startswith(b'JOIN'):
+                    for channel in line.split()[1].split(b','):
+                        writer.write(b':bot!b@host JOIN ' + channel + b'\r\n')
+                    if len(sessions) == 1:
+                        writer.close()
+                        break
+
+        server = loop.run_until_complete(asyncio.start_server(serve, '127.0.0.1', 0))
+        self.addCleanup(server.close)
+        port = server.sockets[0].getsockname()[1]
+
+        client = BlankClient(handlers=[], nick='bot')
+        supervisor = reconnect.Supervisor(
+            client, '127.0.0.1',
+            backoff=reconnect.Backoff(base=0.01),
+            port=port,
+            ssl=False,
+        )
+        supervisor.session.channels = {'#a': '#a', '#b': '#b'}
+
+        @asyncio.coroutine
+        def until_reconnected():
+            task = asyncio.Task(supervisor.run())
+            while supervisor.stats['connections'] < 2 or not supervisor.operational:
+                yield from asyncio.sleep(0.01)
+            supervisor.stop()
+            yield from task
+
+        loop.run_until_complete(asyncio.wait_for(until_reconnected(), 5))
+
+        self.assertEqual(len(sessions), 2)
+        self.assertIn(b'JOIN #a,#b\r\n', sessions[1])
+        self.assertEqual(supervisor.stats['attempts'], 2)
+        self.assertIsNotNone(supervisor.stats['last_downtime'])
+
+
+class ScriptedConnection:
+    """Stands in for a Connection, doing what the next step of `script` says."""
+    def __init__(self, client, host, **kwargs):
+        self.client = client
+        self.nick = None
+
+    def send(self, message):
+        pass
+
+    @asyncio.coroutine
+    def connect(self):
+        yield from asyncio.sleep(0)
+        supervisor = self.client.handlers[0]
+        step = supervisor.script.pop(0)
+        if not supervisor.script:
+            supervisor.stop()
+        step(supervisor)
+
+
+def register(supervisor):
+    message = ReceivedMessage(b':server 001 meshy :Welcome')
+    message.connection = supervisor.connection
+    supervisor(supervisor.client, message)
+
+
+def refuse(supervisor):
+    raise ConnectionRefusedError
+
+
+def crash(supervisor):
+    raise ValueError('Separator is found, but chunk is longer than limit')
+
+
+class TestSupervisorBackoff(EventLoopMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        client = BlankClient(handlers=[], connection_class=ScriptedConnection)
+        self.backoff = mock.Mock(delay=mock.Mock(return_value=0))
+        self.supervisor = reconnect.Supervisor(
+            client, 'example.com', backoff=self.backoff)
+        # A channel that will never answer our JOIN.
+        self.supervisor.session.channels = {'#silent': '#silent'}
+
+    def run_script(self, *steps):
+        self.supervisor.script = list(steps)
+        self.loop.run_until_complete(self.supervisor.run())
+        return [c[0][0] for c in self.backoff.delay.call_args_list]
+
+    def test_reset_once_registered(self):
+        """Registering resets the backoff, even if a channel never answers."""
+        attempts = self.run_script(register, refuse, register, refuse, refuse, register)
+        self.assertEqual(attempts, [0, 1, 0, 1, 2])
+        self.assertFalse(self.supervisor.operational)
+
+    def test_survives_exceptions(self):
+        """Exceptions from handlers or the stream don't stop reconnection."""
+        with self.assertLogs('framewirc.reconnect', 'ERROR'):
+            attempts = self.run_script(register, crash, register)
+        self.assertEqual(attempts, [0, 1])
+        self.assertEqual(self.supervisor.stats['connections'], 2)
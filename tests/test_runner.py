@@ -0,0 +1,119 @@
+from unittest import mock, TestCase
+
+from framewirc import runner
+from framewirc.connection import Connection
+from framewirc.message import ReceivedMessage
+
+from .utils import BlankClient
+
+
+class TestWorker(TestCase):
+    def setUp(self):
+        self.control = mock.Mock()
+        self.worker = runner.Worker(0, self.control, lambda index: BlankClient())
+        self.connection = mock.MagicMock(spec=Connection, host='irc.example.com')
+        self.connection.send_stats = {'messages_written': 3}
+        self.worker.client.connect_to = self.fake_connect_to
+
+    def fake_connect_to(self, host, **kwargs):
+        self.worker.client.connection = self.connection
+        self.worker.client.connections.append(self.connection)
+
+    def welcome(self):
+        message = ReceivedMessage(b':irc.example.com 001 test_nick :Welcome\r\n')
+        message.connection = self.connection
+        self.worker.client.on_message(message)
+
+    def test_join_waits_for_registration(self):
+        """Channels are joined once the network has welcomed us."""
+        self.worker.do_connect('irc.example.com', {})
+        self.worker.do_join('#channel', None)
+        self.assertFalse(self.connection.send.called)
+
+        self.welcome()
+
+        self.connection.send.assert_called_once_with(b'JOIN #channel\r\n')
+
+    def test_join_when_registered(self):
+        self.worker.do_connect('irc.example.com', {})
+        self.welcome()
+        self.worker.do_join('#channel', None)
+        self.connection.send.assert_called_once_with(b'JOIN #channel\r\n')
+
+    def test_join_other_host(self):
+        """Joins for other networks are ignored."""
+        self.worker.do_connect('irc.example.com', {})
+        self.welcome()
+        self.worker.do_join('#channel', 'irc.example.org')
+        self.assertFalse(self.connection.send.called)
+
+    def test_part(self):
+        self.worker.do_connect('irc.example.com', {})
+        self.welcome()
+        self.worker.do_join('#channel', None)
+        self.worker.do_part('#channel', None)
+        self.connection.send.assert_called_with(b'PART #channel\r\n')
+        self.assertEqual(self.connection.channels, set())
+
+    def test_stats(self):
+        self.worker.do_connect('irc.example.com', {})
+        self.worker.do_join('#channel', None)
+        self.welcome()
+
+        self.worker.do_stats()
+
+        self.control.send.assert_called_once_with({
+            'worker': 0,
+            'connections': 1,
+            'channels': 1,
+            'messages': 1,
+            'messages_written': 3,
+        })
+
+    def test_on_control(self):
+        """Orders are read from the control pipe, and carried out."""
+        self.control.recv.return_value = ('connect', 'irc.example.com', {})
+        self.worker.on_control()
+        self.assertEqual(self.worker.client.connections, [self.connection])
+
+
+class TestShardedRunner(TestCase):
+    def setUp(self):
+        self.runner = runner.ShardedRunner(BlankClient, workers=2)
+        self.runner.controls = [mock.Mock(), mock.Mock()]
+
+    def test_assign_least_loaded(self):
+        """Channels go to the worker with fewest channels, and stay there."""
+        self.assertEqual(self.runner.assign('#a'), 0)
+        self.assertEqual(self.runner.assign('#b'), 1)
+        self.assertEqual(self.runner.assign('#c'), 0)
+        self.assertEqual(self.runner.assign('#a'), 0)
+
+    def test_join(self):
+        self.runner.join('#a')
+        self.runner.join('#b')
+        self.runner.controls[0].send.assert_called_once_with(('join', '#a', None))
+        self.runner.controls[1].send.assert_called_once_with(('join', '#b', None))
+
+    def test_part(self):
+        """Parted channels are forgotten."""
+        self.runner.join('#a')
+        self.runner.part('#a')
+        self.runner.controls[0].send.assert_called_with(('part', '#a', None))
+        self.assertEqual(self.runner.assignments, {})
+
+    def test_connect_all(self):
+        self.runner.connect('irc.example.com', port=6667)
+        expected = ('connect', 'irc.example.com', {'port': 6667})
+        for control in self.runner.controls:
+            control.send.assert_called_once_with(expected)
+
+    def test_stats(self):
+        """Stats are gathered from every worker, and totalled."""
+        self.runner.controls[0].recv.return_value = {'worker': 0, 'messages': 2}
+        self.runner.controls[1].recv.return_value = {'worker': 1, 'messages': 3}
+
+        stats = self.runner.stats()
+
+        self.assertEqual(stats['total'], {'messages': 5})
+        self.assertEqual(len(stats['workers']), 2)
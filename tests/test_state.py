@@ -0,0 +1,208 @@
+from unittest import mock, TestCase
+
+from framewirc.batch import Batch
+from framewirc.filters import get_command_filter
+from framewirc.isupport import ISupport
+from framewirc.message import ReceivedMessage
+from framewirc.state import StateTracker
+
+from .utils import BlankClient, mock_connection
+
+
+class TestStateTracker(TestCase):
+    def setUp(self):
+        self.client = BlankClient(nick='meshy')
+        self.client.connection = mock_connection()
+        self.tracker = StateTracker()
+
+    def receive(self, *lines):
+        for line in lines:
+            self.tracker(self.client, ReceivedMessage(line))
+
+    def join_channel(self):
+        self.receive(
+            b':meshy!m@host JOIN #chan',
+            b':server 353 meshy = #chan :@meshy +Bob alice',
+        )
+
+    def test_command_filter(self):
+        """Only membership changes are sent to the tracker."""
+        command_filter = get_command_filter(self.tracker)
+        self.assertTrue(command_filter.accepts('JOIN'))
+        self.assertFalse(command_filter.accepts('PRIVMSG'))
+
+    def test_names(self):
+        self.join_channel()
+
+        channel = self.tracker.channel('#CHAN')
+        self.assertEqual(set(channel.users), {'meshy', 'bob', 'alice'})
+        self.assertEqual(channel.prefixes, {'meshy': '@', 'bob': '+'})
+        self.assertEqual(self.tracker.user('bob').nick, 'Bob')
+
+    def test_names_unknown_channel(self):
+        self.receive(b':server 353 meshy = #other :bob')
+        self.assertEqual(self.tracker.users, {})
+
+    def test_join(self):
+        self.join_channel()
+        self.receive(b':carol!c@example.com JOIN :#chan')
+
+        carol = self.tracker.user('carol')
+        self.assertEqual((carol.ident, carol.host), ('c', 'example.com'))
+        self.assertTrue(self.tracker.is_on('Carol', '#chan'))
+
+    def test_join_with_connection_nick(self):
+        """Our own joins are spotted by our nick on the connection."""
+        self.client.connection.nick = 'meshy^'
+        self.receive(b':meshy^!m@host JOIN #chan')
+        self.assertTrue(self.tracker.is_on('meshy^', '#chan'))
+
+    def test_rejoin(self):
+        """Joining a channel again forgets who was in it before."""
+        self.join_channel()
+        self.receive(b':meshy!m@host JOIN #chan')
+
+        self.assertEqual(set(self.tracker.channel('#chan').users), {'meshy'})
+        self.assertIsNone(self.tracker.user('bob'))
+
+    def test_shared_user(self):
+        """A user in many channels is stored once."""
+        self.join_channel()
+        self.receive(
+            b':meshy!m@host JOIN #other',
+            b':bob!b@host JOIN #other',
+        )
+
+        bob = self.tracker.user('bob')
+        self.assertIs(self.tracker.channel('#other').users['bob'], bob)
+        self.assertIs(self.tracker.channel('#chan').users['bob'], bob)
+        self.assertEqual(len(bob.channels), 2)
+
+    def test_interned_nicks(self):
+        self.join_channel()
+        self.receive(b':meshy!m@host JOIN #other', b':alice!a@host JOIN #other')
+
+        keys = [
+            next(k for k in channel.users if k == 'alice')
+            for channel in self.tracker.channels.values()
+        ]
+        self.assertIs(keys[0], keys[1])
+
+    def test_part(self):
+        self.join_channel()
+        self.receive(b':alice!a@host PART #chan :bye')
+
+        self.assertFalse(self.tracker.is_on('alice', '#chan'))
+        self.assertIsNone(self.tracker.user('alice'))
+
+    def test_part_self(self):
+        """Leaving a channel forgets everyone we only knew from it."""
+        self.join_channel()
+        self.receive(b':meshy!m@host PART #chan')
+
+        self.assertIsNone(self.tracker.channel('#chan'))
+        self.assertEqual(self.tracker.users, {})
+
+    def test_kick(self):
+        self.join_channel()
+        self.receive(b':meshy!m@host KICK #chan Bob :spam')
+
+        self.assertFalse(self.tracker.is_on('bob', '#chan'))
+        self.assertTrue(self.tracker.is_on('alice', '#chan'))
+
+    def test_quit(self):
+        self.join_channel()
+        self.receive(
+            b':meshy!m@host JOIN #other',
+            b':bob!b@host JOIN #other',
+            b':bob!b@host QUIT :gone',
+        )
+
+        self.assertIsNone(self.tracker.user('bob'))
+        self.assertFalse(self.tracker.is_on('bob', '#chan'))
+        self.assertFalse(self.tracker.is_on('bob', '#other'))
+
+    def test_nick(self):
+        self.join_channel()
+        self.receive(b':Bob!b@host NICK :Robert')
+
+        channel = self.tracker.channel('#chan')
+        self.assertEqual(channel.users['robert'].nick, 'Robert')
+        self.assertEqual(channel.prefixes, {'meshy': '@', 'robert': '+'})
+        self.assertIsNone(self.tracker.user('bob'))
+
+    def test_batch(self):
+        """A netsplit batch is applied all at once."""
+        self.join_channel()
+        netsplit = Batch('abc', 'netsplit')
+        netsplit.messages = [
+            ReceivedMessage(b':Bob!b@host QUIT :a.hub b.leaf'),
+            ReceivedMessage(b':alice!a@host QUIT :a.hub b.leaf'),
+        ]
+
+        self.tracker.handle_batch(self.client, netsplit)
+
+        self.assertEqual(set(self.tracker.users), {'meshy'})
+
+    def test_two_connections(self):
+        """Each tracker follows its own network."""
+        first, second = mock_connection(), mock_connection()
+        second.nick = 'meshy^'
+        trackers = [StateTracker(connection=first), StateTracker(connection=second)]
+        lines = [
+            (first, b':meshy!m@host JOIN #python'),
+            (first, b':bob!b@one.example.com JOIN #python'),
+            (second, b':meshy^!m@host JOIN #python'),
+            (second, b':bob!b@two.example.com JOIN #python'),
+            (second, b':carol!c@host JOIN #python'),
+        ]
+        for connection, line in lines:
+            message = ReceivedMessage(line)
+            message.connection = self.client.connection = connection
+            for tracker in trackers:
+                tracker(self.client, message)
+
+        first_tracker, second_tracker = trackers
+        self.assertEqual(set(first_tracker.channel('#python').users), {'meshy', 'bob'})
+        self.assertEqual(first_tracker.user('bob').host, 'one.example.com')
+        self.assertEqual(
+            set(second_tracker.channel('#python').users), {'meshy^', 'bob', 'carol'})
+        self.assertEqual(second_tracker.user('bob').host, 'two.example.com')
+
+    def test_first_connection_followed(self):
+        """Without a connection, the first one heard from is followed."""
+        first, second = mock_connection(), mock_connection()
+        for connection, line in ((first, b':meshy!m@host JOIN #a'),
+                                 (second, b':meshy!m@host JOIN #b')):
+            message = ReceivedMessage(line)
+            message.connection = connection
+            self.tracker(self.client, message)
+
+        self.assertIs(self.tracker.connection, first)
+        self.assertEqual(set(self.tracker.channels), {'#a'})
+
+    def test_isupport_casemapping(self):
+        """The server's CASEMAPPING is used."""
+        message = ReceivedMessage(b':server 005 meshy CASEMAPPING=ascii :are supported')
+        message.connection = mock.Mock(isupport=ISupport())
+        message.connection.isupport.update(message)
+
+        self.tracker(self.client, message)
+
+        self.assertEqual(self.tracker.casemapping, 'ascii')
+        self.assertNotEqual(self.tracker.fold('[A]'), self.tracker.fold('{a}'))
+
+    def test_casemapping(self):
+        """rfc1459 treats []\\~ as the upper case of {}|^."""
+        self.join_channel()
+        self.receive(b':[bob]!b@host JOIN #chan')
+        self.assertTrue(self.tracker.is_on('{BOB}', '#chan'))
+
+    def test_memory_usage(self):
+        self.join_channel()
+        usage = self.tracker.memory_usage()
+
+        self.assertEqual(usage['channels'], 1)
+        self.assertEqual(usage['users'], 3)
+        self.assertEqual(usage['memberships'], 3)
+        self.assertGreater(usage['bytes'], 0)
@@ -1,7 +1,14 @@
-from unittest import TestCase
+from unittest import mock, TestCase
 
 from framewirc import exceptions
-from framewirc.utils import chunk_message, RequiredAttributesMixin, to_bytes, to_unicode
+from framewirc.utils import (
+    chunk_message,
+    EncodingCache,
+    LRUCache,
+    RequiredAttributesMixin,
+    to_bytes,
+    to_unicode,
+)
 
 
 class TestToUnicode(TestCase):
@@ -34,6 +41,11 @@ class TestToUnicode(TestCase):
         result = to_unicode(text)
         self.assertEqual(result, expected)
 
+    def test_encodings_set(self):
+        """The preferred encodings may be any iterable."""
+        result = to_unicode(b'abc', encodings={'utf8', 'latin-1'})
+        self.assertEqual(result, 'abc')
+
     def test_not_bytes_or_string(self):
         with self.assertRaises(AttributeError):
             to_unicode(None)
@@ -68,6 +80,83 @@ class TestToUnicode(TestCase):
         self.assertEqual(result, expected)
 
 
+class TestLRUCache(TestCase):
+    def test_get(self):
+        cache = LRUCache()
+        cache['key'] = 'value'
+        self.assertEqual(cache.get('key'), 'value')
+        self.assertEqual(cache.hits, 1)
+
+    def test_miss(self):
+        cache = LRUCache()
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(cache.misses, 1)
+
+    def test_eviction(self):
+        """The least recently used key is evicted past maxsize."""
+        cache = LRUCache(maxsize=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache.get('a')
+        cache['c'] = 3
+
+        self.assertNotIn('b', cache)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_stats(self):
+        cache = LRUCache(maxsize=2)
+        cache['a'] = 1
+        cache.get('a')
+        cache.get('b')
+        expected = {'evictions': 0, 'hits': 1, 'maxsize': 2, 'misses': 1, 'size': 1}
+        self.assertEqual(cache.stats(), expected)
+
+
+class TestEncodingCache(TestCase):
+    def setUp(self):
+        self.cache = EncodingCache()
+
+    def test_already_unicode(self):
+        text = 'тнιѕ ιѕ αℓяєα∂у υηι¢σ∂є'
+        self.assertEqual(self.cache.to_unicode('nick', text), text)
+
+    def test_preferred_not_remembered(self):
+        """Text in the preferred encoding takes up no space in the cache."""
+        result = self.cache.to_unicode('nick', b"Rhoi'r ffidil yn y t\xc3\xb4")
+        self.assertEqual(result, "Rhoi'r ffidil yn y tô")
+        self.assertEqual(len(self.cache), 0)
+
+    def test_guess_remembered(self):
+        """Guessed encodings are remembered, and used in place of guessing."""
+        text = b'Miko\xb3aj Kopernik'
+        with mock.patch('framewirc.utils.cchardet.detect') as detect:
+            detect.return_value = {'encoding': 'windows-1250'}
+            self.cache.to_unicode('nick', text)
+            result = self.cache.to_unicode('nick', text)
+
+        self.assertEqual(result, 'Mikołaj Kopernik')
+        self.assertEqual(detect.call_count, 1)
+        self.assertEqual(self.cache.get('nick'), 'windows-1250')
+
+    def test_preferred_tried_first(self):
+        """A sender with a remembered guess can go back to the preferred encoding."""
+        self.cache['nick'] = 'latin-1'
+        result = self.cache.to_unicode('nick', b"Rhoi'r ffidil yn y t\xc3\xb4")
+        self.assertEqual(result, "Rhoi'r ffidil yn y tô")
+        self.assertEqual(self.cache.hits, 0)
+
+    def test_remembered_encoding_fails(self):
+        """If the remembered encoding fails, a new guess is made."""
+        self.cache['nick'] = 'ascii'
+        with mock.patch('framewirc.utils.cchardet.detect') as detect:
+            detect.return_value = {'encoding': 'windows-1250'}
+            result = self.cache.to_unicode('nick', b'Miko\xb3aj Kopernik')
+
+        self.assertEqual(result, 'Mikołaj Kopernik')
+        self.assertEqual(self.cache.get('nick'), 'windows-1250')
+
+
 class TestToBytes(TestCase):
     def test_unicode(self):
         text = 'ಠ_ಠ'
@@ -141,6 +230,25 @@ class TestChunkMessage(TestCase):
         messages = chunk_message(msg, max_length=20)
         self.assertEqual(messages, expected)
 
+    def test_exact_length_word(self):
+        """A word that exactly fits is not split."""
+        messages = chunk_message('a' * 20, max_length=20)
+        self.assertEqual(messages, [b'a' * 20])
+
+    def test_split_on_overflowing_space(self):
+        """A space that would not fit is still a good place to split."""
+        messages = chunk_message('a' * 20 + ' b', max_length=20)
+        self.assertEqual(messages, [b'a' * 20, b'b'])
+
+    def test_long_mixed_scripts(self):
+        """Long pastes in mixed scripts split on characters, not bytes."""
+        msg = 'ab失敗ü\U0001F600' * 1000
+        messages = chunk_message(msg, max_length=20)
+        self.assertEqual(b''.join(messages), to_bytes(msg))
+        for message in messages:
+            self.assertLessEqual(len(message), 20)
+            message.decode()  # Would raise if a char had been split.
+
 
 class TestRequiredAttributesMixin(TestCase):
     """Tests for RequiredAttributesMixin"""
@@ -1,4 +1,9 @@
+import asyncio
+from unittest import mock
+
 from framewirc.client import Client
+from framewirc.connection import Connection
+from framewirc.isupport import ISupport
 
 
 class BlankClient(Client):
@@ -6,3 +11,21 @@ class BlankClient(Client):
     handlers = []
     nick = 'test_nick'
     real_name = 'Test User'
+
+
+def mock_connection():
+    """A mock Connection, with the attributes that are set by `__init__`."""
+    connection = mock.MagicMock(spec=Connection)
+    connection.isupport = ISupport()
+    connection.nick = None
+    return connection
+
+
+class EventLoopMixin:
+    """Give each test a fresh event loop, set as the current loop."""
+    def setUp(self):
+        super().setUp()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(self.loop.close)
+        self.addCleanup(asyncio.set_event_loop, None)